@@ -0,0 +1,71 @@
+"""job hashvals
+
+Revision ID: 4f1c2d9e8a6b
+Revises: 92b7fe8c937b
+Create Date: 2026-10-18 10:12:41.318404
+
+"""
+import json
+import re
+from ipaddress import ip_address, IPv4Address, IPv6Address
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '4f1c2d9e8a6b'
+down_revision = '92b7fe8c937b'
+branch_labels = None
+depends_on = None
+
+
+# frozen copy of heatmap hashval algorithm at the time of the migration
+SERVICE_TARGET_PATTERN = re.compile(
+    r'^(?P<proto>tcp|udp)://(?P<host>[0-9\.]{7,15}|[0-9a-zA-Z\.\-]{1,256}|\[[0-9a-fA-F:]{3,45}\]|\[[0-9a-zA-Z\.\-]{1,256}\]):(?P<port>[0-9]+)$'
+)
+SIXENUM_TARGET_PATTERN = re.compile(r'sixenum://(?P<scan6dst>[0-9a-fA-F:]{3,45}(\-[0-9a-fA-F]{1,4})?)')
+HASHVAL_IPV4_MASK = ((1 << 32) - 1) ^ ((1 << 8) - 1)
+HASHVAL_IPV6_MASK = ((1 << 128) - 1) ^ ((1 << 80) - 1)
+
+
+def hashval(value):
+    """computes rate-limit heatmap hash value"""
+
+    if mtmp := SERVICE_TARGET_PATTERN.match(value):
+        value = mtmp.group('host')
+        if (value[0] == '[') and (value[-1] == ']'):
+            value = value[1:-1]
+
+    if mtmp := SIXENUM_TARGET_PATTERN.match(value):
+        value = mtmp.group('scan6dst').split('-')[0]
+
+    try:
+        addr = ip_address(value)
+    except ValueError:
+        return value
+
+    if addr.version == 4:
+        return f'{IPv4Address(int(addr) & HASHVAL_IPV4_MASK)}/24'
+    return f'{IPv6Address(int(addr) & HASHVAL_IPV6_MASK)}/48'
+
+
+def upgrade():
+    op.add_column('job', sa.Column('hashvals', postgresql.ARRAY(sa.String(), dimensions=1)))
+
+    # account hashvals of running jobs, completed jobs are not present in heatmap
+    job = sa.table('job', sa.column('id'), sa.column('assignment'), sa.column('retval'), sa.column('hashvals', postgresql.ARRAY(sa.String())))
+    conn = op.get_bind()
+    op.execute(job.update().values(hashvals=[]))
+    running = sa.select(job.c.id, job.c.assignment).where(job.c.retval == None)  # noqa: E711  pylint: disable=singleton-comparison
+    rows = [(job_id, list(map(hashval, json.loads(assignment)['targets']))) for job_id, assignment in conn.execute(running).all()]
+    if rows:
+        data = sa.values(sa.column('id', sa.String), sa.column('hashvals', postgresql.ARRAY(sa.String)), name='data').data(rows)
+        conn.execute(job.update().where(job.c.id == data.c.id).values(hashvals=data.c.hashvals))
+
+    op.alter_column('job', 'hashvals', nullable=False)
+
+
+def downgrade():
+    op.drop_column('job', 'hashvals')
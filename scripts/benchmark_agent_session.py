@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+agent http client micro-benchmark, compares per-request connections with
+agent's persistent session against local stand-in server
+
+usage: PYTHONPATH='.' python3 scripts/benchmark_agent_session.py [--count COUNT]
+"""
+
+import json
+from argparse import ArgumentParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+from time import perf_counter
+
+import requests
+
+from sner.agent.core import DEFAULT_CONFIG, ServerableAgent
+
+
+class StandinHandler(BaseHTTPRequestHandler):
+    """stand-in server answering nowork to any request"""
+
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        """handle post"""
+
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        body = json.dumps({}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        """silence request logging"""
+
+
+def measure(label, server, func, count):
+    """run and report single benchmark"""
+
+    server.connections = 0
+    start = perf_counter()
+    for _ in range(count):
+        func()
+    elapsed = perf_counter() - start
+    print(f'{label:10} {elapsed:8.3f}s {count/elapsed:10.0f} requests/s {server.connections:8} connections')
+    return elapsed
+
+
+def main():
+    """main"""
+
+    parser = ArgumentParser()
+    parser.add_argument('--count', type=int, default=2000)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StandinHandler)
+    server.daemon_threads = True
+    server.connections = 0
+    Thread(target=server.serve_forever, daemon=True).start()
+
+    url = f'http://127.0.0.1:{server.server_address[1]}'
+    agent = ServerableAgent({**DEFAULT_CONFIG, 'SERVER': url, 'APIKEY': 'dummy'})
+    data = {'queue': 'benchmark'}
+
+    legacy_time = measure(
+        'legacy',
+        server,
+        lambda: requests.post(agent.get_assignment_url, json=data, headers={'X-API-KEY': agent.apikey}, timeout=agent.net_timeout),
+        args.count
+    )
+    current_time = measure('session', server, lambda: agent.call_api(agent.get_assignment_url, data), args.count)
+
+    print(f'speedup    {legacy_time/current_time:8.2f}x')
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+scheduler hashval micro-benchmark, compares current hashval engine with the
+original implementation on mixed ipv4, ipv6, service and sixenum targets
+
+usage: PYTHONPATH='.' python3 scripts/benchmark_hashval.py [--count COUNT]
+"""
+
+import re
+from argparse import ArgumentParser
+from ipaddress import ip_address, ip_network, IPv4Address, IPv6Address
+from random import randint, seed
+from time import perf_counter
+
+from sner.agent.modules import SERVICE_TARGET_REGEXP
+from sner.plugin.six_enum_discover.agent import SIXENUM_TARGET_REGEXP
+from sner.server.scheduler.core import SchedulerService
+
+
+def legacy_hashval(value):
+    """original hashval implementation"""
+
+    if mtmp := re.match(SERVICE_TARGET_REGEXP, value):
+        value = mtmp.group('host')
+        if (value[0] == '[') and (value[-1] == ']'):
+            value = value[1:-1]
+
+    if mtmp := re.match(SIXENUM_TARGET_REGEXP, value):
+        value = mtmp.group('scan6dst').split('-')[0]
+
+    try:
+        addr = ip_address(value)
+        if isinstance(addr, IPv4Address):
+            return str(ip_network(f'{ip_address(value)}/24', strict=False))
+        if isinstance(addr, IPv6Address):
+            return str(ip_network(f'{ip_address(value)}/48', strict=False))
+    except ValueError:
+        pass
+
+    return value
+
+
+def generate_targets(count):
+    """generate mixed targets dataset"""
+
+    generators = [
+        lambda: str(IPv4Address(randint(0, 2**32-1))),
+        lambda: str(IPv6Address(randint(0, 2**128-1))),
+        lambda: f'tcp://{IPv4Address(randint(0, 2**32-1))}:{randint(1, 65535)}',
+        lambda: f'udp://[{IPv6Address(randint(0, 2**128-1))}]:{randint(1, 65535)}',
+        lambda: f'tcp://host{randint(0, 1000)}.example.com:443',
+        lambda: f'sixenum://{IPv6Address(randint(0, 2**128-1) & ~0xffff)}-ffff'.replace('::-', '::0-'),
+    ]
+    return [generators[idx % len(generators)]() for idx in range(count)]
+
+
+def measure(label, func, targets):
+    """run and report single benchmark"""
+
+    start = perf_counter()
+    result = func(targets)
+    elapsed = perf_counter() - start
+    print(f'{label:10} {elapsed:8.3f}s {len(targets)/elapsed:12.0f} targets/s')
+    return result, elapsed
+
+
+def main():
+    """main"""
+
+    parser = ArgumentParser()
+    parser.add_argument('--count', type=int, default=1000000)
+    args = parser.parse_args()
+
+    seed(0)
+    targets = generate_targets(args.count)
+
+    legacy, legacy_time = measure('legacy', lambda x: list(map(legacy_hashval, x)), targets)
+    current, current_time = measure('current', SchedulerService.hashvals, targets)
+
+    print(f'speedup    {legacy_time/current_time:8.2f}x')
+    if legacy != current:
+        raise RuntimeError('hashval implementations differ')
+
+
+if __name__ == '__main__':
+    main()
@@ -10,21 +10,28 @@ import logging.config
 import os
 import shutil
 import signal
+import sys
+import zlib
 from abc import ABC, abstractmethod
 from argparse import ArgumentParser
 from base64 import b64encode
 from contextlib import contextmanager
-from pathlib import Path
-from time import sleep
+from http import HTTPStatus
+from multiprocessing import Process
+from queue import Empty, Queue
+from threading import Thread
+from time import monotonic, sleep
 from uuid import uuid4
-from zipfile import ZipFile, ZIP_DEFLATED
 
 import marshmallow
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 from sner.server.api.schema import JobAssignmentSchema
-from sner.lib import load_yaml, TerminateContextMixin
-from sner.agent.modules import load_agent_plugins, REGISTERED_MODULES
+from sner.lib import file_sha256, load_yaml, TerminateContextMixin
+from sner.agent.modules import load_agent_plugins, OutputSink, REGISTERED_MODULES
+from sner.server.parser import dump_preparsed, load_parser_plugins, PREPARSED_FILENAME, REGISTERED_PARSERS
 from sner.version import __version__
 
 
@@ -35,8 +42,16 @@ DEFAULT_CONFIG = {
     'QUEUE': None,
     'CAPS': None,
     'BACKOFF_TIME': 5.0,
+    'ASSIGN_WAIT': 0,
     'NET_TIMEOUT': 300,
-    'ONESHOT': False
+    'OUTPUT_COMPRESSLEVEL': 6,
+    'PREPARSE': False,
+    'POOL_SIZE': 2,
+    'RETRIES': 3,
+    'UPLOAD_GZIP': False,
+    'ONESHOT': False,
+    'SLOTS': 1,
+    'PREFETCH': 0
 }
 
 
@@ -78,22 +93,20 @@ def config_from_args(args):
     """pull config variables from parsed args/generic object"""
 
     config = {}
-    for item in ['server', 'apikey', 'queue', 'caps', 'oneshot']:
+    for item in ['server', 'apikey', 'queue', 'caps', 'oneshot', 'slots', 'prefetch']:
         if getattr(args, item) is not None:
             config[item.upper()] = getattr(args, item)
     return config
 
 
-def zipdir(path, zipto):
-    """pack directory to in zipfile"""
+def gzip_stream(fileobj, chunk_size=1024*1024):
+    """yield gzip compressed file contents"""
 
-    with open(zipto, 'wb', 0o600) as output_file:
-        with ZipFile(output_file, 'w', ZIP_DEFLATED) as output_zip:
-            for root, _dirs, files in os.walk(path):
-                for fname in files:
-                    filepath = os.path.join(root, fname)
-                    arcname = os.path.join(*(filepath.split(os.path.sep)[1:]))
-                    output_zip.write(filepath, arcname)
+    compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16)
+    while chunk := fileobj.read(chunk_size):
+        if data := compressor.compress(chunk):
+            yield data
+    yield compressor.flush()
 
 
 class AgentBase(ABC, TerminateContextMixin):
@@ -104,6 +117,8 @@ class AgentBase(ABC, TerminateContextMixin):
         self.module_instance = None
         self.original_signal_handlers = {}
         self.loop = None
+        self.output_compresslevel = DEFAULT_CONFIG['OUTPUT_COMPRESSLEVEL']
+        self.preparse = DEFAULT_CONFIG['PREPARSE']
 
         load_agent_plugins()
 
@@ -125,28 +140,51 @@ class AgentBase(ABC, TerminateContextMixin):
         jobdir = assignment['id']
         oldcwd = os.getcwd()
         os.makedirs(jobdir, mode=0o700)
-        os.chdir(jobdir)
 
-        try:
-            self.module_instance = REGISTERED_MODULES[assignment['config']['module']]()
-            retval = self.module_instance.run(assignment)
-        except Exception as exc:  # pylint: disable=broad-except ; modules can raise variety of exceptions, but agent must continue
-            self.log.exception(exc)
-            retval = 1
-        finally:
-            self.module_instance = None
-
-        os.chdir(oldcwd)
-        zipdir(jobdir, f'{jobdir}.zip')
+        with OutputSink(os.path.abspath(f'{jobdir}.zip'), self.output_compresslevel) as sink:
+            os.chdir(jobdir)
+            try:
+                self.module_instance = REGISTERED_MODULES[assignment['config']['module']]()
+                self.module_instance.sink = sink
+                retval = self.module_instance.run(assignment)
+            except Exception as exc:  # pylint: disable=broad-except ; modules can raise variety of exceptions, but agent must continue
+                self.log.exception(exc)
+                retval = 1
+            finally:
+                self.module_instance = None
+            os.chdir(oldcwd)
+
+            # pack files produced by external tools. tools write their own output
+            # files and zip archive allows single writing handle at a time, so the
+            # output of (concurrent) commands cannot be streamed into the sink
+            sink.write_dir(jobdir, remove=True)
+
+            if self.preparse and (retval == 0):
+                self.preparse_output(assignment['config']['module'], sink)
         shutil.rmtree(jobdir)
 
         self.log.info('process_assignment finished, retval=%d', retval)
         return retval
 
+    def preparse_output(self, module, sink):
+        """parse output with server parser, parsed items are shipped along with the raw output"""
+
+        if not REGISTERED_PARSERS:
+            load_parser_plugins()
+
+        try:
+            pidb = REGISTERED_PARSERS[module].parse_archive(sink)
+            sink.write(PREPARSED_FILENAME, dump_preparsed(module, pidb))
+        except Exception as exc:  # pylint: disable=broad-except ; parsers can raise variety of exceptions, server will parse raw output
+            self.log.warning('preparse_output failed, %s', exc)
+
 
 class ServerableAgent(AgentBase):  # pylint: disable=too-many-instance-attributes
     """agent to fetch and execute assignments from central job server"""
 
+    PIPELINE_WAIT = 0.1
+    RETRY_BACKOFF = 0.5
+
     def __init__(self, config):
         super().__init__()
 
@@ -156,23 +194,53 @@ class ServerableAgent(AgentBase):  # pylint: disable=too-many-instance-attribute
         self.caps = config['CAPS']
         self.backoff_time = config['BACKOFF_TIME']
         self.net_timeout = config['NET_TIMEOUT']
+        self.output_compresslevel = config['OUTPUT_COMPRESSLEVEL']
+        self.preparse = config['PREPARSE']
+        self.pool_size = config['POOL_SIZE']
+        self.retries = config['RETRIES']
+        self.upload_gzip = config['UPLOAD_GZIP']
+        self.session_pid = None
+        self.session_instance = None
         self.oneshot = config['ONESHOT']
+        self.slots = config['SLOTS']
+        self.slot_processes = []
+        self.prefetch = config['PREFETCH']
+        self.prefetched = None
 
         self.loop = True
         self.get_assignment_url = f'{self.server}/api/v2/scheduler/job/assign'
-        self.upload_output_url = f'{self.server}/api/v2/scheduler/job/output'
+        self.upload_output_url = f'{self.server}/api/v2/scheduler/job/output/stream'
+        self.upload_output_json_url = f'{self.server}/api/v2/scheduler/job/output'
+        self.release_assignment_url = f'{self.server}/api/v2/scheduler/job/release'
+        self.upload_stream = True
 
         self.get_assignment_params = {}
         if self.queue:
             self.get_assignment_params['queue'] = self.queue
         if self.caps:
             self.get_assignment_params['caps'] = self.caps
+        if config['ASSIGN_WAIT'] and (not self.oneshot):
+            self.get_assignment_params['wait'] = config['ASSIGN_WAIT']
 
     def shutdown(self, signum=None, frame=None):  # pragma: no cover  pylint: disable=unused-argument  ; running over multiprocessing
         """wait for current assignment to finish"""
 
         self.log.info('received shutdown')
         self.loop = False
+        self.signal_slots(signal.SIGUSR1)
+
+    def terminate(self, signum=None, frame=None):  # pragma: no cover  ; running over multiprocessing
+        """terminate at once"""
+
+        super().terminate(signum, frame)
+        self.signal_slots(signal.SIGTERM)
+
+    def signal_slots(self, signum):
+        """propagate signal to all running slots"""
+
+        for proc in self.slot_processes:
+            if proc.is_alive():
+                os.kill(proc.pid, signum)
 
     @contextmanager
     def shutdown_context(self):
@@ -184,10 +252,30 @@ class ServerableAgent(AgentBase):  # pylint: disable=too-many-instance-attribute
         finally:
             signal.signal(signal.SIGUSR1, self.original_signal_handlers[signal.SIGUSR1])
 
+    @property
+    def session(self):
+        """
+        persistent http session with keep-alive connection pool. session is
+        shared by pipeline threads, slot processes must create their own.
+        only connection errors are retried, requests are not idempotent.
+        """
+
+        if self.session_pid != os.getpid():
+            adapter = HTTPAdapter(
+                pool_connections=1,
+                pool_maxsize=self.pool_size,
+                max_retries=Retry(total=self.retries, connect=self.retries, read=0, status=0, backoff_factor=self.RETRY_BACKOFF)
+            )
+            self.session_instance = requests.Session()
+            self.session_instance.mount('http://', adapter)
+            self.session_instance.mount('https://', adapter)
+            self.session_pid = os.getpid()
+        return self.session_instance
+
     def call_api(self, url, data):
         """call api"""
 
-        return requests.post(url, json=data, headers={'X-API-KEY': self.apikey}, timeout=self.net_timeout)
+        return self.session.post(url, json=data, headers={'X-API-KEY': self.apikey}, timeout=self.net_timeout)
 
     def get_assignment(self):
         """get assignment from server"""
@@ -195,7 +283,13 @@ class ServerableAgent(AgentBase):  # pylint: disable=too-many-instance-attribute
         assignment = None
         while self.loop and not assignment:
             try:
+                started = monotonic()
                 response = self.call_api(self.get_assignment_url, self.get_assignment_params)
+                if (response.status_code == HTTPStatus.UNPROCESSABLE_ENTITY) and ('wait' in self.get_assignment_params):
+                    # server does not support long-polling, fallback to plain polling
+                    self.log.info('get_assignment long-polling not supported')
+                    self.get_assignment_params.pop('wait')
+                    continue
                 response.raise_for_status()
                 assignment = response.json()
                 if not assignment:  # response-nowork
@@ -203,7 +297,8 @@ class ServerableAgent(AgentBase):  # pylint: disable=too-many-instance-attribute
                     if self.oneshot:  # pylint: disable=no-else-break  ; improves readability for following pragma
                         break
                     else:  # pragma: no cover ; running over multiprocessing
-                        sleep(self.backoff_time)
+                        # long-polled request already waited on server side
+                        sleep(max(0, self.backoff_time - (monotonic() - started)))
                         continue
                 JobAssignmentSchema().load(assignment)
             except (requests.exceptions.RequestException, json.decoder.JSONDecodeError, marshmallow.ValidationError) as exc:
@@ -216,23 +311,81 @@ class ServerableAgent(AgentBase):  # pylint: disable=too-many-instance-attribute
         self.log.info('get_assignment success, %s', assignment)
         return assignment, 0
 
-    def upload_output(self, output):
-        """upload assignment output to the server"""
+    def upload_output(self, assignment_id, retval, output_file):
+        """stream assignment output file to the server, fallback to json upload for servers without streaming support"""
 
         uploaded = False
         while not uploaded:
             try:
-                response = self.call_api(self.upload_output_url, output)
+                if self.upload_stream:
+                    response = self.upload_output_stream(assignment_id, retval, output_file)
+                    if response.status_code == HTTPStatus.NOT_FOUND:
+                        self.log.info('upload_output streaming not supported')
+                        self.upload_stream = False
+                        continue
+                else:
+                    with open(output_file, 'rb') as ftmp:
+                        output = b64encode(ftmp.read()).decode('utf-8')
+                    response = self.call_api(self.upload_output_json_url, {'id': assignment_id, 'retval': retval, 'output': output})
                 response.raise_for_status()
                 uploaded = True
             except requests.exceptions.RequestException as exc:
                 self.log.error('upload_output error, %s', exc)
                 sleep(self.backoff_time)
-        self.log.info('upload_output success, %s', output['id'])
+        self.log.info('upload_output success, %s', assignment_id)
+
+    def upload_output_stream(self, assignment_id, retval, output_file):
+        """stream assignment output file as binary request body"""
+
+        params = {'id': assignment_id, 'retval': retval, 'sha256': file_sha256(output_file)}
+        headers = {'X-API-KEY': self.apikey, 'Content-Type': 'application/octet-stream'}
+        if self.upload_gzip:
+            headers['Content-Encoding'] = 'gzip'
+
+        with open(output_file, 'rb') as ftmp:
+            data = gzip_stream(ftmp) if self.upload_gzip else ftmp
+            return self.session.post(self.upload_output_url, params=params, data=data, headers=headers, timeout=self.net_timeout)
 
     def run(self, **kwargs):
+        """run agent with configured number of execution slots"""
+
+        if self.slots > 1:
+            return self.run_slots()
+        return self.run_loop()
+
+    def run_slots(self):
+        """
+        run execution slots in separate processes, each slot runs its own
+        assignment loop in dedicated working directory. shutdown and terminate
+        requests are propagated to all slots.
+        """
+
+        with self.terminate_context(), self.shutdown_context():
+            for slot in range(self.slots):
+                proc = Process(target=self.run_slot, args=(slot,), name=f'{LOGGER_NAME}.slot-{slot}')
+                proc.start()
+                self.slot_processes.append(proc)
+            for proc in self.slot_processes:
+                proc.join()
+
+        self.log.info('exit')
+        return next((proc.exitcode for proc in self.slot_processes if proc.exitcode), 0)
+
+    def run_slot(self, slot):  # pragma: no cover  ; running over multiprocessing
+        """slot process main"""
+
+        self.slot_processes = []
+        slotdir = f'slot-{slot}'
+        os.makedirs(slotdir, mode=0o700, exist_ok=True)
+        os.chdir(slotdir)
+        sys.exit(self.run_loop())
+
+    def run_loop(self):
         """fetch, process and upload output for assignment given by server"""
 
+        if self.prefetch and not self.oneshot:
+            return self.run_pipeline()
+
         retval = 0
         with self.terminate_context(), self.shutdown_context():
             while self.loop:
@@ -242,12 +395,7 @@ class ServerableAgent(AgentBase):  # pylint: disable=too-many-instance-attribute
                     retval = self.process_assignment(assignment)
 
                     assignment_output_file = f'{assignment["id"]}.zip'
-                    output = {
-                        'id': assignment['id'],
-                        'retval': retval,
-                        'output': b64encode(Path(assignment_output_file).read_bytes()).decode('utf-8')
-                    }
-                    self.upload_output(output)
+                    self.upload_output(assignment['id'], retval, assignment_output_file)
                     os.remove(assignment_output_file)
 
                 if self.oneshot:
@@ -256,6 +404,79 @@ class ServerableAgent(AgentBase):  # pylint: disable=too-many-instance-attribute
         self.log.info('exit')
         return retval
 
+    def run_pipeline(self):
+        """
+        process assignments while next assignments are prefetched and previous
+        outputs are uploaded in background. prefetched assignments left upon
+        shutdown are released back to the server queue.
+        """
+
+        workdir = os.getcwd()
+        self.prefetched = Queue(maxsize=self.prefetch)
+        uploads = Queue()
+        fetcher = Thread(target=self.prefetch_assignments, name=f'{LOGGER_NAME}.fetcher', daemon=True)
+        uploader = Thread(target=self.upload_outputs, args=(uploads,), name=f'{LOGGER_NAME}.uploader', daemon=True)
+
+        retval = 0
+        with self.terminate_context(), self.shutdown_context():
+            fetcher.start()
+            uploader.start()
+
+            while self.loop:
+                try:
+                    assignment = self.prefetched.get(timeout=self.PIPELINE_WAIT)
+                except Empty:
+                    continue
+                retval = self.process_assignment(assignment)
+                uploads.put((assignment['id'], retval, os.path.join(workdir, f'{assignment["id"]}.zip')))
+
+            fetcher.join()
+            uploads.put(None)
+            uploader.join()
+            while not self.prefetched.empty():
+                self.release_assignment(self.prefetched.get()['id'])
+
+        self.log.info('exit')
+        return retval
+
+    def prefetch_assignments(self):
+        """fetcher thread, keeps prefetched assignments queue filled"""
+
+        while self.loop:
+            # only fetcher fills the queue, prefetch depth is never exceeded
+            if self.prefetched.full():
+                sleep(self.PIPELINE_WAIT)
+                continue
+            assignment, _ = self.get_assignment()
+            if assignment:
+                self.prefetched.put(assignment)
+
+    def upload_outputs(self, uploads):
+        """uploader thread, uploads outputs until stop mark is received"""
+
+        while (item := uploads.get()) is not None:
+            assignment_id, retval, output_file = item
+            self.upload_output(assignment_id, retval, output_file)
+            os.remove(output_file)
+
+    def release_assignment(self, assignment_id):
+        """release unprocessed assignment, server requeues its targets"""
+
+        released = False
+        while not released:
+            try:
+                response = self.call_api(self.release_assignment_url, {'id': assignment_id})
+                if response.status_code == HTTPStatus.NOT_FOUND:
+                    # server without release support, job is left running for reconcile
+                    self.log.warning('release_assignment not supported, %s', assignment_id)
+                    return
+                response.raise_for_status()
+                released = True
+            except requests.exceptions.RequestException as exc:
+                self.log.error('release_assignment error, %s', exc)
+                sleep(self.backoff_time)
+        self.log.info('release_assignment success, %s', assignment_id)
+
 
 class AssignableAgent(AgentBase):
     """agent to execute assignments supplied from command line"""
@@ -294,6 +515,8 @@ def main(argv=None):
     parser.add_argument('--queue', help='specific queue selector')
     parser.add_argument('--caps', nargs='+', help='agent capabilities tags')
     parser.add_argument('--oneshot', action='store_true', help='process single assignment and exit')
+    parser.add_argument('--slots', type=int, help='number of concurrent execution slots')
+    parser.add_argument('--prefetch', type=int, help='number of assignments to prefetch while processing current one')
 
     args = parser.parse_args(argv)
     if args.debug:
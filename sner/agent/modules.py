@@ -24,12 +24,17 @@ import signal
 import shlex
 import subprocess
 from abc import ABC, abstractmethod
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from importlib import import_module
 from pathlib import Path
+from threading import Lock
+from time import monotonic, sleep
+from zipfile import ZIP_DEFLATED, ZIP_STORED
 
 from schema import Schema
 
 import sner.plugin
+from sner.lib import ZipArchive
 
 
 REGISTERED_MODULES = {}
@@ -45,6 +50,44 @@ def load_agent_plugins():
         REGISTERED_MODULES[plugin_name] = getattr(module, 'AgentModule')
 
 
+class OutputSink(ZipArchive):
+    """
+    assignment output archive, module outputs are written directly as archive
+    members. members of compresslevel 0 archive are stored without compression.
+    already written members can be read back before the archive is finished.
+    """
+
+    def __init__(self, path, compresslevel=6):
+        self.compresslevel = compresslevel
+        compression = ZIP_DEFLATED if compresslevel else ZIP_STORED
+        super().__init__(path, 'w', compression=compression, compresslevel=compresslevel or None)
+
+    def _compress_type(self, compress):
+        """get member compression type"""
+
+        return ZIP_DEFLATED if (compress and self.compresslevel) else ZIP_STORED
+
+    def write(self, arcname, data, compress=True):
+        """write str or bytes data as archive member"""
+
+        self.zipfile.writestr(arcname, data, compress_type=self._compress_type(compress))
+
+    def write_file(self, path, arcname=None, compress=True, remove=False):
+        """write file as archive member, optionaly remove the file"""
+
+        self.zipfile.write(path, arcname, compress_type=self._compress_type(compress))
+        if remove:
+            os.unlink(path)
+
+    def write_dir(self, path, remove=False):
+        """write all files from directory as archive members relative to the directory"""
+
+        for root, _dirs, files in os.walk(path):
+            for fname in files:
+                filepath = os.path.join(root, fname)
+                self.write_file(filepath, os.path.relpath(filepath, path), remove=remove)
+
+
 class ModuleBase(ABC):
     """
     Base class for agent modules.
@@ -53,41 +96,114 @@ class ModuleBase(ABC):
     CONFIG_SCHEMA = Schema({
         'module': str
     })
+    EXECUTE_MANY_WAIT = 0.1
 
     def __init__(self):
         self.log = logging.getLogger(f'sner.agent.module.{self.__class__.__name__}')
-        self.process = None
+        self.processes = set()
+        self.processes_lock = Lock()
+        self.terminated = False
+        self.sink = None
 
     @abstractmethod
     def run(self, assignment):
         """run module for assignment"""
 
-        Path('assignment.json').write_text(json.dumps(assignment), encoding='utf-8')
+        self.write_output('assignment.json', json.dumps(assignment))
         self.CONFIG_SCHEMA.validate(assignment['config'])
 
+    def write_output(self, name, data, compress=True):
+        """write output data, directly to output sink if available"""
+
+        if self.sink:
+            self.sink.write(name, data, compress)
+        elif isinstance(data, str):
+            Path(name).write_text(data, encoding='utf-8')
+        else:
+            Path(name).write_bytes(data)
+
+    def store_output(self, path, compress=True):
+        """move output file to output sink if available"""
+
+        if self.sink:
+            self.sink.write_file(str(path), compress=compress, remove=True)
+
     @abstractmethod
     def terminate(self):
         """terminate method; should terminate module immediatelly"""
 
     def _terminate(self):  # pragma: no cover  ; running over multiprocessing
-        """terminate executed command"""
+        """terminate all executed commands"""
+
+        with self.processes_lock:
+            self.terminated = True
+            processes = list(self.processes)
 
-        if self.process and (self.process.poll() is None):
-            try:
-                os.kill(self.process.pid, signal.SIGTERM)
-            except OSError as exc:
-                self.log.error(exc)
+        for process in processes:
+            if process.poll() is None:
+                try:
+                    os.kill(process.pid, signal.SIGTERM)
+                except OSError as exc:
+                    self.log.error(exc)
 
     def _execute(self, cmd, output_file='output'):
         """execute command and capture output"""
 
         cmdarg = shlex.split(cmd) if isinstance(cmd, str) else cmd
         with open(output_file, 'w', encoding='utf-8') as output_fd:
-            self.process = subprocess.Popen(cmdarg, stdin=subprocess.DEVNULL, stdout=output_fd, stderr=subprocess.STDOUT)  # noqa: E501  pylint: disable=consider-using-with
-            retval = self.process.wait()
-            self.process = None
+            process = subprocess.Popen(cmdarg, stdin=subprocess.DEVNULL, stdout=output_fd, stderr=subprocess.STDOUT)  # noqa: E501  pylint: disable=consider-using-with
+            with self.processes_lock:
+                self.processes.add(process)
+                terminated = self.terminated
+            if terminated:  # pragma: no cover  ; terminated while starting the command
+                process.terminate()
+            retval = process.wait()
+            with self.processes_lock:
+                self.processes.remove(process)
         return retval
 
+    def _execute_many(self, jobs, concurrency=1, delay=0):  # pylint: disable=too-many-locals
+        """
+        execute commands with bounded concurrency. commands for the same host
+        are never executed concurrently and consecutive ones are separated by
+        `delay` seconds. stops starting new commands upon module termination.
+
+        :param jobs: list of (host, cmd, output_file)
+        :return: list of return values in jobs order, None for commands not executed
+        :rtype: list
+        """
+
+        pending = list(enumerate(jobs))
+        running = {}
+        retvals = [None] * len(pending)
+        host_ready = {}
+
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            while (pending or running) and (not self.terminated):
+                now = monotonic()
+                busy_hosts = {host for _, host in running.values()}
+                for item in list(pending):
+                    if len(running) >= concurrency:
+                        break
+                    idx, (host, cmd, output_file) = item
+                    if (host in busy_hosts) or (host_ready.get(host, 0) > now):
+                        continue
+                    pending.remove(item)
+                    busy_hosts.add(host)
+                    running[executor.submit(self._execute, cmd, output_file)] = (idx, host)
+
+                if not running:
+                    sleep(self.EXECUTE_MANY_WAIT)
+                    continue
+
+                done, _ = wait(running, timeout=self.EXECUTE_MANY_WAIT, return_when=FIRST_COMPLETED)
+                for future in done:
+                    idx, host = running.pop(future)
+                    retvals[idx] = future.result()
+                    host_ready[host] = monotonic() + delay
+
+        return retvals
+
     def enumerate_service_targets(self, targets):
         """
         parse list of service targets, discards invalid values
@@ -3,13 +3,15 @@
 shared functions
 """
 
+import hashlib
 import os
+import re
 import signal
 from contextlib import contextmanager
+from itertools import islice
 from pathlib import Path
 from zipfile import ZipFile
 
-import magic
 import yaml
 
 
@@ -22,17 +24,70 @@ def load_yaml(filename):
     return {}
 
 
+# local file header or end of central directory (empty archive) signature
+ZIP_MAGICS = (b'PK\x03\x04', b'PK\x05\x06')
+
+
 def is_zip(path):
-    """detect if path is zip archive"""
-    return magic.detect_from_filename(path).mime_type == 'application/zip'
+    """detect if path is zip archive by magic bytes"""
+
+    with open(path, 'rb') as ftmp:
+        return ftmp.read(4) in ZIP_MAGICS
+
+
+class ZipArchive:
+    """zip archive opened once for reading of many members"""
+
+    def __init__(self, path, mode='r', **kwargs):
+        self.path = path
+        self.zipfile = ZipFile(path, mode, **kwargs)  # pylint: disable=consider-using-with
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """close archive"""
+        self.zipfile.close()
+
+    def members(self, pattern):
+        """list member names matching regexp pattern"""
+        return [name for name in self.zipfile.namelist() if re.match(pattern, name)]
+
+    def open(self, name):
+        """open member for streaming read"""
+        return self.zipfile.open(name)
+
+    def read(self, name):
+        """read member data"""
+        return self.zipfile.read(name)
 
 
 def file_from_zip(zippath, filename):
     """exctract filename data from zipfile"""
 
-    with ZipFile(zippath) as ftmp_zip:
-        with ftmp_zip.open(filename) as ftmp:
-            return ftmp.read()
+    with ZipArchive(zippath) as archive:
+        return archive.read(filename)
+
+
+def file_sha256(path, chunk_size=1024*1024):
+    """compute sha256 hexdigest of file contents"""
+
+    digest = hashlib.sha256()
+    with open(path, 'rb') as ftmp:
+        while chunk := ftmp.read(chunk_size):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def chunked(iterable, size):
+    """split iterable into lists of at most size items"""
+
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
 
 
 def format_host_address(value):
@@ -7,7 +7,7 @@ import json
 import sys
 from pprint import pprint
 
-from sner.lib import file_from_zip
+from sner.lib import ZipArchive
 from sner.server.parser import ParsedItemsDb, ParserBase
 
 
@@ -18,9 +18,16 @@ class ParserModule(ParserBase):  # pylint: disable=too-few-public-methods
     def parse_path(cls, path):
         """parse path and returns list of hosts/addresses"""
 
+        with ZipArchive(path) as archive:
+            return cls.parse_archive(archive)
+
+    @classmethod
+    def parse_archive(cls, archive):
+        """parse data from opened archive"""
+
         pidb = ParsedItemsDb()
 
-        assignment = json.loads(file_from_zip(path, 'assignment.json'))
+        assignment = json.loads(archive.read('assignment.json'))
         for target in assignment['targets']:
             pidb.upsert_host(target)
 
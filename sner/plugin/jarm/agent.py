@@ -3,9 +3,7 @@
 sner agent jarm module
 """
 
-from time import sleep
-
-from schema import Schema
+from schema import Optional, Schema
 
 from sner.agent.modules import ModuleBase
 
@@ -21,17 +19,14 @@ class AgentModule(ModuleBase):
     CONFIG_SCHEMA = Schema({
         'module': 'jarm',
         'delay': int,
+        Optional('concurrency'): int,
     })
 
-    def __init__(self):
-        super().__init__()
-        self.loop = True
-
     def run(self, assignment):
         """run the agent"""
 
         super().run(assignment)
-        ret = 0
+        jobs = []
 
         for idx, target, proto, host, port in self.enumerate_service_targets(assignment['targets']):
             if proto != 'tcp':
@@ -42,16 +37,15 @@ class AgentModule(ModuleBase):
             target_args.append(host.replace('[', '').replace(']', ''))
 
             cmd = ['jarm', '-v'] + target_args
-            ret |= self._execute(cmd, f'output-{idx}.out')
-            sleep(assignment['config']['delay'])
-
-            if not self.loop:  # pragma: no cover  ; not tested
-                break
+            jobs.append((host, cmd, f'output-{idx}.out'))
 
+        ret = 0
+        for retval in self._execute_many(jobs, assignment['config'].get('concurrency', 1), assignment['config']['delay']):
+            # command not executed due to termination counts as failure
+            ret |= 1 if retval is None else retval
         return ret
 
     def terminate(self):  # pragma: no cover  ; not tested / running over multiprocessing
         """terminate scanner if running"""
 
-        self.loop = False
         self._terminate()
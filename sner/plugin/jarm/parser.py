@@ -3,12 +3,10 @@
 parsers to import from agent outputs to storage
 """
 
-import re
 import sys
 from pprint import pprint
-from zipfile import ZipFile
 
-from sner.lib import file_from_zip
+from sner.lib import ZipArchive
 from sner.server.parser import ParsedItemsDb, ParserBase
 
 
@@ -21,12 +19,16 @@ class ParserModule(ParserBase):  # pylint: disable=too-few-public-methods
     def parse_path(cls, path):
         """parse data from path"""
 
-        pidb = ParsedItemsDb()
+        with ZipArchive(path) as archive:
+            return cls.parse_archive(archive)
 
-        with ZipFile(path) as fzip:
-            for fname in filter(lambda x: re.match(cls.ARCHIVE_PATHS, x), fzip.namelist()):
-                pidb = cls._parse_data(file_from_zip(path, fname).decode('utf-8'), pidb)
+    @classmethod
+    def parse_archive(cls, archive):
+        """parse data from opened archive"""
 
+        pidb = ParsedItemsDb()
+        for fname in archive.members(cls.ARCHIVE_PATHS):
+            pidb = cls._parse_data(archive.read(fname).decode('utf-8'), pidb)
         return pidb
 
     @staticmethod
@@ -4,9 +4,8 @@ sner agent manymap module
 """
 
 import shlex
-from time import sleep
 
-from schema import Schema
+from schema import Optional, Schema
 
 from sner.agent.modules import ModuleBase
 
@@ -23,17 +22,14 @@ class AgentModule(ModuleBase):
         'module': 'manymap',
         'args': str,
         'delay': int,
+        Optional('concurrency'): int,
     })
 
-    def __init__(self):
-        super().__init__()
-        self.loop = True
-
     def run(self, assignment):
         """run the agent"""
 
         super().run(assignment)
-        ret = 0
+        jobs = []
 
         for idx, _, proto, host, port in self.enumerate_service_targets(assignment['targets']):
             output_args = ['-oA', f'output-{idx}', '--reason']
@@ -44,16 +40,15 @@ class AgentModule(ModuleBase):
                 target_args += [host]
 
             cmd = ['nmap'] + shlex.split(assignment['config']['args']) + output_args + target_args
-            ret |= self._execute(cmd, f'output-{idx}')
-            sleep(assignment['config']['delay'])
-
-            if not self.loop:  # pragma: no cover  ; not tested
-                break
+            jobs.append((host, cmd, f'output-{idx}'))
 
+        ret = 0
+        for retval in self._execute_many(jobs, assignment['config'].get('concurrency', 1), assignment['config']['delay']):
+            # command not executed due to termination counts as failure
+            ret |= 1 if retval is None else retval
         return ret
 
     def terminate(self):  # pragma: no cover  ; not tested / running over multiprocessing
         """terminate scanner if running"""
 
-        self.loop = False
         self._terminate()
@@ -26,70 +26,91 @@ class ParserModule(ParserBase):  # pylint: disable=too-few-public-methods
 
         return cls._parse_report(NessusReportv2(path))
 
+    @classmethod
+    def parse_path_batches(cls, path, batch_size):
+        """parse path, yields parsed items for every batch_size report items"""
+
+        pidb = ParsedItemsDb()
+
+        for idx, report_item in enumerate(NessusReportv2(path), start=1):
+            cls._parse_item(report_item, pidb)
+            if idx % batch_size == 0:
+                yield pidb
+                pidb = ParsedItemsDb()
+
+        if len(pidb.hosts):
+            yield pidb
+
     @classmethod
     def _parse_report(cls, report):
-        """parses host data from report item"""
+        """parses host data from report items"""
 
         pidb = ParsedItemsDb()
 
         for report_item in report:
-            # parse host
-            host_address = report_item['host-ip']
-            host_data = {}
-
-            hostnames = set()
-            if 'host-fqdn' in report_item:
-                hostnames.add(report_item['host-fqdn'])
-            # host-rdns might contain address
-            if ('host-rdns' in report_item) and (not cls.is_addr(report_item['host-rdns'])):
-                hostnames.add(report_item['host-rdns'])
-            if hostnames:
-                host_data['hostnames'] = list(hostnames)
-                host_data['hostname'] = host_data['hostnames'][0]
-
-            if 'operating-system' in report_item:
-                host_data['os'] = report_item['operating-system']
-
-            pidb.upsert_host(host_address, **host_data)
-
-            # parse service
-            service = None
-            if report_item['port'] != 0:
-                service = pidb.upsert_service(
-                    host_address,
-                    report_item['protocol'].lower(),
-                    report_item['port'],
-                    state='open:nessus',
-                    name=report_item['svc_name'],
-                    import_time=report_item['HOST_START']
-                )
-
-            # parse vuln
-            vuln_data = {
-                'severity': str(SeverityEnum(cls.SEVERITY_MAP[report_item['severity']])),
-                'descr': f'## Synopsis\n\n{report_item["synopsis"]}\n\n'
-                         + f'## Description\n\n{report_item["description"]}\n\n'
-                         + f'## Solution\n\n{report_item["solution"]}',
-                'refs': cls._parse_refs(report_item),
-                'import_time': report_item['HOST_START'],
-            }
-            if service:
-                vuln_data['service_proto'] = service.proto
-                vuln_data['service_port'] = service.port
-
-            if 'plugin_output' in report_item:
-                raw_data = json.dumps(report_item, cls=SnerJSONEncoder)
-                vuln_data['data'] = f'## Plugin output\n\n{report_item["plugin_output"]}\n\n## Raw data\n\n{raw_data}'
-
-            pidb.upsert_vuln(
+            cls._parse_item(report_item, pidb)
+
+        return pidb
+
+    @classmethod
+    def _parse_item(cls, report_item, pidb):
+        """parses host data from report item"""
+
+        # parse host
+        host_address = report_item['host-ip']
+        host_data = {}
+
+        hostnames = set()
+        if 'host-fqdn' in report_item:
+            hostnames.add(report_item['host-fqdn'])
+        # host-rdns might contain address
+        if ('host-rdns' in report_item) and (not cls.is_addr(report_item['host-rdns'])):
+            hostnames.add(report_item['host-rdns'])
+        if hostnames:
+            host_data['hostnames'] = list(hostnames)
+            host_data['hostname'] = host_data['hostnames'][0]
+
+        if 'operating-system' in report_item:
+            host_data['os'] = report_item['operating-system']
+
+        pidb.upsert_host(host_address, **host_data)
+
+        # parse service
+        service = None
+        if report_item['port'] != 0:
+            service = pidb.upsert_service(
                 host_address,
-                report_item['plugin_name'],
-                f'nessus.{report_item["pluginID"]}',
-                via_target=report_item['host-report-name'],
-                **vuln_data
+                report_item['protocol'].lower(),
+                report_item['port'],
+                state='open:nessus',
+                name=report_item['svc_name'],
+                import_time=report_item['HOST_START']
             )
 
-        return pidb
+        # parse vuln
+        vuln_data = {
+            'severity': str(SeverityEnum(cls.SEVERITY_MAP[report_item['severity']])),
+            'descr': f'## Synopsis\n\n{report_item["synopsis"]}\n\n'
+                     + f'## Description\n\n{report_item["description"]}\n\n'
+                     + f'## Solution\n\n{report_item["solution"]}',
+            'refs': cls._parse_refs(report_item),
+            'import_time': report_item['HOST_START'],
+        }
+        if service:
+            vuln_data['service_proto'] = service.proto
+            vuln_data['service_port'] = service.port
+
+        if 'plugin_output' in report_item:
+            raw_data = json.dumps(report_item, cls=SnerJSONEncoder)
+            vuln_data['data'] = f'## Plugin output\n\n{report_item["plugin_output"]}\n\n## Raw data\n\n{raw_data}'
+
+        pidb.upsert_vuln(
+            host_address,
+            report_item['plugin_name'],
+            f'nessus.{report_item["pluginID"]}',
+            via_target=report_item['host-report-name'],
+            **vuln_data
+        )
 
     @staticmethod
     def _parse_refs(report_item):
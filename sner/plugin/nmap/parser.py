@@ -4,17 +4,17 @@ parsers to import from agent outputs to storage
 """
 
 import json
-import re
 import sys
 from datetime import datetime
-from pathlib import Path
 from pprint import pprint
 from time import time
-from zipfile import ZipFile
+from xml.etree.ElementTree import ParseError, tostring
 
-import libnmap.parser
+from defusedxml import DefusedXmlException
+from defusedxml.ElementTree import iterparse
+from libnmap.parser import NmapParser, NmapParserException
 
-from sner.lib import file_from_zip, is_zip
+from sner.lib import is_zip, ZipArchive
 from sner.server.parser import ParsedItemsDb, ParserBase
 
 
@@ -27,90 +27,123 @@ class ParserModule(ParserBase):  # pylint: disable=too-few-public-methods
     def parse_path(cls, path):
         """parse data from path"""
 
-        pidb = ParsedItemsDb()
-
         if is_zip(path):
-            with ZipFile(path) as fzip:
-                for fname in filter(lambda x: re.match(cls.ARCHIVE_PATHS, x), fzip.namelist()):
-                    pidb = cls._parse_data(file_from_zip(path, fname).decode('utf-8'), pidb)
+            with ZipArchive(path) as archive:
+                return cls.parse_archive(archive)
+
+        with open(path, 'rb') as fxml:
+            return cls._parse_stream(fxml, ParsedItemsDb())
+
+    @classmethod
+    def parse_archive(cls, archive):
+        """parse data from opened archive"""
 
-            return pidb
+        pidb = ParsedItemsDb()
+        for fname in archive.members(cls.ARCHIVE_PATHS):
+            with archive.open(fname) as fxml:
+                pidb = cls._parse_stream(fxml, pidb)
+        return pidb
 
-        return cls._parse_data(Path(path).read_text(encoding='utf-8'), pidb)
+    @classmethod
+    def _parse_stream(cls, fxml, pidb):
+        """
+        parse nmap xml from file object, top-level host elements are parsed
+        one by one and released from the tree as soon as processed. truncated
+        document raises parse error.
+        """
+
+        try:
+            depth = 0
+            root = None
+            for event, elem in iterparse(fxml, events=('start', 'end')):
+                if event == 'start':
+                    depth += 1
+                    if root is None:
+                        if elem.tag != 'nmaprun':
+                            raise NmapParserException('Wrong XML structure: not an nmap report')
+                        root = elem
+                    continue
+
+                depth -= 1
+                if (depth == 1) and (elem.tag == 'host'):
+                    cls._parse_host(NmapParser.parse(tostring(elem, encoding='unicode')), pidb)
+                    root.clear()
+        except (ParseError, DefusedXmlException) as exc:
+            # mask parser errors same way as libnmap does
+            raise NmapParserException(f'Wrong XML structure: cannot parse data: {exc}') from None
+
+        return pidb
 
     @classmethod
-    def _parse_data(cls, data, pidb):
-        """parse raw string data"""
-
-        report = libnmap.parser.NmapParser.parse_fromstring(data)
-
-        for ihost in report.hosts:
-            # metadata
-            via_target = ihost.user_target_hostname or ihost.address
-            import_time = datetime.fromtimestamp(int(ihost.starttime or time()))
-
-            # parse host
-            host_data = {}
-            if ihost.hostnames:
-                host_data['hostnames'] = list(set(ihost.hostnames))
-                if not host_data.get('hostname'):
-                    host_data['hostname'] = host_data['hostnames'][0]
-
-            for osmatch in [item for item in ihost.os_match_probabilities() if item.accuracy == 100]:
-                host_data['os'] = osmatch.name
-                pidb.upsert_note(ihost.address, 'cpe', data=json.dumps(osmatch.get_cpe()))
-
-            pidb.upsert_host(ihost.address, **host_data)
-
-            # parse host scripts
-            for iscript in ihost.scripts_results:
-                pidb.upsert_note(ihost.address, f'nmap.{iscript["id"]}', via_target=via_target, data=json.dumps(iscript), import_time=import_time)
-
-            # parse services
-            for iservice in ihost.services:
-                service_data = {
-                    'state': f'{iservice.state}:{iservice.reason}',
-                    'import_time': import_time
-                }
-                if iservice.service:
-                    service_data['name'] = iservice.service
-                if iservice.banner:
-                    service_data['info'] = iservice.banner
-                pidb.upsert_service(ihost.address, iservice.protocol, iservice.port, **service_data)
-
-                if iservice.cpelist:
-                    pidb.upsert_note(
-                        ihost.address,
-                        'cpe',
-                        iservice.protocol,
-                        iservice.port,
-                        via_target,
-                        data=json.dumps([x.cpestring for x in iservice.cpelist]),
-                        import_time=import_time
-                    )
-
-                if iservice.banner_dict:
-                    pidb.upsert_note(
-                        ihost.address,
-                        'nmap.banner_dict',
-                        iservice.protocol,
-                        iservice.port,
-                        via_target,
-                        data=json.dumps(iservice.banner_dict),
-                        import_time=import_time
-                    )
-
-                # parse service scripts
-                for iscript in iservice.scripts_results:
-                    pidb.upsert_note(
-                        ihost.address,
-                        f'nmap.{iscript["id"]}',
-                        iservice.protocol,
-                        iservice.port,
-                        via_target,
-                        data=json.dumps(iscript),
-                        import_time=import_time
-                    )
+    def _parse_host(cls, ihost, pidb):
+        """parse libnmap host object"""
+
+        # metadata
+        via_target = ihost.user_target_hostname or ihost.address
+        import_time = datetime.fromtimestamp(int(ihost.starttime or time()))
+
+        # parse host
+        host_data = {}
+        if ihost.hostnames:
+            host_data['hostnames'] = list(set(ihost.hostnames))
+            if not host_data.get('hostname'):
+                host_data['hostname'] = host_data['hostnames'][0]
+
+        for osmatch in [item for item in ihost.os_match_probabilities() if item.accuracy == 100]:
+            host_data['os'] = osmatch.name
+            pidb.upsert_note(ihost.address, 'cpe', data=json.dumps(osmatch.get_cpe()))
+
+        pidb.upsert_host(ihost.address, **host_data)
+
+        # parse host scripts
+        for iscript in ihost.scripts_results:
+            pidb.upsert_note(ihost.address, f'nmap.{iscript["id"]}', via_target=via_target, data=json.dumps(iscript), import_time=import_time)
+
+        # parse services
+        for iservice in ihost.services:
+            service_data = {
+                'state': f'{iservice.state}:{iservice.reason}',
+                'import_time': import_time
+            }
+            if iservice.service:
+                service_data['name'] = iservice.service
+            if iservice.banner:
+                service_data['info'] = iservice.banner
+            pidb.upsert_service(ihost.address, iservice.protocol, iservice.port, **service_data)
+
+            if iservice.cpelist:
+                pidb.upsert_note(
+                    ihost.address,
+                    'cpe',
+                    iservice.protocol,
+                    iservice.port,
+                    via_target,
+                    data=json.dumps([x.cpestring for x in iservice.cpelist]),
+                    import_time=import_time
+                )
+
+            if iservice.banner_dict:
+                pidb.upsert_note(
+                    ihost.address,
+                    'nmap.banner_dict',
+                    iservice.protocol,
+                    iservice.port,
+                    via_target,
+                    data=json.dumps(iservice.banner_dict),
+                    import_time=import_time
+                )
+
+            # parse service scripts
+            for iscript in iservice.scripts_results:
+                pidb.upsert_note(
+                    ihost.address,
+                    f'nmap.{iscript["id"]}',
+                    iservice.protocol,
+                    iservice.port,
+                    via_target,
+                    data=json.dumps(iscript),
+                    import_time=import_time
+                )
 
         return pidb
 
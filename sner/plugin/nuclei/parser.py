@@ -5,11 +5,10 @@ parsers to import from agent outputs to storage
 
 import json
 import logging
-from zipfile import ZipFile
 from pathlib import Path
 from urllib.parse import urlsplit
 
-from sner.lib import file_from_zip, get_nested_key, is_zip
+from sner.lib import get_nested_key, is_zip, ZipArchive
 from sner.server.parser import ParsedItemsDb, ParserBase
 from sner.server.storage.models import SeverityEnum
 from sner.server.utils import SnerJSONEncoder
@@ -26,15 +25,19 @@ class ParserModule(ParserBase):  # pylint: disable=too-few-public-methods
     def parse_path(cls, path):
         """parse data from path"""
 
-        pidb = ParsedItemsDb()
-
         if is_zip(path):
-            with ZipFile(path) as fzip:
-                for fname in filter(lambda x: 'output.json' == x, fzip.namelist()):
-                    pidb = cls._parse_data(file_from_zip(path, fname).decode('utf-8'), pidb)
+            with ZipArchive(path) as archive:
+                return cls.parse_archive(archive)
+        return cls._parse_data(Path(path).read_text(encoding='utf-8'), ParsedItemsDb())
+
+    @classmethod
+    def parse_archive(cls, archive):
+        """parse data from opened archive"""
 
-            return pidb
-        return cls._parse_data(Path(path).read_text(encoding='utf-8'), pidb)
+        pidb = ParsedItemsDb()
+        for fname in archive.members(r'output\.json$'):
+            pidb = cls._parse_data(archive.read(fname).decode('utf-8'), pidb)
+        return pidb
 
     @classmethod
     def _parse_data(cls, data, pidb):  # pylint: disable=too-many-locals
@@ -4,17 +4,122 @@ sner agent screenshot web
 """
 
 import json
+import os
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
+from queue import Queue
 from shutil import rmtree
+from threading import Lock
 from time import sleep
 from uuid import uuid4
 
-from schema import Schema
+from schema import Optional, Schema
 
 from sner.agent.modules import ModuleBase
 
 
+class BrowserPool:
+    """
+    pool of long-lived headless browsers. selenium is imported lazily, the
+    dependency is required only by agents using the pool.
+    """
+
+    def __init__(self, size, geometry, timeout):
+        self.geometry = [int(x) for x in geometry.split(',')]
+        self.timeout = timeout
+        self.drivers = Queue()
+        self.started = []
+        self.closed = False
+        self.lock = Lock()
+
+        try:
+            from selenium.common.exceptions import WebDriverException  # pylint: disable=import-outside-toplevel
+        except ImportError as exc:
+            raise RuntimeError(f'selenium not available, {exc}') from None
+
+        try:
+            for _ in range(size):
+                self.drivers.put(self.start_driver())
+        except WebDriverException as exc:
+            self.close()
+            raise RuntimeError(f'browser not available, {exc}') from None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def start_driver(self):
+        """start headless browser, browser started after pool closing is discarded"""
+
+        # pylint: disable=import-outside-toplevel
+        from selenium import webdriver
+        from selenium.common.exceptions import WebDriverException
+        from selenium.webdriver.firefox.options import Options as FirefoxOptions
+
+        if self.closed:
+            raise WebDriverException('browser pool closed')
+
+        options = FirefoxOptions()
+        options.headless = True
+        driver = webdriver.Firefox(options=options, service_log_path=os.devnull)
+        with self.lock:
+            if self.closed:
+                driver.quit()
+                raise WebDriverException('browser pool closed')
+            self.started.append(driver)
+        driver.set_window_size(*self.geometry)
+        driver.set_page_load_timeout(self.timeout)
+        return driver
+
+    def close(self):
+        """quit all browsers, no new browser is started afterwards"""
+
+        from selenium.common.exceptions import WebDriverException  # pylint: disable=import-outside-toplevel
+
+        with self.lock:
+            self.closed = True
+            drivers, self.started = self.started, []
+
+        for driver in drivers:
+            try:
+                driver.quit()
+            except WebDriverException:  # pragma: no cover  ; browser already gone
+                pass
+
+    def screenshot(self, url, path):
+        """
+        capture screenshot with pooled browser, page still loading after the
+        timeout is captured as is
+
+        :return: True on success
+        :rtype: bool
+        """
+
+        from selenium.common.exceptions import TimeoutException, WebDriverException  # pylint: disable=import-outside-toplevel
+
+        driver = self.drivers.get()
+        try:
+            try:
+                driver.get(url)
+            except TimeoutException:
+                pass
+            return driver.save_screenshot(str(path))
+        except WebDriverException:
+            # replace possibly crashed browser, failed browser is kept in the
+            # pool when new one cannot be started
+            try:
+                driver.quit()
+                driver = self.start_driver()
+            except WebDriverException:  # pragma: no cover  ; browser already gone
+                pass
+            return False
+        finally:
+            self.drivers.put(driver)
+
+
 class AgentModule(ModuleBase):
     """
     screenshot_web agent
@@ -26,49 +131,87 @@ class AgentModule(ModuleBase):
     CONFIG_SCHEMA = Schema({
         'module': 'screenshot_web',
         'delay': int,
-        'geometry': str
+        'geometry': str,
+        Optional('browsers'): int,
+        Optional('timeout'): int,
     })
+    # one-shot browser process per target by default
+    DEFAULT_BROWSERS = 0
+    DEFAULT_TIMEOUT = 60
 
     def __init__(self):
         super().__init__()
-        self.loop = False
+        self.loop = True
+        self.pool = None
+        self.results = {}
+        self.results_lock = Lock()
 
     # pylint: disable=duplicate-code
     def run(self, assignment):
         """run the agent"""
 
         super().run(assignment)
-        results = {}
-
-        for item in assignment['targets']:
-            url = item.split(' ', maxsplit=1)[-1]
-            filebase = str(uuid4())
-            screenshot_path = Path(f'{filebase}.png')
-            profile_dir = Path(f'{filebase}.profile')
-            profile_dir.mkdir()
-
-            self._execute(
-                [
-                    'timeout', '60',
-                    'firefox', '--headless', '--profile', profile_dir,
-                    '--screenshot', screenshot_path.absolute(), '--window-size', assignment['config']['geometry'],
-                    url
-                ],
-                f'{filebase}.output'
-            )
-            rmtree(f'{profile_dir}')
-            results[str(screenshot_path)] = {'target': item, 'timestamp': datetime.now().isoformat()}
-            Path('results.json').write_text(json.dumps(results), encoding='utf-8')
-
-            sleep(assignment['config']['delay'])
-
-            if not self.loop:  # pragma: no cover  ; not tested
-                break
+        config = assignment['config']
+        browsers = config.get('browsers', self.DEFAULT_BROWSERS)
+        timeout = config.get('timeout', self.DEFAULT_TIMEOUT)
+
+        if browsers:
+            try:
+                self.pool = BrowserPool(browsers, config['geometry'], timeout)
+            except RuntimeError as exc:
+                self.log.warning('browser pool not available, using one-shot screenshots, %s', exc)
+
+        if self.pool:
+            with self.pool, ThreadPoolExecutor(max_workers=browsers) as executor:
+                list(executor.map(lambda item: self.screenshot_target(item, config, timeout, self.pool), assignment['targets']))
+        else:
+            for item in assignment['targets']:
+                self.screenshot_target(item, config, timeout)
 
         return 0
 
+    def screenshot_target(self, item, config, timeout, pool=None):
+        """capture screenshot of target with browser pool, fallback to one-shot browser"""
+
+        if not self.loop:  # pragma: no cover  ; not tested
+            return
+
+        url = item.split(' ', maxsplit=1)[-1]
+        filebase = str(uuid4())
+        screenshot_path = Path(f'{filebase}.png')
+
+        if not (pool and pool.screenshot(url, screenshot_path)) and self.loop:
+            self.screenshot_oneshot(url, screenshot_path, config['geometry'], timeout)
+
+        with self.results_lock:
+            if screenshot_path.exists():
+                # png is already compressed
+                self.store_output(screenshot_path, compress=False)
+            self.results[str(screenshot_path)] = {'target': item, 'timestamp': datetime.now().isoformat()}
+            Path('results.json').write_text(json.dumps(self.results), encoding='utf-8')
+
+        sleep(config['delay'])
+
+    def screenshot_oneshot(self, url, screenshot_path, geometry, timeout):
+        """capture screenshot with one-shot browser process"""
+
+        profile_dir = Path(f'{screenshot_path.stem}.profile')
+        profile_dir.mkdir()
+        self._execute(
+            [
+                'timeout', str(timeout),
+                'firefox', '--headless', '--profile', profile_dir,
+                '--screenshot', screenshot_path.absolute(), '--window-size', geometry,
+                url
+            ],
+            f'{screenshot_path.stem}.output'
+        )
+        rmtree(f'{profile_dir}')
+
     def terminate(self):  # pragma: no cover  ; not tested / running over multiprocessing
         """terminate scanner if running"""
 
         self.loop = False
+        if self.pool:
+            self.pool.close()
         self._terminate()
@@ -11,7 +11,7 @@ from datetime import datetime
 from pprint import pprint
 
 from sner.agent.modules import SERVICE_TARGET_REGEXP
-from sner.lib import file_from_zip
+from sner.lib import ZipArchive
 from sner.server.parser import ParsedItemsDb, ParserBase
 
 
@@ -22,8 +22,16 @@ class ParserModule(ParserBase):  # pylint: disable=too-few-public-methods
     def parse_path(cls, path):
         """parse data from path"""
 
+        with ZipArchive(path) as archive:
+            return cls.parse_archive(archive)
+
+    @classmethod
+    def parse_archive(cls, archive):
+        """parse data from opened archive"""
+
         pidb = ParsedItemsDb()
-        results = json.loads(file_from_zip(path, 'results.json'))
+
+        results = json.loads(archive.read('results.json'))
         for filename, target in results.items():
             service_str, url = target['target'].split(' ', maxsplit=1)
 
@@ -34,7 +42,7 @@ class ParserModule(ParserBase):  # pylint: disable=too-few-public-methods
                     service_proto=mtmp.group('proto'),
                     service_port=mtmp.group('port'),
                     via_target=url,
-                    data=json.dumps({'url': url, 'img': b64encode(file_from_zip(path, filename)).decode()}),
+                    data=json.dumps({'url': url, 'img': b64encode(archive.read(filename)).decode()}),
                     import_time=datetime.fromisoformat(target['timestamp'])
                 )
 
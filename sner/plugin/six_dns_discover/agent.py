@@ -3,16 +3,71 @@
 sner agent ipv6 (via ipv4 enum ptr) dns discovery module
 """
 
+import asyncio
 import json
-from pathlib import Path
 from socket import AF_INET6, getaddrinfo, gethostbyaddr
-from time import sleep
+from threading import Thread
+from time import monotonic
 
-from schema import Schema
+from schema import Optional, Or, Schema
 
 from sner.agent.modules import ModuleBase
 
 
+class TokenBucket:  # pylint: disable=too-few-public-methods
+    """token bucket rate limiter, rate 0 means unlimited"""
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = monotonic()
+
+    def reserve(self):
+        """
+        reserve token
+
+        :return: time to wait until the token is available
+        :rtype: float
+        """
+
+        if not self.rate:
+            return 0
+
+        now = monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        return max(0, -self.tokens / self.rate)
+
+
+async def run_in_daemon_thread(func, *args):
+    """
+    run blocking call in daemon thread. abandoned (timed out) calls cannot be
+    interrupted, daemon thread does not hold agent process upon exit.
+    """
+
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+
+    def deliver(setter, value):
+        if not future.done():
+            setter(value)
+
+    def worker():
+        try:
+            callback = (future.set_result, func(*args))
+        except Exception as exc:  # pylint: disable=broad-except
+            callback = (future.set_exception, exc)
+        try:
+            loop.call_soon_threadsafe(deliver, *callback)
+        except RuntimeError:  # pragma: no cover  ; event loop already closed
+            pass
+
+    Thread(target=worker, daemon=True).start()
+    return await future
+
+
 class AgentModule(ModuleBase):
     """
     dns based ipv6 from ipv4 address discover
@@ -23,8 +78,13 @@ class AgentModule(ModuleBase):
 
     CONFIG_SCHEMA = Schema({
         'module': 'six_dns_discover',
-        'delay': int
+        'delay': int,
+        Optional('rate'): Or(int, float),
+        Optional('concurrency'): int,
+        Optional('timeout'): Or(int, float),
     })
+    DEFAULT_CONCURRENCY = 1
+    DEFAULT_TIMEOUT = 10
 
     def __init__(self):
         super().__init__()
@@ -36,24 +96,48 @@ class AgentModule(ModuleBase):
 
         super().run(assignment)
 
-        result = {}
-        for addr in assignment['targets']:
-            try:
-                (hostname, _, _) = gethostbyaddr(addr)
-                resolved_addrs = getaddrinfo(hostname, None, AF_INET6)
-                for _, _, _, _, sockaddr in resolved_addrs:
-                    result[sockaddr[0]] = (hostname, addr)
-            except OSError:
-                continue
-            finally:
-                sleep(assignment['config']['delay'])
-
-            if not self.loop:  # pragma: no cover  ; not tested
-                break
-
-        Path('output.json').write_text(json.dumps(result), encoding='utf-8')
+        result = asyncio.run(self.resolve_all(assignment['targets'], assignment['config']))
+        self.write_output('output.json', json.dumps(result))
         return 0
 
+    async def resolve_all(self, targets, config):
+        """
+        resolve targets with limited number of in-flight queries. query rate is
+        limited by token bucket, `delay` is used as query interval when `rate`
+        (queries per second) is not configured.
+        """
+
+        concurrency = config.get('concurrency', self.DEFAULT_CONCURRENCY)
+        timeout = config.get('timeout', self.DEFAULT_TIMEOUT)
+        rate = config.get('rate', (1 / config['delay']) if config['delay'] else 0)
+
+        semaphore = asyncio.Semaphore(concurrency)
+        bucket = TokenBucket(rate)
+        result = {}
+
+        async def resolve_target(addr):
+            async with semaphore:
+                await asyncio.sleep(bucket.reserve())
+                if not self.loop:  # pragma: no cover  ; not tested
+                    return
+                try:
+                    hostname, resolved_addrs = await asyncio.wait_for(self.resolve(addr), timeout)
+                except (OSError, asyncio.TimeoutError):
+                    return
+                for resolved_addr in resolved_addrs:
+                    result[resolved_addr] = (hostname, addr)
+
+        await asyncio.gather(*[resolve_target(addr) for addr in targets])
+        return result
+
+    @staticmethod
+    async def resolve(addr):
+        """resolve ipv4 address to ptr hostname and its ipv6 addresses"""
+
+        (hostname, _, _) = await run_in_daemon_thread(gethostbyaddr, addr)
+        resolved_addrs = await run_in_daemon_thread(getaddrinfo, hostname, None, AF_INET6)
+        return hostname, [sockaddr[0] for _, _, _, _, sockaddr in resolved_addrs]
+
     def terminate(self):  # pragma: no cover  ; not tested / running over multiprocessing
         """terminate scanner if running"""
 
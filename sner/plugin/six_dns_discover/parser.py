@@ -7,19 +7,26 @@ import json
 import sys
 from pprint import pprint
 
-from sner.lib import file_from_zip
+from sner.lib import ZipArchive
 from sner.server.parser import ParsedItemsDb, ParserBase
 
 
 class ParserModule(ParserBase):  # pylint: disable=too-few-public-methods
     """six dns parser, pulls list of hosts for discovery module"""
 
-    @staticmethod
-    def parse_path(path):
+    @classmethod
+    def parse_path(cls, path):
         """parse data from path"""
 
+        with ZipArchive(path) as archive:
+            return cls.parse_archive(archive)
+
+    @classmethod
+    def parse_archive(cls, archive):
+        """parse data from opened archive"""
+
         pidb = ParsedItemsDb()
-        data = json.loads(file_from_zip(path, 'output.json'))
+        data = json.loads(archive.read('output.json'))
 
         for addr, via in data.items():
             pidb.upsert_note(addr, 'six_dns_discover.via', data=json.dumps(via))
@@ -5,9 +5,10 @@ sner agent six enum from storage discover
 
 import re
 from ipaddress import ip_address, ip_network
+from time import monotonic
 
 from pyroute2 import NDB  # pylint: disable=no-name-in-module
-from schema import Schema
+from schema import Optional, Schema
 
 from sner.agent.modules import ModuleBase
 
@@ -15,6 +16,34 @@ from sner.agent.modules import ModuleBase
 SIXENUM_TARGET_REGEXP = r'sixenum://(?P<scan6dst>[0-9a-fA-F:]{3,45}(\-[0-9a-fA-F]{1,4})?)'
 
 
+class PrefixIndex:  # pylint: disable=too-few-public-methods
+    """interface prefixes index, longest prefix match"""
+
+    def __init__(self, records):
+        index = {}
+        for record in records:
+            network = ip_network(f'{record.address}/{record.prefixlen}', strict=False)
+            index.setdefault((network.version, network.prefixlen), {}).setdefault(int(network.network_address), record.ifname)
+        self.index = sorted(index.items(), key=lambda item: item[0][1], reverse=True)
+
+    def match(self, addr):
+        """
+        match address to the interface
+
+        :return: interface name or None
+        :rtype: str
+        """
+
+        addr = ip_address(addr)
+        for (version, prefixlen), networks in self.index:
+            if version != addr.version:
+                continue
+            hostbits = addr.max_prefixlen - prefixlen
+            if ifname := networks.get((int(addr) >> hostbits) << hostbits):
+                return ifname
+        return None
+
+
 class AgentModule(ModuleBase):
     """
     enumeration based ipv6 discover
@@ -32,25 +61,38 @@ class AgentModule(ModuleBase):
     CONFIG_SCHEMA = Schema({
         'module': 'six_enum_discover',
         'rate': int,
+        Optional('prefix_ttl'): int,
     })
+    DEFAULT_PREFIX_TTL = 300
+
+    # local prefixes cached per agent process
+    prefixes = None
+    prefixes_loaded = None
 
     def __init__(self):
         super().__init__()
         self.loop = True
 
+    @classmethod
+    def local_prefixes(cls, ttl):
+        """get local interface prefixes index, reloaded when older than ttl seconds"""
+
+        if (cls.prefixes is None) or (monotonic() - cls.prefixes_loaded >= ttl):
+            with NDB() as ndb:
+                cls.prefixes = PrefixIndex(ndb.addresses.summary())  # pylint: disable=no-member
+            cls.prefixes_loaded = monotonic()
+        return cls.prefixes
+
     @staticmethod
-    def _is_localnet(addr):
+    def _is_localnet(addr, prefixes):
         """semidetect if target is on localnet"""
 
         # loopback addres is not considered link-local, used by pytest
         if addr == '::1':
             return False, None
 
-        addr = ip_address(addr)
-        for record in NDB().addresses.summary():  # pylint: disable=no-member
-            if addr in ip_network(f'{record.address}/{record.prefixlen}', strict=False):
-                return True, record.ifname
-
+        if ifname := prefixes.match(addr):
+            return True, ifname
         return False, None  # pragma: no cover  ; no IPv6 in CI (GH Actions)
 
     def enumerate_targets(self, targets):
@@ -68,10 +110,11 @@ class AgentModule(ModuleBase):
 
         super().run(assignment)
         ret = 0
+        prefixes = self.local_prefixes(assignment['config'].get('prefix_ttl', self.DEFAULT_PREFIX_TTL))
 
         for idx, target in self.enumerate_targets(assignment['targets']):
             # detect if scan has to be performed with --dst-addr or --local-scan
-            is_localnet, iface = self._is_localnet(target.split('-')[0])
+            is_localnet, iface = self._is_localnet(target.split('-')[0], prefixes)
             args = ['--local-scan', '--print-type', 'global', '-i', iface] if is_localnet else ['--dst-addr', target]
 
             ret |= self._execute(['scan6', '--rate-limit', f'{assignment["config"]["rate"]}pps'] + args, f'output-{idx}.txt')
@@ -3,12 +3,10 @@
 parsers to import from agent outputs to storage
 """
 
-import re
 import sys
 from pprint import pprint
-from zipfile import ZipFile
 
-from sner.lib import file_from_zip
+from sner.lib import ZipArchive
 from sner.server.parser import ParsedItemsDb, ParserBase
 
 
@@ -21,13 +19,17 @@ class ParserModule(ParserBase):  # pylint: disable=too-few-public-methods
     def parse_path(cls, path):
         """parse path and returns list of hosts/addresses"""
 
-        pidb = ParsedItemsDb()
+        with ZipArchive(path) as archive:
+            return cls.parse_archive(archive)
 
-        with ZipFile(path) as fzip:
-            for fname in filter(lambda x: re.match(cls.ARCHIVE_PATHS, x), fzip.namelist()):
-                for addr in file_from_zip(path, fname).decode('utf-8').splitlines():
-                    pidb.upsert_host(addr)
+    @classmethod
+    def parse_archive(cls, archive):
+        """parse data from opened archive"""
 
+        pidb = ParsedItemsDb()
+        for fname in archive.members(cls.ARCHIVE_PATHS):
+            for addr in archive.read(fname).decode('utf-8').splitlines():
+                pidb.upsert_host(addr)
         return pidb
 
 
@@ -3,9 +3,7 @@
 sner agent testssl module
 """
 
-from time import sleep
-
-from schema import Schema
+from schema import Optional, Schema
 
 from sner.agent.modules import ModuleBase
 
@@ -21,16 +19,14 @@ class AgentModule(ModuleBase):  # pragma: cover-ignore-if-not-pytestslow
     CONFIG_SCHEMA = Schema({
         'module': 'testssl',
         'delay': int,
+        Optional('concurrency'): int,
     })
 
-    def __init__(self):
-        super().__init__()
-        self.loop = True
-
     def run(self, assignment):
         """run the agent"""
 
         super().run(assignment)
+        jobs = []
 
         for idx, target, proto, host, port in self.enumerate_service_targets(assignment['targets']):
             if proto != 'tcp':
@@ -39,16 +35,12 @@ class AgentModule(ModuleBase):  # pragma: cover-ignore-if-not-pytestslow
 
             target_args = ['--jsonfile-pretty', f'output-{idx}.json', f'{host}:{port}']
             cmd = ['testssl.sh', '--quiet', '--full', '-6', '--connect-timeout', '5', '--openssl-timeout', '5'] + target_args
-            self._execute(cmd, f'output-{idx}')
-
-            sleep(assignment['config']['delay'])
-            if not self.loop:  # pragma: no cover  ; not tested
-                break
+            jobs.append((host, cmd, f'output-{idx}'))
 
+        self._execute_many(jobs, assignment['config'].get('concurrency', 1), assignment['config']['delay'])
         return 0
 
     def terminate(self):  # pragma: no cover  ; not tested / running over multiprocessing
         """terminate scanner if running"""
 
-        self.loop = False
         self._terminate()
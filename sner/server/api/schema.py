@@ -21,6 +21,7 @@ class JobAssignArgsSchema(BaseSchema):
 
     queue = fields.String()
     caps = fields.List(fields.String)
+    wait = fields.Integer(validate=validate.Range(min=0))
 
 
 class JobAssignmentConfigSchema(BaseSchema):
@@ -61,6 +62,20 @@ class JobOutputSchema(BaseSchema):
     output = fields.String()
 
 
+class JobOutputStreamArgsSchema(BaseSchema):
+    """job output stream request args schema, output is sent as binary request body"""
+
+    id = fields.String(required=True, validate=validate.Regexp(r'^[a-f0-9\-]{36}$'))
+    retval = fields.Integer(required=True)
+    sha256 = fields.String(required=True, validate=validate.Regexp(r'^[a-f0-9]{64}$'))
+
+
+class JobReleaseSchema(BaseSchema):
+    """job release schema"""
+
+    id = fields.String(required=True, validate=validate.Regexp(r'^[a-f0-9\-]{36}$'))
+
+
 class PublicHostArgsSchema(BaseSchema):
     """public host args schema"""
 
@@ -4,10 +4,12 @@ apiv2 controller
 """
 
 import binascii
+import zlib
 from base64 import b64decode
+from gzip import BadGzipFile, GzipFile
 from http import HTTPStatus
 
-from flask import current_app, jsonify, Response
+from flask import current_app, jsonify, request, Response
 from flask_login import current_user
 from flask_smorest import abort, Blueprint, Page
 from sqlalchemy import or_
@@ -16,7 +18,7 @@ import sner.server.api.schema as api_schema
 from sner.server.api.core import get_metrics
 from sner.server.auth.core import apikey_required
 from sner.server.extensions import db
-from sner.server.scheduler.core import SchedulerService, SchedulerServiceBusyException
+from sner.server.scheduler.core import JobManager, SchedulerService, SchedulerServiceBusyException
 from sner.server.scheduler.models import Job
 from sner.server.storage.models import Host, Note, Service, Versioninfo, Vulnsearch
 from sner.server.storage.version_parser import is_in_version_range, parse as versionspec_parse
@@ -47,7 +49,8 @@ def v2_scheduler_job_assign_route(args):
         return {}  # nowork
 
     try:
-        resp = SchedulerService.job_assign(args.get('queue'), args.get('caps', []))
+        wait = min(args.get('wait', 0), current_app.config['SNER_SCHEDULER_ASSIGN_WAIT'])
+        resp = SchedulerService.job_assign(args.get('queue'), args.get('caps', []), wait)
         if 'id' in resp:
             current_app.logger.info(f'api.scheduler job assign {resp.get("id")}')
     except SchedulerServiceBusyException:
@@ -82,6 +85,63 @@ def v2_scheduler_job_output_route(args):
     return jsonify({'message': 'success'})
 
 
+@blueprint.route('/v2/scheduler/job/output/stream', methods=['POST'])
+@apikey_required('agent')
+@blueprint.arguments(api_schema.JobOutputStreamArgsSchema, location='query')
+def v2_scheduler_job_output_stream_route(args):
+    """receive output from assigned job streamed as binary request body"""
+
+    job = Job.query.filter(Job.id == args['id'], Job.retval == None).one_or_none()  # noqa: E711  pylint: disable=singleton-comparison
+    if not job:
+        # invalid/repeated requests are silently discarded, agent would delete working data
+        # on it's side as well
+        return jsonify({'message': 'discard job'})
+
+    stream = request.stream
+    if request.headers.get('Content-Encoding', '').lower() == 'gzip':
+        # decompressed only here, output size is limited during receive
+        stream = GzipFile(fileobj=stream, mode='rb')
+
+    try:
+        output = JobManager.receive_output(job, stream, args['sha256'], current_app.config['SNER_SCHEDULER_OUTPUT_MAX_SIZE'])
+    except (BadGzipFile, EOFError, zlib.error):
+        output = None
+    if not output:
+        return jsonify({'message': 'invalid request'}), HTTPStatus.BAD_REQUEST
+
+    try:
+        job_id = job.id
+        SchedulerService.job_output(job, args['retval'], output)
+    except SchedulerServiceBusyException:
+        return jsonify({'message': 'server busy'}), HTTPStatus.TOO_MANY_REQUESTS
+    finally:
+        # staged output is moved to job output upon success
+        output.unlink(missing_ok=True)
+
+    current_app.logger.info(f'api.scheduler job output {job_id}')
+    return jsonify({'message': 'success'})
+
+
+@blueprint.route('/v2/scheduler/job/release', methods=['POST'])
+@apikey_required('agent')
+@blueprint.arguments(api_schema.JobReleaseSchema)
+def v2_scheduler_job_release_route(args):
+    """release unprocessed job, targets are returned to the queue"""
+
+    job = Job.query.filter(Job.id == args['id'], Job.retval == None).one_or_none()  # noqa: E711  pylint: disable=singleton-comparison
+    if not job:
+        return jsonify({'message': 'discard job'})
+
+    try:
+        job_id = job.id
+        SchedulerService.job_release(job)
+    except SchedulerServiceBusyException:
+        return jsonify({'message': 'server busy'}), HTTPStatus.TOO_MANY_REQUESTS
+
+    current_app.logger.info(f'api.scheduler job release {job_id}')
+    return jsonify({'message': 'success'})
+
+
 @blueprint.route('/v2/stats/prometheus')
 @blueprint.response(HTTPStatus.OK, {'type': 'string'}, content_type='text/plain')
 def v2_stats_prometheus_route():
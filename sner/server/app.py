@@ -78,6 +78,10 @@ DEFAULT_CONFIG = {
     # sner server scheduler
     'SNER_MAINTENANCE': False,
     'SNER_HEATMAP_HOT_LEVEL': 0,
+    'SNER_SCHEDULER_CACHE': False,
+    'SNER_SCHEDULER_CONCURRENT': False,
+    'SNER_SCHEDULER_ASSIGN_WAIT': 0,
+    'SNER_SCHEDULER_OUTPUT_MAX_SIZE': 1024**3,
     'SNER_EXCLUSIONS': [
         ['regex', r'^tcp://.*:22$'],
         ['network', '127.66.66.0/26']
@@ -7,18 +7,21 @@ tools. Parsers should be implemented via sner.plugin package and must
 implement ParserBase interface.
 """
 
+import json
 from abc import ABC, abstractmethod
-from dataclasses import dataclass
+from dataclasses import dataclass, fields
 from datetime import datetime
 from importlib import import_module
+from operator import attrgetter
 from pathlib import Path
-
-from littletable import Table as LittleTable
+from types import SimpleNamespace
 
 import sner.plugin
 
 
 REGISTERED_PARSERS = {}
+PIDB_SCHEMA_VERSION = 1
+PREPARSED_FILENAME = 'preparsed.json'
 
 
 def load_parser_plugins():
@@ -33,6 +36,21 @@ def load_parser_plugins():
 class ParsedItemBase:  # pylint: disable=too-few-public-methods
     """parsed items base object; shared functions"""
 
+    def to_dict(self):
+        """serialize to dict"""
+
+        return {key: value.isoformat() if isinstance(value, datetime) else value for key, value in self.__dict__.items()}
+
+    @classmethod
+    def from_dict(cls, data):
+        """deserialize from dict"""
+
+        data = dict(data)
+        for field in fields(cls):
+            if (field.type is datetime) and data.get(field.name):
+                data[field.name] = datetime.fromisoformat(data[field.name])
+        return cls(**data)
+
     def update(self, obj):
         """update data from other object"""
 
@@ -106,91 +124,155 @@ class ParsedNote(ParsedItemBase):
     import_time: datetime = None
 
 
+class ParsedItemsTable:
+    """
+    parsed items table indexed by iid and by natural key of the items,
+    partialy compatible with littletable.Table interface used by consumers
+    """
+
+    def __init__(self, *key_attrs):
+        self.key_attrs = key_attrs
+        # attrgetter key keeps pidb picklable
+        self.key = attrgetter(*key_attrs)
+        self.items = {}
+        self.keys = {}
+        self.next_iid = 0
+        self.by = SimpleNamespace(iid=self.items)  # pylint: disable=invalid-name
+        self._ordered = None
+
+    def __iter__(self):
+        return iter(self.items.values())
+
+    def __len__(self):
+        return len(self.items)
+
+    def __getitem__(self, idx):
+        # positional access list is rebuilt only after table modification
+        if self._ordered is None:
+            self._ordered = list(self.items.values())
+        return self._ordered[idx]
+
+    def get(self, key):
+        """get item by natural key"""
+
+        return self.keys.get(key)
+
+    def insert(self, item):
+        """insert item, new iid is assigned if not set"""
+
+        if item.iid is None:
+            item.iid = self.next_iid
+        self.next_iid = max(self.next_iid, item.iid + 1)
+        self.items[item.iid] = item
+        self.keys[self.key(item)] = item
+        self._ordered = None
+        return item
+
+    def insert_many(self, items):
+        """insert items"""
+
+        for item in items:
+            self.insert(item)
+
+    def remove(self, item):
+        """remove item"""
+
+        del self.items[item.iid]
+        del self.keys[self.key(item)]
+        self._ordered = None
+
+    def where(self, **kwargs):
+        """list items matching all attribute values, iid or natural key lookups use indexes"""
+
+        if 'iid' in kwargs:
+            candidates = [self.items.get(kwargs['iid'])]
+        elif set(self.key_attrs) <= set(kwargs):
+            candidates = [self.keys.get(self.key(SimpleNamespace(**kwargs)))]
+        else:
+            candidates = self
+
+        return [
+            item for item in candidates
+            if (item is not None) and all(getattr(item, attr) == value for attr, value in kwargs.items())
+        ]
+
+
 class ParsedItemsDb:
     """container for parsed items"""
 
+    ITEM_TYPES = {'hosts': ParsedHost, 'services': ParsedService, 'vulns': ParsedVuln, 'notes': ParsedNote}
+
     def __init__(self):
-        self.hosts = LittleTable()
-        self.hosts.create_index('iid', unique=True)
-        self.services = LittleTable()
-        self.services.create_index('iid', unique=True)
-        self.vulns = LittleTable()
-        self.vulns.create_index('iid', unique=True)
-        self.notes = LittleTable()
-        self.notes.create_index('iid', unique=True)
+        self.hosts = ParsedItemsTable('address')
+        self.services = ParsedItemsTable('host_iid', 'proto', 'port')
+        self.vulns = ParsedItemsTable('host_iid', 'name', 'xtype', 'service_iid', 'via_target')
+        self.notes = ParsedItemsTable('host_iid', 'xtype', 'service_iid', 'via_target')
+
+    def dump(self):
+        """serialize to json compatible dict"""
+
+        return {
+            'version': PIDB_SCHEMA_VERSION,
+            **{name: [item.to_dict() for item in getattr(self, name)] for name in self.ITEM_TYPES}
+        }
+
+    @classmethod
+    def load(cls, data):
+        """deserialize from dict created by dump"""
+
+        if data.get('version') != PIDB_SCHEMA_VERSION:
+            raise ValueError('pidb schema version mismatch')
+
+        pidb = cls()
+        for name, item_type in cls.ITEM_TYPES.items():
+            getattr(pidb, name).insert_many(item_type.from_dict(item) for item in data[name])
+        return pidb
 
     @staticmethod
-    def _first(alist):
-        if alist:
-            return alist[0]
-        return None
+    def _upsert(table, item):
+        """update existing item with same natural key or insert new one"""
 
-    def upsert_host(self, address, **kwargs):
-        """upsert host"""
+        if existing := table.get(table.key(item)):
+            existing.update(item)
+            return existing
+        return table.insert(item)
 
-        host = ParsedHost(address, **kwargs)
+    def _host(self, address):
+        """get or create host"""
 
-        pidb_host = self._first(self.hosts.where(address=host.address))
-        if pidb_host:
-            pidb_host.update(host)
-            return pidb_host
+        return self.hosts.get(address) or self.hosts.insert(ParsedHost(address))
 
-        host.iid = len(self.hosts)
-        self.hosts.insert(host)
-        return host
+    def _service(self, host_iid, proto, port):
+        """get or create service"""
 
-    def upsert_service(self, host_address, proto, port, **kwargs):
-        """upsert service"""
+        return self.services.get((host_iid, proto, port)) or self.services.insert(ParsedService(host_iid, proto, port))
+
+    def upsert_host(self, address, **kwargs):
+        """upsert host"""
 
-        pidb_host = self.upsert_host(host_address)
-        service = ParsedService(pidb_host.iid, proto, port, **kwargs)
+        return self._upsert(self.hosts, ParsedHost(address, **kwargs))
 
-        pidb_service = self._first(self.services.where(host_iid=service.host_iid, proto=service.proto, port=service.port))
-        if pidb_service:
-            pidb_service.update(service)
-            return pidb_service
+    def upsert_service(self, host_address, proto, port, **kwargs):
+        """upsert service"""
 
-        service.iid = len(self.services)
-        self.services.insert(service)
-        return service
+        pidb_host = self._host(host_address)
+        return self._upsert(self.services, ParsedService(pidb_host.iid, proto, port, **kwargs))
 
     def upsert_vuln(self, host_address, name, xtype, service_proto=None, service_port=None, via_target=None, **kwargs):  # noqa: E501  pylint: disable=too-many-arguments
         """upsert vuln"""
 
-        pidb_host = self.upsert_host(host_address)
-        pidb_service = self.upsert_service(host_address, service_proto, service_port) if (service_proto and service_port) else None
+        pidb_host = self._host(host_address)
+        pidb_service = self._service(pidb_host.iid, service_proto, service_port) if (service_proto and service_port) else None
         vuln = ParsedVuln(pidb_host.iid, name, xtype, service_iid=pidb_service.iid if pidb_service else None, via_target=via_target, **kwargs)
-
-        pidb_vuln = self._first(self.vulns.where(
-            host_iid=vuln.host_iid,
-            name=vuln.name,
-            xtype=vuln.xtype,
-            service_iid=vuln.service_iid,
-            via_target=vuln.via_target
-        ))
-        if pidb_vuln:
-            pidb_vuln.update(vuln)
-            return pidb_vuln
-
-        vuln.iid = len(self.vulns)
-        self.vulns.insert(vuln)
-        return vuln
+        return self._upsert(self.vulns, vuln)
 
     def upsert_note(self, host_address, xtype, service_proto=None, service_port=None, via_target=None, **kwargs):  # noqa: E501  pylint: disable=too-many-arguments
         """upsert vuln"""
 
-        pidb_host = self.upsert_host(host_address)
-        pidb_service = self.upsert_service(host_address, service_proto, service_port) if (service_proto and service_port) else None
+        pidb_host = self._host(host_address)
+        pidb_service = self._service(pidb_host.iid, service_proto, service_port) if (service_proto and service_port) else None
         note = ParsedNote(pidb_host.iid, xtype, service_iid=pidb_service.iid if pidb_service else None, via_target=via_target, **kwargs)
-
-        pidb_note = self._first(self.notes.where(host_iid=note.host_iid, xtype=note.xtype, service_iid=note.service_iid, via_target=note.via_target))
-        if pidb_note:
-            pidb_note.update(note)
-            return pidb_note
-
-        note.iid = len(self.notes)
-        self.notes.insert(note)
-        return note
+        return self._upsert(self.notes, note)
 
 
 class ParserBase(ABC):  # pylint: disable=too-few-public-methods
@@ -206,3 +288,52 @@ class ParserBase(ABC):  # pylint: disable=too-few-public-methods
         :return: pseudo database of parsed objects (hosts, services, vulns, notes)
         :rtype: ParsedItemsDb
         """
+
+    @classmethod
+    def parse_archive(cls, archive):
+        """
+        Parse data from already opened agent output archive. Parsers of agent
+        module archives should override to avoid reopening the archive,
+        default parses the archive path.
+
+        :return: pseudo database of parsed objects (hosts, services, vulns, notes)
+        :rtype: ParsedItemsDb
+        """
+
+        return cls.parse_path(archive.path)
+
+    @classmethod
+    def parse_path_batches(cls, path, batch_size):  # pylint: disable=unused-argument
+        """
+        Parse data from path in batches. Parsers able to stream their input
+        should override to bound memory use, default yields single batch.
+
+        :return: generator of pseudo databases of parsed objects
+        :rtype: Iterator[ParsedItemsDb]
+        """
+
+        yield cls.parse_path(path)
+
+
+def dump_preparsed(module, pidb):
+    """serialize agent pre-parsed items"""
+
+    return json.dumps({'module': module, **pidb.dump()})
+
+
+def load_preparsed(archive, module):
+    """
+    load agent pre-parsed items from opened job output archive
+
+    :return: parsed items or None if not present or not compatible
+    :rtype: ParsedItemsDb
+    """
+
+    try:
+        data = json.loads(archive.read(PREPARSED_FILENAME))
+    except KeyError:
+        return None
+
+    if (data.get('module') != module) or (data.get('version') != PIDB_SCHEMA_VERSION):
+        return None
+    return ParsedItemsDb.load(data)
@@ -5,22 +5,27 @@ planner core
 
 import logging
 from abc import ABC, abstractmethod
-from collections import defaultdict
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime
 from ipaddress import ip_address, ip_network, IPv6Address
+from itertools import chain
+from multiprocessing import get_context
 from pathlib import Path
 from time import sleep
 
 import psycopg2
+import yaml
 from flask import current_app
 from pytimeparse import parse as timeparse
-from sqlalchemy import select
 from sqlalchemy.orm.exc import NoResultFound
 
-from sner.lib import format_host_address, get_nested_key, TerminateContextMixin
+from sner.lib import chunked, format_host_address, get_nested_key, TerminateContextMixin
 from sner.server.extensions import db
+from sner.server.parser import load_parser_plugins
 from sner.server.scheduler.core import enumerate_network, JobManager, QueueManager
-from sner.server.scheduler.models import Queue, Job, Target
+from sner.server.scheduler.models import Queue, Job
 from sner.server.storage.core import StorageManager
 from sner.server.storage.versioninfo import VersioninfoManager
 
@@ -129,6 +134,56 @@ def filter_service_open(pidb):
     return pidb
 
 
+class DrainPool:
+    """
+    planner-wide pool of parser worker processes, spawned upon first use and
+    reused by all queue handlers. spawned workers does not inherit database
+    connections from planner, but must load parsers.
+    """
+
+    def __init__(self, workers, parse=JobManager.parse_output):
+        self.workers = workers
+        self.parse = parse
+        self.executor = None
+
+    def _create_executor(self, workers):
+        """create spawned process pool executor"""
+
+        return ProcessPoolExecutor(workers, get_context('spawn'), load_parser_plugins)
+
+    def submit(self, module, path):
+        """
+        submit parse of job output
+
+        :return: future and executor it was submitted to
+        :rtype: tuple
+        """
+
+        if self.executor is None:
+            self.executor = self._create_executor(self.workers)
+        return self.executor.submit(self.parse, module, path), self.executor
+
+    def discard(self, executor):
+        """discard broken executor, new one is spawned upon next submit"""
+
+        if self.executor is executor:
+            self.executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def parse_isolated(self, module, path):
+        """parse job output in dedicated worker, used to retry jobs from broken pool"""
+
+        with self._create_executor(1) as executor:
+            return executor.submit(self.parse, module, path).result()
+
+    def shutdown(self):
+        """shutdown worker processes"""
+
+        if self.executor:
+            self.executor.shutdown(cancel_futures=True)
+            self.executor = None
+
+
 class Stage(ABC):  # pylint: disable=too-few-public-methods
     """planner stage base"""
 
@@ -163,35 +218,76 @@ class Schedule(Stage):  # pylint: disable=too-few-public-methods
 class QueueHandler(Stage):  # pylint: disable=too-few-public-methods
     """queue handler base"""
 
-    def __init__(self, queue_name):
+    def __init__(self, queue_name, drain_pool=None):
         try:
             self.queue = Queue.query.filter(Queue.name == queue_name).one()
         except NoResultFound:
             raise ValueError(f'missing queue "{queue_name}"') from None
+        self.drain_pool = drain_pool
 
     def _drain(self):
         """drain queue and yield PIDBs"""
 
-        for aajob in Job.query.filter(Job.queue_id == self.queue.id, Job.retval == 0).all():
-            current_app.logger.info(f'{self.__class__.__name__} drain {aajob.id} ({aajob.queue.name})')
+        jobs = Job.query.filter(Job.queue_id == self.queue.id, Job.retval == 0).all()
+
+        if self.drain_pool and (len(jobs) > 1):
+            yield from self._drain_parallel(jobs)
+            return
+
+        for aajob in jobs:
+            yield from self._drain_job(aajob, lambda job=aajob: JobManager.parse(job))
+
+    def _drain_parallel(self, jobs):
+        """parse jobs in worker processes, yield PIDBs in jobs order"""
+
+        module = yaml.safe_load(self.queue.config)['module']
+        pending = deque()
+        for aajob in jobs:
+            pending.append((aajob, self._parse_pooled(module, aajob)))
+            # bound number of parsed but not yet imported PIDBs
+            if len(pending) > self.drain_pool.workers:
+                yield from self._drain_job(*pending.popleft())
+        while pending:
+            yield from self._drain_job(*pending.popleft())
+
+    def _parse_pooled(self, module, aajob):
+        """
+        submit job parse to the pool. crashed worker breaks all pending jobs,
+        these are retried one by one in isolated worker to fail only the crashing one.
+        """
+
+        future, executor = self.drain_pool.submit(module, aajob.output_abspath)
+
+        def parse():
             try:
-                parsed = JobManager.parse(aajob)
-            except Exception as exc:  # pylint: disable=broad-except
-                current_app.logger.error(f'{self.__class__.__name__} failed to drain {aajob.id} ({aajob.queue.name}), {exc}', exc_info=True)
-                aajob.retval += 1000
-                db.session.commit()
-                continue
-            yield parsed
-            JobManager.archive(aajob)
-            JobManager.delete(aajob)
+                return future.result()
+            except BrokenProcessPool:
+                self.drain_pool.discard(executor)
+                current_app.logger.warning(f'{self.__class__.__name__} worker pool broken, retrying {aajob.id} in isolated worker')
+                return self.drain_pool.parse_isolated(module, aajob.output_abspath)
+
+        return parse
+
+    def _drain_job(self, aajob, parse):
+        """yield job PIDB from parse callable, archive and delete job after processing"""
+
+        current_app.logger.info(f'{self.__class__.__name__} drain {aajob.id} ({aajob.queue.name})')
+        try:
+            parsed = parse()
+        except Exception as exc:  # pylint: disable=broad-except
+            current_app.logger.error(f'{self.__class__.__name__} failed to drain {aajob.id} ({aajob.queue.name}), {exc}', exc_info=True)
+            aajob.retval += 1000
+            db.session.commit()
+            return
+        yield parsed
+        JobManager.archive(aajob)
+        JobManager.delete(aajob)
 
     def task(self, data):
         """enqueue data/targets into all configured queues"""
 
-        already_queued = db.session.connection().execute(select(Target.target).filter(Target.queue == self.queue)).scalars().all()
-        enqueue = list(set(data) - set(already_queued))
-        QueueManager.enqueue(self.queue, enqueue)
-        current_app.logger.info(f'{self.__class__.__name__} enqueued {len(enqueue)} targets to "{self.queue.name}"')
+        enqueued = QueueManager.enqueue(self.queue, data, skip_queued=True)
+        current_app.logger.info(f'{self.__class__.__name__} enqueued {enqueued} targets to "{self.queue.name}"')
 
 
 class DummyStage(Stage):  # pylint: disable=too-few-public-methods
@@ -216,6 +312,8 @@ class DummyStage(Stage):  # pylint: disable=too-few-public-methods
 class NetlistEnum(Schedule):  # pylint: disable=too-few-public-methods
     """periodic host discovery via list of ipv4 networks"""
 
+    CHUNK_SIZE = 100000
+
     def __init__(self, schedule, netlist, next_stages):
         super().__init__(schedule)
         self.netlist = netlist
@@ -224,12 +322,13 @@ class NetlistEnum(Schedule):  # pylint: disable=too-few-public-methods
     def _run(self):
         """run"""
 
-        hosts = []
-        for net in self.netlist:
-            hosts += enumerate_network(net)
-        current_app.logger.info(f'{self.__class__.__name__} enumerated {len(hosts)} hosts')
-        for stage in self.next_stages:
-            stage.task(hosts)
+        # pass enumerated hosts to next stages in bounded chunks
+        count = 0
+        for hosts in chunked(chain.from_iterable(map(enumerate_network, self.netlist)), self.CHUNK_SIZE):
+            count += len(hosts)
+            for stage in self.next_stages:
+                stage.task(hosts)
+        current_app.logger.info(f'{self.__class__.__name__} enumerated {count} hosts')
 
 
 class StorageSixEnum(Schedule):  # pylint: disable=too-few-public-methods
@@ -271,8 +370,8 @@ class StorageRescan(Schedule):  # pylint: disable=too-few-public-methods
 class SixDisco(QueueHandler):
     """cleanup list host ipv6 hosts (drop any outside scope) and pass it to service discovery"""
 
-    def __init__(self, queue_name, next_stage, filternets=None):
-        super().__init__(queue_name)
+    def __init__(self, queue_name, next_stage, filternets=None, drain_pool=None):
+        super().__init__(queue_name, drain_pool)
         self.next_stage = next_stage
         self.filternets = filternets
 
@@ -290,8 +389,8 @@ class SixDisco(QueueHandler):
 class ServiceDisco(QueueHandler):
     """do service discovery on targets"""
 
-    def __init__(self, queue_name, next_stages):
-        super().__init__(queue_name)
+    def __init__(self, queue_name, next_stages, drain_pool=None):
+        super().__init__(queue_name, drain_pool)
         self.next_stages = next_stages
 
     def run(self):
@@ -355,6 +454,7 @@ class Planner(TerminateContextMixin):
         self.oneshot = oneshot
         self.config = config
         self.stages = {}
+        self.drain_pool = None
 
         if self.config:
             self._setup_stages()
@@ -362,24 +462,30 @@ class Planner(TerminateContextMixin):
     def _setup_stages(self):
         """setup plannet stages"""
 
+        if drain_workers := self.config.get('drain_workers', 0):
+            self.drain_pool = DrainPool(drain_workers)
+
         sscan_stages = []
         for sscan_qname in self.config['stage']['service_scan']['queues']:
-            self.stages[sscan_qname] = StorageLoader(sscan_qname)
+            self.stages[sscan_qname] = StorageLoader(sscan_qname, self.drain_pool)
             sscan_stages.append(self.stages[sscan_qname])
 
         self.stages['service_disco'] = ServiceDisco(
             self.config['stage']['service_disco']['queue'],
-            sscan_stages
+            sscan_stages,
+            drain_pool=self.drain_pool
         )
 
         self.stages['six_dns_disco'] = SixDisco(
             self.config['stage']['six_dns_disco']['queue'],
             self.stages['service_disco'],
-            self.config['home_netranges_ipv6']
+            self.config['home_netranges_ipv6'],
+            drain_pool=self.drain_pool
         )
         self.stages['six_enum_disco'] = SixDisco(
             self.config['stage']['six_enum_disco']['queue'],
-            self.stages['service_disco']
+            self.stages['service_disco'],
+            drain_pool=self.drain_pool
         )
 
         self.stages['netlist_enum'] = NetlistEnum(
@@ -403,7 +509,7 @@ class Planner(TerminateContextMixin):
         if standalones := get_nested_key(self.config, 'stage', 'load_standalone', 'queues'):
             for qname in standalones:
                 queue = Queue.query.filter_by(name=qname).one()
-                self.stages[f'load_standalone-{queue.id}'] = StorageLoader(qname)
+                self.stages[f'load_standalone-{queue.id}'] = StorageLoader(qname, self.drain_pool)
 
         self.stages['storage_cleanup'] = StorageCleanup()
 
@@ -442,5 +548,8 @@ class Planner(TerminateContextMixin):
                         if self.loop:
                             sleep(1)
 
+        if self.drain_pool:
+            self.drain_pool.shutdown()
+
         self.log.info('exit')
         return 0
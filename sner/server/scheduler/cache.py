@@ -0,0 +1,197 @@
+# This file is part of sner4 project governed by MIT license, see the LICENSE.txt file.
+"""
+scheduler in-process state cache
+"""
+
+import logging
+import os
+from select import select as select_fds
+from threading import Condition, Lock, Thread
+from time import monotonic, sleep
+
+import psycopg2
+import psycopg2.extensions
+from flask import current_app
+from sqlalchemy import event, func, select
+
+from sner.server.extensions import db
+from sner.server.scheduler.models import Queue, Readynet
+
+
+SCHEDULER_CACHE_CHANNEL = 'sner_scheduler'
+
+
+def notify_state_changed(conn=None):
+    """
+    notify all scheduler caches about queue/readynet changes, notification is
+    delivered by database upon transaction commit
+    """
+
+    if current_app.config['SNER_SCHEDULER_CACHE']:
+        (conn or db.session).execute(select(func.pg_notify(SCHEDULER_CACHE_CHANNEL, '')))
+
+
+@event.listens_for(Queue, 'after_insert')
+@event.listens_for(Queue, 'after_update')
+@event.listens_for(Queue, 'after_delete')
+@event.listens_for(Readynet, 'after_insert')
+@event.listens_for(Readynet, 'after_delete')
+def notify_state_changed_listener(mapper, connection, target):  # pylint: disable=unused-argument
+    """notify caches on orm level changes (queue management views, model factories)"""
+
+    notify_state_changed(connection)
+
+
+class SchedulerCache:  # pylint: disable=too-many-instance-attributes
+    """
+    in-process cache of assignable queues
+
+    Cache holds readynet counts for all active queues with any readynet
+    available and allows to answer nowork agent polls without querying the
+    database. Listener thread keeps dedicated connection subscribed to
+    scheduler notifications and invalidates the cache whenever any server
+    process changes queues or readynets. Cache reports unknown state while the
+    listener is not connected, callers must fall back to the database.
+
+    Invalidations also wake up long-polling assign requests waiting for work.
+    """
+
+    LISTEN_TIMEOUT = 5
+    RECONNECT_TIME = 5
+
+    def __init__(self, engine):
+        self.log = logging.getLogger('sner.server')
+        self.connect_args = engine.dialect.create_connect_args(engine.url)
+        self.lock = Lock()
+        self.changed = Condition(self.lock)
+        self.generation = 0
+        self.queues = None
+        self.listening = False
+        self.running = True
+        self.listener = Thread(target=self._listen, daemon=True)
+        self.listener.start()
+
+    def _listen(self):
+        """listener thread main loop"""
+
+        while self.running:
+            try:
+                conn = psycopg2.connect(*self.connect_args[0], **self.connect_args[1])
+                conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                with conn.cursor() as cur:
+                    cur.execute(f'LISTEN {SCHEDULER_CACHE_CHANNEL}')
+                self.listening = True
+                self.invalidate()
+
+                while self.running:
+                    if select_fds([conn], [], [], self.LISTEN_TIMEOUT)[0]:
+                        conn.poll()
+                        if conn.notifies:
+                            conn.notifies.clear()
+                            self.invalidate()
+
+                conn.close()
+            except psycopg2.Error as exc:  # pragma: no cover  ; won't test
+                self.log.warning('scheduler cache listener failed, %s', exc)
+                self.listening = False
+                self.invalidate()
+                sleep(self.RECONNECT_TIME)
+
+        self.listening = False
+
+    def stop(self):
+        """stop listener thread"""
+
+        self.running = False
+        self.listener.join()
+        self.invalidate()
+
+    def invalidate(self):
+        """drop cached state"""
+
+        with self.lock:
+            self.generation += 1
+            self.queues = None
+            self.changed.notify_all()
+
+    def _reload(self):
+        """
+        load current state from database
+
+        :return: loaded state, snapshot invalidated during the load is returned but not cached
+        :rtype: dict
+        """
+
+        generation = self.generation
+        query = (
+            select(Queue.name, Queue.reqs, func.count(Readynet.hashval))
+            .join(Readynet, Readynet.queue_id == Queue.id)
+            .filter(Queue.active)
+            .group_by(Queue.id)
+        )
+        queues = {name: (set(reqs), count) for name, reqs, count in db.session.execute(query).all()}
+
+        with self.lock:
+            if self.listening and (generation == self.generation):
+                self.queues = queues
+        return queues
+
+    def has_work(self, queue_name, client_caps):
+        """
+        check if there is any queue suitable for client request
+
+        :return: True or False, None if cache state is unknown
+        :rtype: bool
+        """
+
+        if not self.listening:
+            return None
+        if (queues := self.queues) is None:
+            queues = self._reload()
+
+        caps = set(client_caps)
+        return any(
+            reqs <= caps
+            for name, (reqs, _) in queues.items()
+            if (not queue_name) or (name == queue_name)
+        )
+
+    def wait_for_work(self, queue_name, client_caps, timeout):
+        """
+        wait until there is any queue suitable for client request or timeout expires
+
+        :return: True or False, None if cache state is unknown
+        :rtype: bool
+        """
+
+        deadline = monotonic() + timeout
+        while True:
+            generation = self.generation
+            if (has_work := self.has_work(queue_name, client_caps)) is not False:
+                return has_work
+            if (remaining := deadline - monotonic()) <= 0:
+                return False
+
+            # do not hold pooled connection while waiting
+            db.session.rollback()
+            with self.changed:
+                if generation == self.generation:
+                    self.changed.wait(remaining)
+
+
+def get_cache():
+    """
+    get scheduler cache for current process and application
+
+    :return: scheduler cache or None if cache is disabled
+    :rtype: SchedulerCache
+    """
+
+    if not current_app.config['SNER_SCHEDULER_CACHE']:
+        return None
+
+    # listener thread does not survive fork, every (gunicorn) worker must start its own
+    cache_key = f'sner_scheduler_cache_{os.getpid()}'
+    if cache_key not in current_app.extensions:
+        current_app.extensions[cache_key] = SchedulerCache(db.engine)
+    return current_app.extensions[cache_key]
@@ -5,6 +5,7 @@ scheduler commands
 
 import sys
 from ipaddress import ip_address, summarize_address_range
+from itertools import chain
 
 import click
 from flask import current_app
@@ -25,13 +26,14 @@ def command():
 def enumips_command(targets, **kwargs):
     """enumerate ip address range"""
 
-    targets = list(targets)
+    sources = [targets]
     if kwargs['file']:
-        targets += kwargs['file'].read().splitlines()
-    if not targets:
-        targets.extend(sys.stdin.readlines())
-    for target in targets:
-        print('\n'.join(enumerate_network(target)))
+        sources.append(kwargs['file'])
+    if not (targets or kwargs['file']):
+        sources.append(sys.stdin)
+    for target in filter(None, map(str.strip, chain.from_iterable(sources))):
+        for addr in enumerate_network(target):
+            print(addr)
 
 
 @command.command(name='rangetocidr', help='convert range specified addr space to series of cidr')
@@ -57,12 +59,13 @@ def queue_enqueue_command(queue_name, targets, **kwargs):
         current_app.logger.error('no such queue')
         sys.exit(1)
 
-    targets = list(targets)
+    # stream targets to enqueue
+    sources = [targets]
     if kwargs['file']:
-        targets.extend(kwargs['file'].read().splitlines())
-    if not targets:
-        targets.extend(sys.stdin.readlines())
-    QueueManager.enqueue(queue, targets)
+        sources.append(kwargs['file'])
+    if not (targets or kwargs['file']):
+        sources.append(sys.stdin)
+    QueueManager.enqueue(queue, chain.from_iterable(sources))
     sys.exit(0)
 
 
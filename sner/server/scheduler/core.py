@@ -3,59 +3,74 @@
 scheduler shared functions
 """
 
+import csv
+import hashlib
 import json
 import re
 from abc import ABC, abstractmethod
-from collections import defaultdict, namedtuple
+from bisect import bisect_right
+from collections import Counter, defaultdict, namedtuple
 from datetime import datetime
 from enum import Enum
+from io import StringIO
 from ipaddress import ip_address, ip_network, IPv4Address, IPv6Address
 from pathlib import Path
 from random import random
 from shutil import copy2
+from tempfile import NamedTemporaryFile
 from uuid import uuid4
 
 import yaml
 from flask import current_app
-from sqlalchemy import cast, delete, distinct, func, select
+from sqlalchemy import cast, column, delete, distinct, func, insert, literal, select, table, true, update
 from sqlalchemy.dialects.postgresql import ARRAY as pg_ARRAY, insert as pg_insert
 from sqlalchemy.exc import SQLAlchemyError
 
 from sner.agent.modules import SERVICE_TARGET_REGEXP
+from sner.lib import chunked, ZipArchive
 from sner.plugin.six_enum_discover.agent import SIXENUM_TARGET_REGEXP
 from sner.server.extensions import db
-from sner.server.parser import REGISTERED_PARSERS
+from sner.server.parser import load_preparsed, REGISTERED_PARSERS
+from sner.server.scheduler.cache import get_cache, notify_state_changed
 from sner.server.scheduler.models import Heatmap, Job, Queue, Readynet, Target
 
 
 SCHEDULER_LOCK_NUMBER = 1
+ENQUEUE_STAGING = table('enqueue_staging', column('target'), column('hashval'))
+SERVICE_TARGET_PATTERN = re.compile(SERVICE_TARGET_REGEXP)
+SIXENUM_TARGET_PATTERN = re.compile(SIXENUM_TARGET_REGEXP)
+# heatmap buckets, ipv4 /24 and ipv6 /48 networks
+HASHVAL_IPV4_MASK = ((1 << 32) - 1) ^ ((1 << 8) - 1)
+HASHVAL_IPV6_MASK = ((1 << 128) - 1) ^ ((1 << 80) - 1)
 
 
 def enumerate_network(arg):
-    """enumerate ip address range"""
+    """enumerate ip address range, addresses are generated lazily"""
 
     network = ip_network(arg, strict=False)
 
     # input is single address
     if network.prefixlen == network.max_prefixlen:
-        return [str(network.network_address)]
-
-    # enumerate hosts
-    data = list(map(str, network.hosts()))
+        yield str(network.network_address)
+        return
 
     # add network/bcast addresses to range if it's not point-to-point link
-    if network.prefixlen < (network.max_prefixlen-1):
-        data.insert(0, str(network.network_address))
-        if network.version == 4:
-            data.append(str(network.broadcast_address))
+    ptp = network.prefixlen >= (network.max_prefixlen-1)
+
+    if not ptp:
+        yield str(network.network_address)
 
-    return data
+    # enumerate hosts
+    yield from map(str, network.hosts())
+
+    if (not ptp) and (network.version == 4):
+        yield str(network.broadcast_address)
 
 
 def sixenum_target_boundaries(value):
     """returns tuple(first, last)"""
 
-    if not (mtmp := re.match(SIXENUM_TARGET_REGEXP, value)):
+    if not (mtmp := SIXENUM_TARGET_PATTERN.match(value)):
         raise ValueError('not valid sixenum target')
 
     addr = mtmp.group('scan6dst')
@@ -93,10 +108,10 @@ class ExclMatcher():
         return register_real
 
     def __init__(self, config):
-        self.excls = [
-            ExclMatcher.MATCHERS[ExclFamily(family)](value)
-            for family, value in config
-        ]
+        grouped = defaultdict(list)
+        for family, value in config:
+            grouped[ExclFamily(family)].append(value)
+        self.excls = [ExclMatcher.MATCHERS[family](values) for family, values in grouped.items()]
 
     def match(self, value):
         """match value against all exclusions/matchers"""
@@ -108,7 +123,7 @@ class ExclMatcher():
 
 
 class ExclMatcherImplBase(ABC):  # pylint: disable=too-few-public-methods
-    """base interface which must  be implemented by all available matchers"""
+    """base interface which must  be implemented by all available matchers, matcher receives all exclusions of the family"""
 
     def __init__(self, match_to):
         self.match_to = self._initialize(match_to)
@@ -127,85 +142,154 @@ class ExclMatcherImplBase(ABC):  # pylint: disable=too-few-public-methods
 
 @ExclMatcher.register(ExclFamily.NETWORK)
 class NetworkExclMatcher(ExclMatcherImplBase):  # pylint: disable=too-few-public-methods
-    """network matcher"""
+    """
+    network matcher
 
-    def _initialize(self, match_to):
-        return ip_network(match_to)
+    Networks are compiled into sorted lists of disjoint integer intervals per
+    address family, values are matched as address ranges (single address or
+    sixenum range) by bisecting the index.
+    """
 
-    def _test_addr(self, value):
-        try:
-            return ip_address(value) in self.match_to
-        except ValueError:
-            return False
+    def __init__(self, match_to):
+        super().__init__(match_to)
+        self.index = {4: ([], []), 6: ([], [])}
+        for net in sorted(self.match_to, key=lambda x: (x.version, int(x.network_address))):
+            starts, ends = self.index[net.version]
+            first, last = int(net.network_address), int(net.broadcast_address)
+            # merge overlapping and adjacent networks
+            if ends and (first <= ends[-1] + 1):
+                ends[-1] = max(ends[-1], last)
+            else:
+                starts.append(first)
+                ends.append(last)
 
-    def match(self, value):
-        # test value as plain address
-        if self._test_addr(value):
-            return True
+    def _initialize(self, match_to):
+        return [ip_network(item) for item in match_to]
 
-        # test value as service target
-        if mtmp := re.match(SERVICE_TARGET_REGEXP, value):
-            return self._test_addr(mtmp.group('host').replace('[', '').replace(']', ''))
+    @staticmethod
+    def _parse_range(value):
+        """parse value as plain address, service or sixenum target, returns tuple(version, first, last) or None"""
 
-        # test value as sixenum target
-        if mtmp := re.match(SIXENUM_TARGET_REGEXP, value):
-            first, last = map(ip_address, sixenum_target_boundaries(value))
+        try:
+            if '://' in value:
+                if mtmp := SERVICE_TARGET_PATTERN.match(value):
+                    value = mtmp.group('host').replace('[', '').replace(']', '')
+                elif SIXENUM_TARGET_PATTERN.match(value):
+                    first, last = map(ip_address, sixenum_target_boundaries(value))
+                    return first.version, int(first), int(last)
+            addr = ip_address(value)
+        except ValueError:
+            return None
 
-            # first or last enum addr is in excluded range
-            if self._test_addr(first) or self._test_addr(last):
-                return True
+        return addr.version, int(addr), int(addr)
 
-            # excluded range could be smaller than enum, check if excluded range does not belong into enum itself
-            if (
-                (first.version == self.match_to.version)
-                and ((first <= self.match_to.network_address <= last) or (first <= self.match_to.broadcast_address <= last))
-            ):
-                return True
+    def match(self, value):
+        if not (target_range := self._parse_range(value)):
+            return False
 
-        return False
+        # only the last interval starting before the range end can overlap the range
+        version, first, last = target_range
+        starts, ends = self.index[version]
+        idx = bisect_right(starts, last) - 1
+        return (idx >= 0) and (ends[idx] >= first)
 
 
 @ExclMatcher.register(ExclFamily.REGEX)
 class RegexExclMatcher(ExclMatcherImplBase):  # pylint: disable=too-few-public-methods
-    """regex matcher"""
+    """
+    regex matcher
+
+    Plain expressions are combined into single alternation. Expressions with
+    global inline flags, named groups or group references cannot be safely
+    combined and are searched one by one.
+    """
+
+    PLAIN_FLAGS = re.compile('').flags
+    GROUP_REFERENCE_PATTERN = re.compile(r'\\[1-9]|\(\?P=|\(\?\(')
 
     def _initialize(self, match_to):
-        return re.compile(match_to)
+        plain, regexes = [], []
+        for item in match_to:
+            regex = re.compile(item)
+            if (regex.flags == self.PLAIN_FLAGS) and (not regex.groupindex) and (not self.GROUP_REFERENCE_PATTERN.search(item)):
+                plain.append(item)
+            else:
+                regexes.append(regex)
+
+        if plain:
+            regexes.insert(0, re.compile('|'.join(f'(?:{item})' for item in plain)))
+        return regexes
 
     def match(self, value):
-        return bool(self.match_to.search(value))
+        return any(regex.search(value) for regex in self.match_to)
 
 
 class QueueManager:
     """Governs queues, readynets and targets"""
 
-    @staticmethod
-    def enqueue(queue, targets):
-        """enqueue targets to queue"""
-
-        enqueued = []
-        enqueued_hashvals = set()
-
-        for target in filter(None, map(lambda x: x.strip(), targets)):
-            thashval = SchedulerService.hashval(target)
-            enqueued.append({'queue_id': queue.id, 'target': target, 'hashval': thashval})
-            enqueued_hashvals.add(thashval)
-
-        if enqueued:
-            SchedulerService.get_lock()
-
-            conn = db.session.connection()
-            conn.execute(pg_insert(Target), enqueued)
-            hot_hashvals = set(SchedulerService.grep_hot_hashvals(enqueued_hashvals))
-            for thashval in (enqueued_hashvals - hot_hashvals):
-                conn.execute(
-                    pg_insert(Readynet)
-                    .values(queue_id=queue.id, hashval=thashval)
-                    .on_conflict_do_nothing(constraint='readynet_pkey')
-                )
+    ENQUEUE_CHUNK_SIZE = 10000
+
+    @classmethod
+    def enqueue(cls, queue, targets, skip_queued=False):
+        """
+        enqueue targets to queue
+
+        Targets are streamed from any iterable in chunks into temporary
+        staging table via COPY. Scheduling lock is held only for set-based
+        transfer of staged targets into queue and readynets.
+
+        Enqueue always commits current transaction, pending changes of the
+        caller are committed together with enqueued targets and scheduling
+        lock held by the caller is released.
+
+        :param skip_queued: skip targets already present in queue and duplicates
+        :return: number of enqueued targets
+        :rtype: int
+        """
+
+        conn = db.session.connection()
+        # staging table might exist from previous enqueue in current transaction
+        conn.execute(f'CREATE TEMPORARY TABLE IF NOT EXISTS {ENQUEUE_STAGING.name} (target text NOT NULL, hashval text NOT NULL) ON COMMIT DROP')
+        conn.execute(f'TRUNCATE {ENQUEUE_STAGING.name}')
+        staged = 0
+        with conn.connection.cursor() as cursor:
+            for chunk in chunked(filter(None, map(lambda x: x.strip(), targets)), cls.ENQUEUE_CHUNK_SIZE):
+                buf = StringIO()
+                csv.writer(buf).writerows(zip(chunk, SchedulerService.hashvals(chunk)))
+                buf.seek(0)
+                cursor.copy_expert(f'COPY {ENQUEUE_STAGING.name} (target, hashval) FROM STDIN WITH (FORMAT csv)', buf)
+                staged += len(chunk)
+
+        if not staged:
             db.session.commit()
+            return 0
+
+        SchedulerService.get_lock()
 
-            SchedulerService.release_lock()
+        source = select(literal(queue.id), ENQUEUE_STAGING.c.target, ENQUEUE_STAGING.c.hashval)
+        if skip_queued:
+            source = source.distinct().filter(
+                ~select(Target.id).filter(Target.queue_id == queue.id, Target.target == ENQUEUE_STAGING.c.target).exists()
+            )
+        enqueued = conn.execute(insert(Target).from_select(['queue_id', 'target', 'hashval'], source)).rowcount
+
+        source = select(literal(queue.id), ENQUEUE_STAGING.c.hashval).distinct()
+        if current_app.config['SNER_HEATMAP_HOT_LEVEL']:
+            source = (
+                source
+                .outerjoin(Heatmap, Heatmap.hashval == ENQUEUE_STAGING.c.hashval)
+                .filter(func.coalesce(Heatmap.count, 0) < current_app.config['SNER_HEATMAP_HOT_LEVEL'])
+            )
+        conn.execute(
+            pg_insert(Readynet)
+            .from_select(['queue_id', 'hashval'], source)
+            .on_conflict_do_nothing(constraint='readynet_pkey')
+        )
+        notify_state_changed()
+        db.session.commit()
+
+        SchedulerService.release_lock()
+        return enqueued
 
     @staticmethod
     def flush(queue):
@@ -215,6 +299,7 @@ class QueueManager:
 
         Target.query.filter(Target.queue_id == queue.id).delete()
         Readynet.query.filter(Readynet.queue_id == queue.id).delete()
+        notify_state_changed()
         db.session.commit()
 
         SchedulerService.release_lock()
@@ -249,10 +334,12 @@ class QueueManager:
 class JobManager:
     """job governance"""
 
+    OUTPUT_CHUNK_SIZE = 1024*1024
+
     @staticmethod
-    def create(queue, assigned_targets):
+    def create(queue, assigned_targets, hashvals):
         """
-        create job for queue with targets
+        create job for queue with targets and their heatmap accounted hashvals
 
         :return: agent assignment data
         :rtype: dict
@@ -263,17 +350,59 @@ class JobManager:
             'config': {} if queue.config is None else yaml.safe_load(queue.config),
             'targets': assigned_targets
         }
-        db.session.add(Job(id=assignment['id'], queue=queue, assignment=json.dumps(assignment)))
+        db.session.add(Job(
+            id=assignment['id'],
+            queue=queue,
+            assignment=json.dumps(assignment),
+            hashvals=hashvals
+        ))
         db.session.commit()
         return assignment
 
+    @classmethod
+    def receive_output(cls, job, stream, sha256, max_size=None):
+        """
+        receive job output stream into staging file next to job output, verify output integrity
+
+        :param max_size: maximum output size, enforced while reading the stream
+        :return: path of staged output or None if size or integrity check fails
+        :rtype: pathlib.Path
+        """
+
+        opath = Path(job.output_abspath)
+        opath.parent.mkdir(parents=True, exist_ok=True)
+        digest = hashlib.sha256()
+        size = 0
+
+        with NamedTemporaryFile(dir=opath.parent, prefix=f'{job.id}.', suffix='.upload', delete=False) as ftmp:
+            staged = Path(ftmp.name)
+            try:
+                while chunk := stream.read(cls.OUTPUT_CHUNK_SIZE):
+                    size += len(chunk)
+                    if max_size and (size > max_size):
+                        current_app.logger.warning(f'job output {job.id} exceeds maximum size')
+                        break
+                    digest.update(chunk)
+                    ftmp.write(chunk)
+            except Exception:
+                staged.unlink()
+                raise
+
+        if (max_size and (size > max_size)) or (digest.hexdigest() != sha256):
+            staged.unlink()
+            return None
+        return staged
+
     @staticmethod
     def finish(job, retval, output):
-        """writeback job results"""
+        """writeback job results, output is either data or path of staged output file"""
 
         opath = Path(job.output_abspath)
         opath.parent.mkdir(parents=True, exist_ok=True)
-        opath.write_bytes(output)
+        if isinstance(output, Path):
+            output.replace(opath)
+        else:
+            opath.write_bytes(output)
         job.retval = retval
         job.time_end = datetime.utcnow()
         db.session.commit()
@@ -292,8 +421,8 @@ class JobManager:
         SchedulerService.get_lock()
 
         job.retval = -1
-        for target in json.loads(job.assignment)['targets']:
-            SchedulerService.heatmap_pop(SchedulerService.hashval(target))
+        SchedulerService.heatmap_pop(job.hashvals)
+        db.session.commit()
 
         SchedulerService.release_lock()
 
@@ -307,9 +436,20 @@ class JobManager:
     def parse(job):
         """parse job and return data"""
 
-        module = yaml.safe_load(job.queue.config)['module']
-        parser_impl = REGISTERED_PARSERS[module]
-        return parser_impl.parse_path(job.output_abspath)
+        return JobManager.parse_output(yaml.safe_load(job.queue.config)['module'], job.output_abspath)
+
+    @staticmethod
+    def parse_output(module, path):
+        """
+        parse job output file, agent pre-parsed items are used when available.
+        archive is opened once for both. does not require app context, can run
+        in worker processes.
+        """
+
+        with ZipArchive(path) as archive:
+            if pidb := load_preparsed(archive, module):
+                return pidb
+            return REGISTERED_PARSERS[module].parse_archive(archive)
 
     @staticmethod
     def archive(job):
@@ -364,11 +504,15 @@ class SchedulerService:
 
     @staticmethod
     def get_lock(timeout=0):
-        """wait for database lock or raise exception"""
+        """
+        wait for database lock or raise exception. lock is bound to current transaction,
+        session level lock would leak whenever the session gets different pooled connection
+        after commit (concurrent requests handled by single server process).
+        """
 
         try:
             db.session.execute(
-                'SET LOCAL lock_timeout=:timeout; SELECT pg_advisory_lock(:locknum);',
+                'SET LOCAL lock_timeout=:timeout; SELECT pg_advisory_xact_lock(:locknum);',
                 {'timeout': timeout*100, 'locknum': SCHEDULER_LOCK_NUMBER}
             )
         except SQLAlchemyError:
@@ -378,72 +522,161 @@ class SchedulerService:
 
     @staticmethod
     def release_lock():
-        """release scheduling lock"""
+        """release scheduling lock by ending current transaction"""
+
+        db.session.commit()
+
+    @staticmethod
+    def get_shared_lock(timeout=0):
+        """
+        wait for shared database lock or raise exception. shared lock allows concurrent
+        job assignments and outputs, but excludes all operations holding the scheduling
+        lock. lock is released at the end of current transaction.
+        """
+
+        try:
+            db.session.execute(
+                'SET LOCAL lock_timeout=:timeout; SELECT pg_advisory_xact_lock_shared(:locknum);',
+                {'timeout': timeout*100, 'locknum': SCHEDULER_LOCK_NUMBER}
+            )
+        except SQLAlchemyError:
+            db.session.rollback()
+            current_app.logger.warning('failed to acquire SchedulerService shared lock')
+            raise SchedulerServiceBusyException() from None
 
-        db.session.execute('SELECT pg_advisory_unlock(:locknum);', {'locknum': SCHEDULER_LOCK_NUMBER})
+    @staticmethod
+    def _hashvals_lock_query(hashvals, lock_function):
+        """build per-hashval transaction-level advisory lock query, locks are taken in the order of hashvals"""
+
+        hashvals_table = func.unnest(cast(list(hashvals), pg_ARRAY(db.String))).table_valued('hashval').render_derived()
+        return select(hashvals_table.c.hashval, lock_function(SCHEDULER_LOCK_NUMBER, func.hashtext(hashvals_table.c.hashval)))
+
+    @classmethod
+    def claim_hashvals(cls, hashvals):
+        """
+        try to lock hashvals for rate-limit heatmap update without waiting
+
+        :return: hashvals claimed by current transaction
+        :rtype: list
+        """
+
+        return [
+            hashval
+            for hashval, locked in db.session.connection().execute(cls._hashvals_lock_query(hashvals, func.pg_try_advisory_xact_lock)).all()
+            if locked
+        ]
+
+    @classmethod
+    def lock_hashvals(cls, hashvals):
+        """wait for lock of hashvals for rate-limit heatmap update; sorted order prevents deadlocks"""
+
+        try:
+            db.session.connection().execute(cls._hashvals_lock_query(sorted(set(hashvals)), func.pg_advisory_xact_lock)).all()
+        except SQLAlchemyError:
+            db.session.rollback()
+            current_app.logger.warning('failed to acquire SchedulerService hashvals lock')
+            raise SchedulerServiceBusyException() from None
 
     @staticmethod
     def hashval(value):
         """computes rate-limit heatmap hash value"""
 
-        if mtmp := re.match(SERVICE_TARGET_REGEXP, value):
-            value = mtmp.group('host')
-            if (value[0] == '[') and (value[-1] == ']'):
-                value = value[1:-1]
+        # plain addresses and hostnames skip pattern matching
+        if '://' in value:
+            if mtmp := SERVICE_TARGET_PATTERN.match(value):
+                value = mtmp.group('host')
+                if (value[0] == '[') and (value[-1] == ']'):
+                    value = value[1:-1]
 
-        if mtmp := re.match(SIXENUM_TARGET_REGEXP, value):
-            value = mtmp.group('scan6dst').split('-')[0]
+            if mtmp := SIXENUM_TARGET_PATTERN.match(value):
+                value = mtmp.group('scan6dst').split('-')[0]
 
         try:
             addr = ip_address(value)
-            if isinstance(addr, IPv4Address):
-                return str(ip_network(f'{ip_address(value)}/24', strict=False))
-            if isinstance(addr, IPv6Address):
-                return str(ip_network(f'{ip_address(value)}/48', strict=False))
         except ValueError:
-            pass
+            return value
 
-        return value
+        if addr.version == 4:
+            return f'{IPv4Address(int(addr) & HASHVAL_IPV4_MASK)}/24'
+        return f'{IPv6Address(int(addr) & HASHVAL_IPV6_MASK)}/48'
+
+    @classmethod
+    def hashvals(cls, values):
+        """computes rate-limit heatmap hash values for list of targets, one by one"""
+
+        return list(map(cls.hashval, values))
 
     @staticmethod
-    def heatmap_put(hashval):
-        """account value (increment counter) in heatmap and update readynets"""
+    def heatmap_put(hashvals):
+        """
+        account values (increment counters) in heatmap and update readynets
+
+        :return: current heatmap counts for accounted hashvals
+        :rtype: dict
+        """
+
+        if not hashvals:
+            return {}
 
         conn = db.session.connection()
-        heat_count = conn.execute(
-            pg_insert(Heatmap)
-            .values(hashval=hashval, count=1)
-            .on_conflict_do_update(constraint='heatmap_pkey', set_={"count": Heatmap.count + 1})
-            .returning(Heatmap.count)
-        ).scalar()
+        stmt = pg_insert(Heatmap).values([{'hashval': hashval, 'count': count} for hashval, count in Counter(hashvals).items()])
+        heat_counts = dict(conn.execute(
+            stmt
+            .on_conflict_do_update(constraint='heatmap_pkey', set_={'count': Heatmap.count + stmt.excluded.count})
+            .returning(Heatmap.hashval, Heatmap.count)
+        ).all())
 
-        if current_app.config['SNER_HEATMAP_HOT_LEVEL'] and (heat_count >= current_app.config['SNER_HEATMAP_HOT_LEVEL']):
-            conn.execute(delete(Readynet).filter(Readynet.hashval == hashval))
+        if current_app.config['SNER_HEATMAP_HOT_LEVEL']:
+            hot_hashvals = [hashval for hashval, count in heat_counts.items() if count >= current_app.config['SNER_HEATMAP_HOT_LEVEL']]
+            if hot_hashvals:
+                conn.execute(delete(Readynet).filter(Readynet.hashval.in_(hot_hashvals)))
+                notify_state_changed()
 
-        db.session.commit()
-        return heat_count
+        return heat_counts
 
     @classmethod
-    def heatmap_pop(cls, hashval):
-        """account value (decrement counter) in heatmap and update readynets"""
+    def heatmap_pop(cls, hashvals):
+        """
+        account values (decrement counters) in heatmap and update readynets
+
+        :return: current heatmap counts for accounted hashvals
+        :rtype: dict
+        """
+
+        if not hashvals:
+            return {}
 
         conn = db.session.connection()
-        heat_count = conn.execute(
-            pg_insert(Heatmap)
-            .values(hashval=hashval, count=1)
-            .on_conflict_do_update(constraint='heatmap_pkey', set_={"count": Heatmap.count - 1})
-            .returning(Heatmap.count)
-        ).scalar()
+        counts = Counter(hashvals)
+        pops = (
+            func.unnest(cast(list(counts.keys()), pg_ARRAY(db.String)), cast(list(counts.values()), pg_ARRAY(db.Integer)))
+            .table_valued('hashval', 'count')
+            .render_derived()
+        )
+        heat_counts = dict(conn.execute(
+            update(Heatmap)
+            .filter(Heatmap.hashval == pops.c.hashval)
+            .values(count=Heatmap.count - pops.c.count)
+            .returning(Heatmap.hashval, Heatmap.count)
+        ).all())
 
         if random() < cls.HEATMAP_GC_PROBABILITY:
-            conn.execute(delete(Heatmap).filter(Heatmap.count == 0))
-
-        if current_app.config['SNER_HEATMAP_HOT_LEVEL'] and (heat_count+1 == current_app.config['SNER_HEATMAP_HOT_LEVEL']):
-            for queue_id in db.session.execute(select(func.distinct(Target.queue_id)).filter(Target.hashval == hashval)).scalars().all():
-                conn.execute(pg_insert(Readynet).values(queue_id=queue_id, hashval=hashval))
+            gc_query = delete(Heatmap).filter(Heatmap.count == 0)
+            if current_app.config['SNER_SCHEDULER_CONCURRENT']:
+                # other hashvals might be locked by concurrent transactions
+                gc_query = gc_query.filter(Heatmap.hashval.in_(list(counts)))
+            conn.execute(gc_query)
+
+        hot_level = current_app.config['SNER_HEATMAP_HOT_LEVEL']
+        if hot_level and (cooled := [key for key, count in heat_counts.items() if count < hot_level <= count + counts[key]]):
+            conn.execute(
+                pg_insert(Readynet)
+                .from_select(['queue_id', 'hashval'], select(Target.queue_id, Target.hashval).distinct().filter(Target.hashval.in_(cooled)))
+                .on_conflict_do_nothing(constraint='readynet_pkey')
+            )
+            notify_state_changed()
 
-        db.session.commit()
-        return heat_count
+        return heat_counts
 
     @staticmethod
     def grep_hot_hashvals(hashvals):
@@ -485,82 +718,149 @@ class SchedulerService:
         query = query.order_by(Queue.priority.desc(), func.random())
         return db.session.execute(query).scalars().first()
 
-    @staticmethod
-    def _pop_random_target(queue):
+    @classmethod
+    def _pop_random_targets(cls, queue, count, claim=False):
         """
-        pop random target from queue and update readynet info
+        pop random targets from queue and update readynet info
 
-        :return: random target properties as tuple
-        :rtype: sner.server.scheduler.core.RandomTarget
+        Targets are popped from random sample of queue readynets, each readynet
+        yields at most as many targets as its rate-limit heat allows and targets
+        are picked round-robin across the sampled readynets.
+
+        With claim, only sampled readynets which hashvals could be locked by
+        current transaction are used and targets rows are claimed with
+        SKIP LOCKED, so concurrent assignments never wait for each other.
+        Readynets and heatmap rows are modified only under respective hashval
+        lock (or exclusive scheduling lock), hence no row-level waits occur.
+
+        :return: random targets properties
+        :rtype: list of sner.server.scheduler.core.RandomTarget
         """
 
         conn = db.session.connection()
 
-        readynet_hashval = conn.execute(
-            select(Readynet.hashval).filter(Readynet.queue_id == queue.id).order_by(func.random()).limit(1)
-        ).scalar()
-        if not readynet_hashval:
-            return None
+        if current_app.config['SNER_HEATMAP_HOT_LEVEL']:
+            # stale readynets over lowered hot level must not produce negative limit
+            budget = func.greatest(0, func.least(count, current_app.config['SNER_HEATMAP_HOT_LEVEL'] - func.coalesce(Heatmap.count, 0)))
+        else:
+            budget = literal(count)
+        readynets = (
+            select(Readynet.hashval, budget.label('budget'))
+            .outerjoin(Heatmap, Heatmap.hashval == Readynet.hashval)
+            .filter(Readynet.queue_id == queue.id)
+        )
+        if claim:
+            sampled = conn.execute(
+                select(Readynet.hashval)
+                .filter(Readynet.queue_id == queue.id)
+                .order_by(func.random())
+                .limit(count)
+            ).scalars().all()
+            readynets = readynets.filter(Readynet.hashval.in_(cls.claim_hashvals(sampled)))
+        else:
+            readynets = readynets.order_by(func.random()).limit(count)
+        readynets = readynets.subquery()
 
-        target_id, target = conn.execute(
-            select(Target.id, Target.target)
-            .filter(Target.queue_id == queue.id, Target.hashval == readynet_hashval)
+        readynet_targets = (
+            select(Target.id)
+            .filter(Target.queue_id == queue.id, Target.hashval == readynets.c.hashval)
             .order_by(func.random())
-            .limit(1)
-        ).first()
+            .limit(readynets.c.budget)
+        )
+        if claim:
+            readynet_targets = readynet_targets.with_for_update(skip_locked=True)
+        readynet_targets = readynet_targets.lateral()
+        picked = (
+            select(readynet_targets.c.id)
+            .select_from(readynets.join(readynet_targets, true()))
+            .order_by(func.row_number().over(partition_by=readynets.c.hashval), func.random())
+            .limit(count)
+        )
 
-        conn.execute(delete(Target).filter(Target.id == target_id))
-        # prune readynet if no targets left for current queue
-        conn.execute(
-            delete(Readynet)
-            .filter(
-                Readynet.queue_id == queue.id,
-                Readynet.hashval == readynet_hashval,
-                select(func.count(Target.id)).filter(Target.queue_id == queue.id, Target.hashval == readynet_hashval).scalar_subquery() == 0
+        rtargets = [
+            RandomTarget(*row)
+            for row in conn.execute(
+                delete(Target)
+                .filter(Target.id.in_(picked))
+                .returning(Target.id, Target.target, Target.hashval)
+            ).all()
+        ]
+
+        # prune readynets if no targets left for current queue
+        if rtargets:
+            pruned = conn.execute(
+                delete(Readynet)
+                .filter(
+                    Readynet.queue_id == queue.id,
+                    Readynet.hashval.in_({item.hashval for item in rtargets}),
+                    ~select(Target.id).filter(Target.queue_id == queue.id, Target.hashval == Readynet.hashval).exists()
+                )
             )
-        )
+            if pruned.rowcount:
+                notify_state_changed()
 
-        db.session.commit()
-        return RandomTarget(target_id, target, readynet_hashval)
+        return rtargets
 
     @classmethod
-    def job_assign(cls, queue_name, client_caps):
+    def job_assign(cls, queue_name, client_caps, wait=0):
         """
         assign job for agent
 
         * select suitable queue
-        * pop random target
-            * select random readynet for queue (readynets reflects current rate-limit heatmap state)
-            * pop random target within selected readynet
-            * cleanup readynet if queue does not hold any target in same readynet
+        * pop batch of random targets
+            * select random sample of readynets for queue (readynets reflects current rate-limit heatmap state)
+            * pop random targets within selected readynets, not more than readynet heat allows
+            * cleanup readynets if queue does not hold any target in same readynet
         * update rate-limit heatmap
-            * deactivate readynet for all queues if it becomes hot
+            * deactivate readynets for all queues if it becomes hot
+        * repeat while the group is not full and excluded targets were popped
+
+        Nowork is answered from the scheduler cache when enabled, with `wait`
+        the request is held until the cache reports suitable work or the wait
+        time (seconds) expires. In concurrent mode assignment holds only shared
+        scheduling lock and claims rows and hashvals without waiting for other
+        assignments.
         """
 
-        cls.get_lock(cls.TIMEOUT_JOB_ASSIGN)
+        if cache := get_cache():
+            has_work = cache.wait_for_work(queue_name, client_caps, wait) if wait else cache.has_work(queue_name, client_caps)
+            if has_work is False:
+                return {}  # nowork
+
+        concurrent = current_app.config['SNER_SCHEDULER_CONCURRENT']
+        if concurrent:
+            cls.get_shared_lock(cls.TIMEOUT_JOB_ASSIGN)
+        else:
+            cls.get_lock(cls.TIMEOUT_JOB_ASSIGN)
 
         assignment = {}  # nowork
         assigned_targets = []
+        assigned_hashvals = []
         blacklist = ExclMatcher(current_app.config['SNER_EXCLUSIONS'])
 
         queue = cls._get_assignment_queue(queue_name, client_caps)
         if not queue:
-            SchedulerService.release_lock()
+            db.session.commit()
+            if not concurrent:
+                cls.release_lock()
             return assignment
 
         while len(assigned_targets) < queue.group_size:
-            rtarget = cls._pop_random_target(queue)
-            if not rtarget:
+            rtargets = cls._pop_random_targets(queue, queue.group_size - len(assigned_targets), claim=concurrent)
+            if not rtargets:
                 break
-            if blacklist.match(rtarget.target):
-                continue
-            assigned_targets.append(rtarget.target)
-            cls.heatmap_put(rtarget.hashval)
+            rtargets = [item for item in rtargets if not blacklist.match(item.target)]
+            assigned_targets += [item.target for item in rtargets]
+            assigned_hashvals += [item.hashval for item in rtargets]
+            cls.heatmap_put([item.hashval for item in rtargets])
 
         if assigned_targets:
-            assignment = JobManager.create(queue, assigned_targets)
+            assignment = JobManager.create(queue, assigned_targets, assigned_hashvals)
+        else:
+            db.session.commit()
 
-        cls.release_lock()
+        if not concurrent:
+            cls.release_lock()
         return assignment
 
     @classmethod
@@ -570,15 +870,38 @@ class SchedulerService:
 
         * for each target update rate-limit heatmap
             * if readynet of the target becomes cool activate it for all queues
+
+        In concurrent mode only the job hashvals are locked.
         """
 
-        cls.get_lock(cls.TIMEOUT_JOB_OUTPUT)
+        concurrent = current_app.config['SNER_SCHEDULER_CONCURRENT']
+        if concurrent:
+            cls.get_shared_lock(cls.TIMEOUT_JOB_OUTPUT)
+            cls.lock_hashvals(job.hashvals)
+        else:
+            cls.get_lock(cls.TIMEOUT_JOB_OUTPUT)
 
+        cls.heatmap_pop(job.hashvals)
         JobManager.finish(job, retval, output)
-        for target in json.loads(job.assignment)['targets']:
-            cls.heatmap_pop(cls.hashval(target))
 
-        cls.release_lock()
+        if not concurrent:
+            cls.release_lock()
+
+    @classmethod
+    def job_release(cls, job):
+        """
+        release unprocessed job, job targets are requeued and accounted heat
+        is returned. job is removed in the same transaction as targets are
+        requeued, repeated requests cannot enqueue targets twice.
+        """
+
+        cls.get_lock(cls.TIMEOUT_JOB_OUTPUT)
+        cls.heatmap_pop(job.hashvals)
+        targets = json.loads(job.assignment)['targets']
+        queue = job.queue
+        db.session.delete(job)
+        # enqueue commits current transaction and releases the lock
+        QueueManager.enqueue(queue, targets)
 
     @classmethod
     def readynet_recount(cls):
@@ -588,27 +911,27 @@ class SchedulerService:
 
         cls.get_lock()
         conn = db.session.connection()
+        hot_level = current_app.config['SNER_HEATMAP_HOT_LEVEL']
+
+        # all heatmap hashvals over limit remove from readynet
+        if hot_level:
+            conn.execute(delete(Readynet).filter(Readynet.hashval.in_(select(Heatmap.hashval).filter(Heatmap.count >= hot_level))))
+
+        # for all target hashvals except over limit insert missing readynets for all queues
+        source = select(Target.queue_id, Target.hashval).distinct()
+        if hot_level:
+            source = (
+                source
+                .outerjoin(Heatmap, Heatmap.hashval == Target.hashval)
+                .filter(func.coalesce(Heatmap.count, 0) < hot_level)
+            )
+        conn.execute(
+            pg_insert(Readynet)
+            .from_select(['queue_id', 'hashval'], source.except_(select(Readynet.queue_id, Readynet.hashval)))
+            .on_conflict_do_nothing(constraint='readynet_pkey')
+        )
 
-        if current_app.config['SNER_HEATMAP_HOT_LEVEL']:
-            hot_hashvals = set(conn.execute(
-                select(Heatmap.hashval).filter(Heatmap.count >= current_app.config['SNER_HEATMAP_HOT_LEVEL'])
-            ).scalars().all())
-
-            # all heatmap hashvals over limit remove from readynet
-            conn.execute(delete(Readynet).filter(Readynet.hashval.in_(hot_hashvals)))
-        else:
-            hot_hashvals = set()
-
-        # for all target hashvals except over limit insert as readynet for all queues
-        all_hashvals = set(conn.execute(select(func.distinct(Target.hashval))).scalars().all())
-        for thashval in (all_hashvals - hot_hashvals):
-            for queue_id in conn.execute(select(func.distinct(Target.queue_id)).filter(Target.hashval == thashval)).scalars().all():
-                conn.execute(
-                    pg_insert(Readynet)
-                    .values(queue_id=queue_id, hashval=thashval)
-                    .on_conflict_do_nothing(constraint='readynet_pkey')
-                )
-
+        notify_state_changed()
         db.session.commit()
         cls.release_lock()
 
@@ -623,25 +946,19 @@ class SchedulerService:
 
         cls.get_lock()
 
-        ref_heatmap = defaultdict(int)
-        for job in Job.query.filter(Job.retval == None).all():  # noqa: E711  pylint: disable=singleton-comparison
-            for target in json.loads(job.assignment)['targets']:
-                ref_heatmap[SchedulerService.hashval(target)] += 1
-
-        db_heatmap = {
-            item.hashval: item.count
-            for item in Heatmap.query.all()
-            if item.count != 0
-        }
-
-        keys_only_in_dict1 = set(ref_heatmap.keys()) - set(db_heatmap.keys())
-        keys_only_in_dict2 = set(db_heatmap.keys()) - set(ref_heatmap.keys())
-        different_values = {
-            key: (ref_heatmap[key], db_heatmap[key])
-            for key in ref_heatmap
-            if (key in db_heatmap) and (ref_heatmap[key] != db_heatmap[key])
-        }
+        running = (
+            select(func.unnest(Job.hashvals).label('hashval'))
+            .filter(Job.retval == None)  # noqa: E711  pylint: disable=singleton-comparison
+            .subquery()
+        )
+        ref_heatmap = select(running.c.hashval, func.count().label('count')).group_by(running.c.hashval).subquery()
+        db_heatmap = select(Heatmap.hashval, Heatmap.count).filter(Heatmap.count != 0).subquery()
+        different = (
+            select(literal(1))
+            .select_from(ref_heatmap.join(db_heatmap, ref_heatmap.c.hashval == db_heatmap.c.hashval, full=True))
+            .filter(ref_heatmap.c.count.is_distinct_from(db_heatmap.c.count))
+        )
 
-        heatmaps_equal = not bool(keys_only_in_dict1 or keys_only_in_dict2 or different_values)
+        heatmaps_equal = not db.session.execute(select(different.exists())).scalar()
         cls.release_lock()
         return heatmaps_equal
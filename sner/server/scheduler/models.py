@@ -95,6 +95,7 @@ class Job(db.Model):
     retval = db.Column(db.Integer)
     time_start = db.Column(db.DateTime, default=datetime.utcnow)
     time_end = db.Column(db.DateTime)
+    hashvals = db.Column(postgresql.ARRAY(db.String, dimensions=1), nullable=False, default=list)  # heatmap accounted target hashvals
 
     queue = relationship('Queue', back_populates='jobs')
 
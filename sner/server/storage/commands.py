@@ -37,6 +37,7 @@ def command():
 @with_appcontext
 @click.option('--dry', is_flag=True, help='do not update database, only print new items')
 @click.option('--addtag', multiple=True, help='add tag to all imported objects, can be used several times')
+@click.option('--batch-size', type=click.IntRange(min=1), help='import parsed items in batches, bounds memory use of streaming parsers')
 @click.argument('parser')
 @click.argument('path', nargs=-1)
 def storage_import(path, parser, **kwargs):
@@ -53,10 +54,16 @@ def storage_import(path, parser, **kwargs):
             continue
 
         try:
-            if kwargs.get('dry'):
-                StorageManager.import_parsed_dry(parser_impl.parse_path(item))
+            if kwargs.get('batch_size'):
+                batches = parser_impl.parse_path_batches(item, kwargs['batch_size'])
             else:
-                StorageManager.import_parsed(parser_impl.parse_path(item), list(kwargs['addtag']))
+                batches = [parser_impl.parse_path(item)]
+
+            for pidb in batches:
+                if kwargs.get('dry'):
+                    StorageManager.import_parsed_dry(pidb)
+                else:
+                    StorageManager.import_parsed(pidb, list(kwargs['addtag']))
         except Exception as exc:  # pylint: disable=broad-except
             current_app.logger.warning(f'failed to parse {item}, {exc}')
 
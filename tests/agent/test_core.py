@@ -4,14 +4,25 @@ agent basic tests
 """
 
 import json
+import signal
+from multiprocessing import Process
 from pathlib import Path
+from threading import Barrier, Lock
+from time import monotonic, sleep
+from unittest.mock import patch
 from uuid import uuid4
+from zipfile import ZipFile, ZIP_DEFLATED, ZIP_STORED
 
 from flask import url_for
 
-from sner.agent.core import main as agent_main
-from sner.lib import file_from_zip
-from sner.server.scheduler.models import Job, Queue
+from sner.agent.core import DEFAULT_CONFIG, main as agent_main, ServerableAgent
+from sner.agent.modules import OutputSink
+from sner.lib import file_from_zip, ZipArchive
+from sner.plugin.dummy.agent import AgentModule as DummyModule
+from sner.plugin.dummy.parser import ParserModule as DummyParser
+from sner.server.parser import load_preparsed
+from sner.server.scheduler.core import SchedulerService
+from sner.server.scheduler.models import Job, Queue, Target
 
 
 def test_version(tmpworkdir):  # pylint: disable=unused-argument
@@ -41,6 +52,105 @@ def test_exception_in_module(tmpworkdir):  # pylint: disable=unused-argument
     assert Path(f'{test_a["id"]}.zip').exists()
 
 
+def test_preparse(tmpworkdir):  # pylint: disable=unused-argument
+    """test agent pre-parsing output"""
+
+    test_a = {'id': str(uuid4()), 'config': {'module': 'dummy', 'args': '--arg1'}, 'targets': ['192.0.2.1']}
+
+    with patch.dict(DEFAULT_CONFIG, {'PREPARSE': True}):
+        result = agent_main(['--assignment', json.dumps(test_a)])
+    assert result == 0
+    with ZipArchive(f'{test_a["id"]}.zip') as archive:
+        assert [x.address for x in load_preparsed(archive, 'dummy').hosts] == ['192.0.2.1']
+
+
+def test_preparse_error(tmpworkdir):  # pylint: disable=unused-argument
+    """test agent pre-parsing failure keeps raw output"""
+
+    test_a = {'id': str(uuid4()), 'config': {'module': 'dummy', 'args': '--arg1'}, 'targets': ['192.0.2.1']}
+
+    with patch.dict(DEFAULT_CONFIG, {'PREPARSE': True}), \
+            patch.object(DummyParser, 'parse_archive', side_effect=ValueError('parser failed')):
+        result = agent_main(['--assignment', json.dumps(test_a)])
+    assert result == 0
+    with ZipArchive(f'{test_a["id"]}.zip') as archive:
+        assert archive.members('assignment.json')
+        assert load_preparsed(archive, 'dummy') is None
+
+
+def test_output_sink(tmpworkdir):  # pylint: disable=unused-argument
+    """test output sink member compression and directory packing"""
+
+    Path('jobdir/sub').mkdir(parents=True)
+    Path('jobdir/sub/file.txt').write_text('file', encoding='utf-8')
+
+    with OutputSink('output.zip', 6) as sink:
+        sink.write('data.json', '{}')
+        sink.write('image.png', b'png', compress=False)
+        sink.write_dir('jobdir', remove=True)
+
+    with ZipFile('output.zip') as output_zip:
+        assert {item.filename: item.compress_type for item in output_zip.infolist()} == {
+            'data.json': ZIP_DEFLATED,
+            'image.png': ZIP_STORED,
+            'sub/file.txt': ZIP_DEFLATED
+        }
+    assert not Path('jobdir/sub/file.txt').exists()
+
+    with OutputSink('stored.zip', 0) as sink:
+        sink.write('data.json', '{}')
+    with ZipFile('stored.zip') as output_zip:
+        assert output_zip.getinfo('data.json').compress_type == ZIP_STORED
+
+    module = DummyModule()
+    module.write_output('plain.txt', 'text')
+    module.write_output('plain.bin', b'bin')
+    assert Path('plain.txt').read_text(encoding='utf-8') == 'text'
+    assert Path('plain.bin').read_bytes() == b'bin'
+
+
+def test_execute_many(tmpworkdir):  # pylint: disable=unused-argument
+    """test bounded concurrency execution with per-host delay"""
+
+    module = DummyModule()
+    lock = Lock()
+    barrier = Barrier(3, timeout=10)
+    running = []
+    observed = {'max_running': 0, 'host_overlap': False}
+
+    def execute_mock(cmd, output_file):
+        host, idx = cmd
+        with lock:
+            observed['host_overlap'] |= host in running
+            running.append(host)
+            observed['max_running'] = max(observed['max_running'], len(running))
+        if output_file != 'output-3':
+            # first command for each host must be running concurrently
+            barrier.wait()
+        with lock:
+            running.remove(host)
+        return idx
+
+    with patch.object(module, '_execute', execute_mock):
+        retvals = module._execute_many(  # pylint: disable=protected-access
+            [(f'host{idx % 3}', [f'host{idx % 3}', idx], f'output-{idx}') for idx in range(4)],
+            concurrency=4,
+            delay=0
+        )
+    assert retvals == [0, 1, 2, 3]
+    assert observed['max_running'] == 3
+    assert not observed['host_overlap']
+
+    started = monotonic()
+    retvals = module._execute_many(  # pylint: disable=protected-access
+        [('host', ['true'], f'output-{idx}') for idx in range(2)],
+        concurrency=4,
+        delay=1
+    )
+    assert retvals == [0, 0]
+    assert monotonic() - started >= 1
+
+
 def test_run_with_liveserver(tmpworkdir, live_server, apikey_agent, dummy_target):  # pylint: disable=unused-argument
     """test basic agent's networking codepath; fetch, execute, pack and upload assignment"""
 
@@ -56,3 +166,118 @@ def test_run_with_liveserver(tmpworkdir, live_server, apikey_agent, dummy_target
 
     job = Job.query.filter(Job.queue_id == dummy_target.queue_id).one()
     assert dummy_target.target in file_from_zip(job.output_abspath, 'assignment.json').decode('utf-8')
+
+
+def test_run_gzip_with_liveserver(tmpworkdir, live_server, apikey_agent, dummy_target):  # pylint: disable=unused-argument
+    """test agent uploading gzip encoded output"""
+
+    with patch.dict(DEFAULT_CONFIG, {'UPLOAD_GZIP': True}):
+        result = agent_main([
+            '--server', url_for('index_route', _external=True),
+            '--apikey', apikey_agent,
+            '--queue', Queue.query.get(dummy_target.queue_id).name,
+            '--oneshot',
+        ])
+    assert result == 0
+
+    job = Job.query.filter(Job.queue_id == dummy_target.queue_id).one()
+    assert job.retval == 0
+    assert dummy_target.target in file_from_zip(job.output_abspath, 'assignment.json').decode('utf-8')
+
+
+def test_run_slots_with_liveserver(tmpworkdir, live_server, apikey_agent, dummy_target, target_factory):  # pylint: disable=unused-argument
+    """test multi-slot agent processes assignments in separate slots"""
+
+    target_factory.create(queue=dummy_target.queue, target='target2')
+
+    result = agent_main([
+        '--server', url_for('index_route', _external=True),
+        '--apikey', apikey_agent,
+        '--queue', Queue.query.get(dummy_target.queue_id).name,
+        '--oneshot',
+        '--slots', '2',
+        '--debug',
+    ])
+    assert result == 0
+
+    assert Job.query.filter(Job.queue_id == dummy_target.queue_id, Job.retval == 0).count() == 2
+    assert Path('slot-0').is_dir()
+    assert Path('slot-1').is_dir()
+
+
+def test_signal_slots(tmpworkdir):  # pylint: disable=unused-argument
+    """test signal propagation to running slots"""
+
+    finished = Process(target=sleep, args=(0,))
+    finished.start()
+    finished.join()
+    running = Process(target=sleep, args=(60,))
+    running.start()
+
+    agent = ServerableAgent({**DEFAULT_CONFIG, 'SERVER': 'http://localhost:0'})
+    agent.slot_processes = [finished, running]
+    agent.signal_slots(signal.SIGTERM)
+    running.join(5)
+
+    assert running.exitcode == -signal.SIGTERM
+
+
+def test_run_pipeline_with_liveserver(tmpworkdir, live_server, apikey_agent, dummy_target, target_factory):  # pylint: disable=unused-argument
+    """test prefetching agent releases pending prefetched assignment upon shutdown"""
+
+    queue_id = dummy_target.queue_id
+    target_factory.create(queue=dummy_target.queue, target='target2')
+    config = {
+        **DEFAULT_CONFIG,
+        'SERVER': url_for('index_route', _external=True),
+        'APIKEY': apikey_agent,
+        'PREFETCH': 1
+    }
+    agent = ServerableAgent(config)
+    process_assignment = agent.process_assignment
+
+    def process_and_shutdown(assignment):
+        """wait for prefetch and request shutdown"""
+
+        while not agent.prefetched.full():
+            sleep(0.1)
+        agent.shutdown()
+        return process_assignment(assignment)
+
+    with patch.object(agent, 'process_assignment', process_and_shutdown):
+        assert agent.run() == 0
+
+    assert [job.retval for job in Job.query.filter(Job.queue_id == queue_id).all()] == [0]
+    assert Target.query.filter(Target.queue_id == queue_id).count() == 1
+    assert not list(Path('.').glob('*.zip'))
+    assert SchedulerService.heatmap_check()
+
+
+def test_run_pipeline_wait(tmpworkdir):  # pylint: disable=unused-argument
+    """test pipeline waits for prefetched assignment"""
+
+    agent = ServerableAgent({**DEFAULT_CONFIG, 'SERVER': 'http://localhost:0', 'PREFETCH': 1})
+    assignment = {'id': str(uuid4()), 'config': {'module': 'dummy'}, 'targets': []}
+
+    def delayed_prefetch():
+        """fetch assignment after pipeline wait"""
+
+        sleep(agent.PIPELINE_WAIT * 3)
+        agent.prefetched.put(assignment)
+
+    def process_and_stop(assignment):
+        """process once and stop"""
+
+        agent.loop = False
+        Path(f'{assignment["id"]}.zip').write_bytes(b'output')
+        return 0
+
+    with (
+        patch.object(agent, 'prefetch_assignments', delayed_prefetch),
+        patch.object(agent, 'process_assignment', process_and_stop),
+        patch.object(agent, 'upload_output') as upload_output_mock,
+    ):
+        assert agent.run_pipeline() == 0
+
+    upload_output_mock.assert_called_once_with(assignment['id'], 0, str(Path(f'{assignment["id"]}.zip').absolute()))
+    assert not list(Path('.').glob('*.zip'))
@@ -6,8 +6,10 @@ tests with various server communication test cases
 import multiprocessing
 import os
 import signal
+from base64 import b64encode
 from contextlib import contextmanager
 from http import HTTPStatus
+from pathlib import Path
 from time import sleep
 from unittest.mock import patch
 from uuid import uuid4
@@ -15,7 +17,7 @@ from uuid import uuid4
 from flask import url_for
 
 import sner.agent.core
-from sner.agent.core import main as agent_main
+from sner.agent.core import main as agent_main, ServerableAgent
 from tests.agent import xjsonify
 
 
@@ -44,14 +46,21 @@ class FailServer():
         self.server = server
         self.url = self.server.url_for('/')[:-1]
         self.cnt_assign = 0
+        self.cnt_wait = 0
         self.cnt_output = 0
         self.server.expect_request('/api/v2/scheduler/job/assign').respond_with_handler(self.handler_assign)
-        self.server.expect_request('/api/v2/scheduler/job/output').respond_with_handler(self.handler_output)
+        self.server.expect_request('/api/v2/scheduler/job/output/stream').respond_with_handler(self.handler_output)
 
     def handler_assign(self, request):
         """handle assign request"""
         if request.headers.get('X-API-KEY') != 'dummy':
             return xjsonify({'message': 'unauthorized'})
+        if 'wait' in request.json:
+            # server without long-polling support
+            self.cnt_wait += 1
+            response = xjsonify({'message': 'unprocessable entity'})
+            response.status_code = HTTPStatus.UNPROCESSABLE_ENTITY
+            return response
         if self.cnt_assign < 2:
             self.cnt_assign += 1
             return xjsonify({'invalid': 'assignment'})
@@ -79,10 +88,11 @@ def test_fail_server_communication(tmpworkdir, httpserver):  # pylint: disable=u
 
     # backoff_time is configurable via config, but since test is running in
     # tempdir is easier to patch the module instead of mocking config
-    with patch.dict(sner.agent.core.DEFAULT_CONFIG, {'BACKOFF_TIME': 0.1}):
+    with patch.dict(sner.agent.core.DEFAULT_CONFIG, {'BACKOFF_TIME': 0.1, 'ASSIGN_WAIT': 30}):
         with terminate_after(1):
             agent_main(['--server', sserver.url, '--apikey', 'dummy', '--debug'])
 
+    assert sserver.cnt_wait == 1
     assert sserver.cnt_assign > 1
     assert sserver.cnt_output > 1
 
@@ -111,3 +121,34 @@ def test_invalid_server_oneshot(tmpworkdir):  # pylint: disable=unused-argument,
 
     result = agent_main(['--server', 'http://localhost:0', '--debug', '--oneshot'])
     assert result == 1
+
+
+def test_upload_output_json_fallback(tmpworkdir, httpserver):  # pylint: disable=unused-argument,redefined-outer-name
+    """test output upload fallback for servers without streaming upload support"""
+
+    httpserver.expect_request('/api/v2/scheduler/job/output/stream').respond_with_data('not found', status=HTTPStatus.NOT_FOUND)
+    httpserver.expect_request('/api/v2/scheduler/job/output', method='POST').respond_with_json({'message': 'success'})
+    Path('output.zip').write_bytes(b'output data')
+
+    agent = ServerableAgent({**sner.agent.core.DEFAULT_CONFIG, 'SERVER': httpserver.url_for('/')[:-1], 'APIKEY': 'dummy'})
+    agent.upload_output('dummy-id', 1, 'output.zip')
+    agent.upload_output('dummy-id', 1, 'output.zip')
+
+    assert not agent.upload_stream
+    assert [request.path for request, _ in httpserver.log].count('/api/v2/scheduler/job/output/stream') == 1
+    assert httpserver.log[-1][0].json == {'id': 'dummy-id', 'retval': 1, 'output': b64encode(b'output data').decode()}
+
+
+def test_release_assignment(httpserver):  # pylint: disable=redefined-outer-name
+    """test release assignment retries on error and gives up on servers without release support"""
+
+    httpserver.expect_ordered_request('/api/v2/scheduler/job/release').respond_with_data('busy', status=HTTPStatus.TOO_MANY_REQUESTS)
+    httpserver.expect_ordered_request('/api/v2/scheduler/job/release').respond_with_json({'message': 'success'})
+    httpserver.expect_ordered_request('/api/v2/scheduler/job/release').respond_with_data('not found', status=HTTPStatus.NOT_FOUND)
+
+    agent = ServerableAgent({**sner.agent.core.DEFAULT_CONFIG, 'SERVER': httpserver.url_for('/')[:-1], 'APIKEY': 'dummy', 'BACKOFF_TIME': 0.1})
+    agent.release_assignment('dummy-id')
+    agent.release_assignment('dummy-id')
+
+    assert len(httpserver.log) == 3
+    assert httpserver.log[0][0].json == {'id': 'dummy-id'}
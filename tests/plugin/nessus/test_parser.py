@@ -27,3 +27,16 @@ def test_parse_path():
     assert [x.address for x in pidb.hosts] == expected_hosts
     assert [x.xtype for x in pidb.vulns] == expected_vulns
     assert 'Upgrade to PHP version 5.6.32 or later.' in pidb.vulns.where(xtype='nessus.104631')[0].descr
+
+
+def test_parse_path_batches():
+    """check parse_path_batches impl"""
+
+    batches = list(ParserModule.parse_path_batches('tests/server/data/parser-nessus-simple.xml', 1))
+
+    assert len(batches) == 2
+    assert [x.xtype for batch in batches for x in batch.vulns] == ['nessus.104631', 'nessus.19506']
+    assert all(len(batch.hosts) == 1 for batch in batches)
+
+    batches = list(ParserModule.parse_path_batches('tests/server/data/parser-nessus-simple.xml', 3))
+    assert [len(batch.vulns) for batch in batches] == [2]
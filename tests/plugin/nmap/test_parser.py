@@ -3,6 +3,8 @@
 nmap output parser tests
 """
 
+from pathlib import Path
+
 import pytest
 from libnmap.parser import NmapParserException
 
@@ -18,6 +20,27 @@ def test_xxe():
         ParserModule.parse_path('tests/server/data/parser-nmap-xxe.xml')
 
 
+def test_truncated(tmp_path):
+    """check if parser raises exception on truncated input"""
+
+    data = Path('tests/server/data/parser-nmap-output.xml').read_bytes()
+    truncated_path = tmp_path / 'output.xml'
+    truncated_path.write_bytes(data[:data.index(b'</host>')])
+
+    with pytest.raises(NmapParserException):
+        ParserModule.parse_path(truncated_path)
+
+
+def test_not_nmap(tmp_path):
+    """check if parser raises exception on non-nmap xml input"""
+
+    xml_path = tmp_path / 'output.xml'
+    xml_path.write_text('<report><host><address addr="127.0.0.1" addrtype="ipv4"/></host></report>', encoding='utf-8')
+
+    with pytest.raises(NmapParserException, match='not an nmap report'):
+        ParserModule.parse_path(xml_path)
+
+
 def test_parse_path():
     """check basic parse_path impl"""
 
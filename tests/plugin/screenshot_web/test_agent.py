@@ -4,10 +4,18 @@ screenshot_web plugin agent tests
 """
 
 import json
+from pathlib import Path
+from unittest.mock import patch
 from uuid import uuid4
+from zipfile import ZipFile, ZIP_STORED
+
+import pytest
+from selenium import webdriver
+from selenium.common.exceptions import TimeoutException, WebDriverException
 
 from sner.agent.core import main as agent_main
 from sner.lib import file_from_zip
+from sner.plugin.screenshot_web.agent import AgentModule, BrowserPool
 
 
 class ScreenshotServer():
@@ -39,3 +47,122 @@ def test_basic(tmpworkdir, httpserver):  # pylint: disable=unused-argument
     results = json.loads(file_from_zip(f'{test_a["id"]}.zip', 'results.json'))
     assert results
     assert file_from_zip(f'{test_a["id"]}.zip', list(results.keys())[0])
+
+
+class FakeDriver():
+    """selenium webdriver stand-in"""
+
+    def __init__(self, **kwargs):  # pylint: disable=unused-argument
+        self.url = None
+        self.running = True
+
+    def set_window_size(self, width, height):
+        """set window size"""
+
+    def set_page_load_timeout(self, timeout):
+        """set page timeout"""
+
+    def get(self, url):
+        """load page"""
+
+        if 'timeout' in url:
+            raise TimeoutException()
+        if 'crash' in url:
+            raise WebDriverException()
+        self.url = url
+
+    def save_screenshot(self, path):
+        """save screenshot"""
+
+        Path(path).write_bytes(b'png')
+        return True
+
+    def quit(self):
+        """quit browser"""
+
+        self.running = False
+
+
+def test_browser_pool(tmpworkdir):  # pylint: disable=unused-argument
+    """screenshot_web browser pool test"""
+
+    test_a = {
+        'id': str(uuid4()),
+        'config': {'module': 'screenshot_web', 'delay': 0, 'geometry': '640,480', 'browsers': 2, 'timeout': 5},
+        'targets': ['http://localhost:1/a', 'http://localhost:1/b', 'http://localhost:1/timeout', 'http://localhost:1/crash']
+    }
+
+    with patch.object(webdriver, 'Firefox', FakeDriver), \
+            patch.object(AgentModule, 'screenshot_oneshot', lambda self, url, path, geometry, timeout: Path(path).write_bytes(b'oneshot')):
+        result = agent_main(['--assignment', json.dumps(test_a)])
+    assert result == 0
+
+    results = json.loads(file_from_zip(f'{test_a["id"]}.zip', 'results.json'))
+    assert len(results) == 4
+    screenshots = {item['target']: file_from_zip(f'{test_a["id"]}.zip', path) for path, item in results.items()}
+    assert screenshots['http://localhost:1/timeout'] == b'png'
+    assert screenshots['http://localhost:1/crash'] == b'oneshot'
+
+    with ZipFile(f'{test_a["id"]}.zip') as output_zip:
+        assert output_zip.getinfo(list(results.keys())[0]).compress_type == ZIP_STORED
+
+
+def test_browser_pool_unavailable(tmpworkdir):  # pylint: disable=unused-argument
+    """screenshot_web fallback to one-shot browser test"""
+
+    test_a = {
+        'id': str(uuid4()),
+        'config': {'module': 'screenshot_web', 'delay': 0, 'geometry': '640,480', 'browsers': 1},
+        'targets': ['http://localhost:1/a']
+    }
+
+    with patch.object(webdriver, 'Firefox', side_effect=WebDriverException('no driver')), \
+            patch.object(AgentModule, 'screenshot_oneshot', lambda self, url, path, geometry, timeout: Path(path).write_bytes(b'oneshot')):
+        result = agent_main(['--assignment', json.dumps(test_a)])
+    assert result == 0
+
+    results = json.loads(file_from_zip(f'{test_a["id"]}.zip', 'results.json'))
+    assert file_from_zip(f'{test_a["id"]}.zip', list(results.keys())[0]) == b'oneshot'
+
+
+def test_browser_pool_closed(tmpworkdir):  # pylint: disable=unused-argument
+    """screenshot_web closed browser pool does not start replacement browsers"""
+
+    started = []
+    pool = None
+
+    def fake_firefox(**kwargs):
+        if started:
+            # terminate closes the pool while replacement browser is starting
+            pool.close()
+        started.append(FakeDriver(**kwargs))
+        return started[-1]
+
+    with patch.object(webdriver, 'Firefox', fake_firefox):
+        pool = BrowserPool(1, '640,480', 5)
+        assert not pool.screenshot('http://localhost:1/crash', Path('shot.png'))
+
+    assert len(started) == 2
+    assert not any(driver.running for driver in started)
+    assert not pool.started
+
+    with patch.dict('sys.modules', {'selenium.common.exceptions': None}):
+        with pytest.raises(RuntimeError, match='selenium not available'):
+            BrowserPool(1, '640,480', 5)
+
+
+def test_screenshot_oneshot(tmpworkdir):  # pylint: disable=unused-argument
+    """screenshot_web one-shot browser test"""
+
+    def fake_execute(cmd, output_file):  # pylint: disable=unused-argument
+        assert Path(cmd[cmd.index('--profile') + 1]).is_dir()
+        Path(cmd[cmd.index('--screenshot') + 1]).write_bytes(b'oneshot')
+        return 0
+
+    module = AgentModule()
+    with patch.object(module, '_execute', side_effect=fake_execute) as execute_mock:
+        module.screenshot_oneshot('http://localhost:1/a', Path('shot.png'), '640,480', 5)
+
+    assert execute_mock.call_args.args[0][:3] == ['timeout', '5', 'firefox']
+    assert Path('shot.png').read_bytes() == b'oneshot'
+    assert not Path('shot.profile').exists()
@@ -4,10 +4,16 @@ six_dns_discover plugin agent test
 """
 
 import json
+from threading import Barrier, Event
+from unittest.mock import Mock, patch
 from uuid import uuid4
 
+import pytest
+
+import sner.plugin.six_dns_discover.agent
 from sner.agent.core import main as agent_main
 from sner.lib import file_from_zip
+from sner.plugin.six_dns_discover.agent import TokenBucket
 
 
 def test_basic(tmpworkdir):  # pylint: disable=unused-argument
@@ -25,3 +31,58 @@ def test_basic(tmpworkdir):  # pylint: disable=unused-argument
     result = agent_main(['--assignment', json.dumps(test_a), '--debug'])
     assert result == 0
     assert '::1' in json.loads(file_from_zip(f'{test_a["id"]}.zip', 'output.json').decode('utf-8'))
+
+
+def test_concurrency(tmpworkdir):  # pylint: disable=unused-argument
+    """six_dns_discover in-flight queries, rate limit and timeout test against stub resolver"""
+
+    # all resolvable queries must be in flight at once, timed out query blocks until test end
+    barrier = Barrier(8, timeout=10)
+    blocked = Event()
+
+    def stub_gethostbyaddr(addr):
+        if addr == '192.0.2.99':
+            blocked.wait()
+        if addr == '192.0.2.98':
+            raise OSError('not found')
+        barrier.wait()
+        return f'host-{addr}.example.com', [], [addr]
+
+    def stub_getaddrinfo(hostname, port, family):  # pylint: disable=unused-argument
+        suffix = hostname.split('.')[-3]
+        return [(family, None, None, '', (f'2001:db8::{suffix}', 0, 0, 0))]
+
+    test_a = {
+        'id': str(uuid4()),
+        'config': {'module': 'six_dns_discover', 'delay': 0, 'rate': 20, 'concurrency': 10, 'timeout': 1},
+        'targets': [f'192.0.2.{idx}' for idx in range(1, 9)] + ['192.0.2.98', '192.0.2.99']
+    }
+
+    try:
+        with patch.object(sner.plugin.six_dns_discover.agent, 'gethostbyaddr', stub_gethostbyaddr), \
+                patch.object(sner.plugin.six_dns_discover.agent, 'getaddrinfo', stub_getaddrinfo):
+            result = agent_main(['--assignment', json.dumps(test_a), '--debug'])
+        # agent finished while timed out query is still blocked
+        assert not blocked.is_set()
+    finally:
+        blocked.set()
+    assert result == 0
+
+    output = json.loads(file_from_zip(f'{test_a["id"]}.zip', 'output.json').decode('utf-8'))
+    assert len(output) == 8
+    assert output['2001:db8::1'] == ['host-192.0.2.1.example.com', '192.0.2.1']
+
+
+def test_token_bucket():
+    """token bucket rate limit test"""
+
+    clock = Mock(return_value=100.0)
+    with patch.object(sner.plugin.six_dns_discover.agent, 'monotonic', clock):
+        bucket = TokenBucket(10)
+        assert [bucket.reserve() for _ in range(3)] == pytest.approx([0, 0.1, 0.2])
+
+        clock.return_value = 100.5
+        assert bucket.reserve() == 0
+        assert bucket.reserve() == pytest.approx(0.1)
+
+    assert TokenBucket(0).reserve() == 0
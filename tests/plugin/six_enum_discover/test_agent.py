@@ -5,6 +5,7 @@ six_enum_discover plugin agent tests
 
 import json
 import os
+from collections import namedtuple
 from socket import AF_INET6
 from uuid import uuid4
 
@@ -13,7 +14,7 @@ from pyroute2 import NDB
 
 from sner.agent.core import main as agent_main
 from sner.lib import file_from_zip
-from sner.plugin.six_enum_discover.agent import AgentModule
+from sner.plugin.six_enum_discover.agent import AgentModule, PrefixIndex
 
 
 def test_basic(tmpworkdir):  # pylint: disable=unused-argument
@@ -46,6 +47,31 @@ def test_agent_enumeratetargets():
     assert targets == [(0, '::1'), (1, '::1-2'), (2, '::01')]
 
 
+def test_prefixindex():
+    """six_enum_discover local prefixes index test"""
+
+    record = namedtuple('record', ['ifname', 'address', 'prefixlen'])
+    index = PrefixIndex([
+        record('eth0', '192.0.2.2', 24),
+        record('eth0', '2001:db8::1', 32),
+        record('eth1', '2001:db8:aa::1', 64),
+        record('lo', '::1', 128),
+    ])
+
+    assert index.match('2001:db8:aa::ff') == 'eth1'
+    assert index.match('2001:db8:bb::ff') == 'eth0'
+    assert index.match('2001:db9::1') is None
+    assert index.match('192.0.2.99') == 'eth0'
+
+
+def test_local_prefixes():
+    """six_enum_discover local prefixes cache test"""
+
+    prefixes = AgentModule.local_prefixes(300)
+    assert AgentModule.local_prefixes(300) is prefixes
+    assert AgentModule.local_prefixes(0) is not prefixes
+
+
 @pytest.mark.skipif('PYTEST_IPV6' not in os.environ, reason='ipv6 requires global connectivity')
 def test_enum_simple(tmpworkdir):  # pylint: disable=unused-argument
     """
@@ -4,6 +4,8 @@ api.views tests
 """
 
 import base64
+import gzip
+import hashlib
 from http import HTTPStatus
 from ipaddress import ip_network
 from pathlib import Path
@@ -35,6 +37,11 @@ def test_v2_scheduler_job_assign_route(client, api_agent, target):
     assert response.status_code == HTTPStatus.OK
     assert not response.json
 
+    # long-polling request, nowork without scheduler cache is answered immediately
+    response = api_agent.post_json(url_for('api.v2_scheduler_job_assign_route'), {'queue': 'notexist', 'wait': 10})
+    assert response.status_code == HTTPStatus.OK
+    assert not response.json
+
     # attempt without credentials
     response = client.post_json(url_for('api.v2_scheduler_job_assign_route'), status='*')
     assert response.status_code == HTTPStatus.UNAUTHORIZED
@@ -189,6 +196,120 @@ def test_v2_scheduler_job_output_route_locked(api_agent, job):
     assert response.status_code == HTTPStatus.TOO_MANY_REQUESTS
 
 
+def test_v2_scheduler_job_output_stream_route(api_agent, job):
+    """job output stream route test"""
+
+    data = b'a-test-file-contents'
+    response = api_agent.post(
+        url_for('api.v2_scheduler_job_output_stream_route', id=job.id, retval=12345, sha256=hashlib.sha256(data).hexdigest()),
+        data,
+        content_type='application/octet-stream'
+    )
+    assert response.status_code == HTTPStatus.OK
+    assert job.retval == 12345
+    assert Path(job.output_abspath).read_bytes() == data
+    assert [x.name for x in Path(job.output_abspath).parent.iterdir()] == [job.id]
+
+
+def test_v2_scheduler_job_output_stream_route_gzip(api_agent, job):
+    """job output stream route test gzip encoded body"""
+
+    data = b'a-test-file-contents'
+    response = api_agent.post(
+        url_for('api.v2_scheduler_job_output_stream_route', id=job.id, retval=0, sha256=hashlib.sha256(data).hexdigest()),
+        gzip.compress(data),
+        headers={'Content-Encoding': 'gzip'},
+        content_type='application/octet-stream'
+    )
+    assert response.status_code == HTTPStatus.OK
+    assert Path(job.output_abspath).read_bytes() == data
+
+
+def test_v2_scheduler_job_output_stream_route_gzip_invalid(api_agent, job):
+    """job output stream route test corrupted and oversized gzip encoded body"""
+
+    data = b'a' * 1024
+    url = url_for('api.v2_scheduler_job_output_stream_route', id=job.id, retval=0, sha256=hashlib.sha256(data).hexdigest())
+
+    response = api_agent.post(url, b'not-gzip-data', headers={'Content-Encoding': 'gzip'}, content_type='application/octet-stream', status='*')
+    assert response.status_code == HTTPStatus.BAD_REQUEST
+
+    current_app.config['SNER_SCHEDULER_OUTPUT_MAX_SIZE'] = 100
+    response = api_agent.post(url, gzip.compress(data), headers={'Content-Encoding': 'gzip'}, content_type='application/octet-stream', status='*')
+    assert response.status_code == HTTPStatus.BAD_REQUEST
+
+    assert job.retval is None
+    assert not list(Path(job.output_abspath).parent.iterdir())
+
+
+def test_v2_scheduler_job_output_stream_route_invalidrequest(api_agent, job):
+    """job output stream route test invalid and discarded requests"""
+
+    data = b'a-test-file-contents'
+
+    response = api_agent.post(url_for('api.v2_scheduler_job_output_stream_route', id=job.id), data, status='*')
+    assert response.status_code == HTTPStatus.UNPROCESSABLE_ENTITY
+
+    response = api_agent.post(
+        url_for('api.v2_scheduler_job_output_stream_route', id=job.id, retval=1, sha256=hashlib.sha256(b'other').hexdigest()),
+        data,
+        status='*'
+    )
+    assert response.status_code == HTTPStatus.BAD_REQUEST
+    assert job.retval is None
+    assert not list(Path(job.output_abspath).parent.iterdir())
+
+    response = api_agent.post(
+        url_for(
+            'api.v2_scheduler_job_output_stream_route',
+            id='aaaaaaaa-aaaa-aaaa-aaaa-aaaaaaaaaaaa',
+            retval=1,
+            sha256=hashlib.sha256(data).hexdigest()
+        ),
+        data
+    )
+    assert response.json['message'] == 'discard job'
+
+
+def test_v2_scheduler_job_output_stream_route_locked(api_agent, job):
+    """job output stream route test locked"""
+
+    data = b'a-test-file-contents'
+
+    db.session.commit()
+    with create_engine(current_app.config['SQLALCHEMY_DATABASE_URI']).connect() as conn:
+        conn.execute(select(func.pg_advisory_lock(SCHEDULER_LOCK_NUMBER)))
+
+        with patch.object(sner.server.scheduler.core.SchedulerService, 'TIMEOUT_JOB_OUTPUT', 1):
+            response = api_agent.post(
+                url_for('api.v2_scheduler_job_output_stream_route', id=job.id, retval=1, sha256=hashlib.sha256(data).hexdigest()),
+                data,
+                status='*'
+            )
+
+        conn.execute(select(func.pg_advisory_unlock(SCHEDULER_LOCK_NUMBER)))
+
+    assert response.status_code == HTTPStatus.TOO_MANY_REQUESTS
+    assert not list(Path(job.output_abspath).parent.iterdir())
+
+
+def test_v2_scheduler_job_output_stream_route_error(api_agent, job):
+    """job output stream route test staged output cleanup on error"""
+
+    data = b'a-test-file-contents'
+
+    with patch.object(sner.server.api.views.SchedulerService, 'job_output', side_effect=RuntimeError('job output failed')):
+        response = api_agent.post(
+            url_for('api.v2_scheduler_job_output_stream_route', id=job.id, retval=1, sha256=hashlib.sha256(data).hexdigest()),
+            data,
+            content_type='application/octet-stream',
+            status='*'
+        )
+
+    assert response.status_code == HTTPStatus.INTERNAL_SERVER_ERROR
+    assert not list(Path(job.output_abspath).parent.iterdir())
+
+
 def test_v2_scheduler_job_lifecycle_with_heatmap(api_agent, queue, target_factory):
     """job assign route test"""
 
@@ -222,6 +343,45 @@ def test_v2_scheduler_job_lifecycle_with_heatmap(api_agent, queue, target_factor
     assert len(Job.query.all()) == 1
 
 
+def test_v2_scheduler_job_release_route(api_agent, queue, target_factory):
+    """job release route test"""
+
+    current_app.config['SNER_HEATMAP_HOT_LEVEL'] = 1
+    target_factory.create(queue=queue, target='127.0.0.1', hashval=SchedulerService.hashval('127.0.0.1'))
+    target_factory.create(queue=queue, target='127.0.0.2', hashval=SchedulerService.hashval('127.0.0.2'))
+
+    assignment = api_agent.post_json(url_for('api.v2_scheduler_job_assign_route')).json
+    assert len(Readynet.query.all()) == 0
+
+    response = api_agent.post_json(url_for('api.v2_scheduler_job_release_route'), {'id': assignment['id']})
+    assert response.json['message'] == 'success'
+
+    assert sorted(x.target for x in Target.query.all()) == ['127.0.0.1', '127.0.0.2']
+    assert len(Readynet.query.all()) == 1
+    assert len(Job.query.all()) == 0
+    assert SchedulerService.heatmap_check()
+
+    response = api_agent.post_json(url_for('api.v2_scheduler_job_release_route'), {'id': assignment['id']})
+    assert response.json['message'] == 'discard job'
+    assert len(Target.query.all()) == 2
+
+
+def test_v2_scheduler_job_release_route_locked(api_agent, job):
+    """job release route test locked"""
+
+    db.session.commit()
+    with create_engine(current_app.config['SQLALCHEMY_DATABASE_URI']).connect() as conn:
+        conn.execute(select(func.pg_advisory_lock(SCHEDULER_LOCK_NUMBER)))
+
+        with patch.object(sner.server.scheduler.core.SchedulerService, 'TIMEOUT_JOB_OUTPUT', 1):
+            response = api_agent.post_json(url_for('api.v2_scheduler_job_release_route'), {'id': job.id}, status='*')
+
+        conn.execute(select(func.pg_advisory_unlock(SCHEDULER_LOCK_NUMBER)))
+
+    assert response.status_code == HTTPStatus.TOO_MANY_REQUESTS
+    assert Job.query.get(job.id)
+
+
 def test_v2_stats_prometheus_route(client, queue):  # pylint: disable=unused-argument
     """job prometheus stats route test"""
 
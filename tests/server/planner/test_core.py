@@ -7,12 +7,14 @@ import logging
 import os
 from ipaddress import ip_address
 from pathlib import Path
+from unittest.mock import patch
 
 import pytest
 import yaml
 
 from sner.server.extensions import db
 from sner.server.planner.core import (
+    DrainPool,
     DummyStage,
     filter_external_hosts,
     filter_tarpits,
@@ -28,7 +30,7 @@ from sner.server.planner.core import (
     StorageLoader,
     StorageRescan
 )
-from sner.server.scheduler.core import SchedulerService
+from sner.server.scheduler.core import JobManager, SchedulerService
 from sner.server.scheduler.models import Job, Target
 from sner.server.storage.models import Host, Note, Service
 from sner.server.utils import yaml_dump
@@ -81,6 +83,13 @@ def test_netlistenum(app):  # pylint: disable=unused-argument
     assert dummy.task_count == 1
     assert dummy.task_args == ['127.0.0.0', '127.0.0.1']
 
+    dummy = DummyStage()
+    with patch.object(NetlistEnum, 'CHUNK_SIZE', 3):
+        NetlistEnum('0s', ['127.0.0.0/30', '127.0.1.0/31'], [dummy]).run()
+
+    assert dummy.task_count == 2
+    assert dummy.task_args == ['127.0.0.3', '127.0.1.0', '127.0.1.1']
+
 
 def test_storagesixenum(app, host_factory):  # pylint: disable=unused-argument
     """test StorageSixEnum"""
@@ -153,6 +162,62 @@ def test_storageloader_invalidjobs(app, queue_factory, job_completed_factory):
     assert Job.query.count() == 1
 
 
+def test_queuehandler_parallel_drain(app, queue_factory, job_completed_factory):  # pylint: disable=unused-argument
+    """test QueueHandler parallel drain"""
+
+    queue = queue_factory.create(name='test queue', config=yaml_dump({'module': 'dummy'}))
+    job_completed_factory.create(queue=queue, make_output=Path('tests/server/data/parser-dummy-job.zip').read_bytes())
+    job = job_completed_factory.create(queue=queue, make_output=Path('tests/server/data/parser-dummy-job-invalidjson.zip').read_bytes())
+    job_completed_factory.create(queue=queue, make_output=Path('tests/server/data/parser-dummy-job.zip').read_bytes())
+    assert Job.query.count() == 3
+
+    drain_pool = DrainPool(2)
+    dummy = DummyStage()
+    SixDisco(queue.name, dummy, drain_pool=drain_pool).run()
+    executor = drain_pool.executor
+
+    assert dummy.task_count == 2
+    assert job.retval == 1000
+    assert Job.query.count() == 1
+
+    # pool is reused by subsequent drains
+    job_completed_factory.create(queue=queue, make_output=Path('tests/server/data/parser-dummy-job.zip').read_bytes())
+    job_completed_factory.create(queue=queue, make_output=Path('tests/server/data/parser-dummy-job.zip').read_bytes())
+    SixDisco(queue.name, dummy, drain_pool=drain_pool).run()
+    assert drain_pool.executor is executor
+    assert dummy.task_count == 4
+
+    drain_pool.shutdown()
+    assert drain_pool.executor is None
+
+
+def parse_output_or_crash(module, path):  # pylint: disable=inconsistent-return-statements
+    """parse job output, parser failure crashes the worker process"""
+
+    try:
+        return JobManager.parse_output(module, path)
+    except Exception:  # pylint: disable=broad-except
+        os._exit(1)  # pylint: disable=protected-access
+
+
+def test_queuehandler_parallel_drain_broken_pool(app, queue_factory, job_completed_factory):  # pylint: disable=unused-argument
+    """test QueueHandler parallel drain fails only the job crashing the worker"""
+
+    queue = queue_factory.create(name='test queue', config=yaml_dump({'module': 'dummy'}))
+    job_completed_factory.create(queue=queue, make_output=Path('tests/server/data/parser-dummy-job.zip').read_bytes())
+    job = job_completed_factory.create(queue=queue, make_output=Path('tests/server/data/parser-dummy-job-invalidjson.zip').read_bytes())
+    job_completed_factory.create(queue=queue, make_output=Path('tests/server/data/parser-dummy-job.zip').read_bytes())
+
+    drain_pool = DrainPool(2, parse_output_or_crash)
+    dummy = DummyStage()
+    SixDisco(queue.name, dummy, drain_pool=drain_pool).run()
+    drain_pool.shutdown()
+
+    assert dummy.task_count == 2
+    assert job.retval == 1000
+    assert Job.query.count() == 1
+
+
 def test_queuehandler_nxqueue(app, job_completed_nmap):  # pylint: disable=unused-argument
     """test exception handling"""
 
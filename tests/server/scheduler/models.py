@@ -63,6 +63,7 @@ class JobFactory(BaseModelFactory):  # pylint: disable=too-few-public-methods
     id = LazyAttribute(lambda x: str(uuid4()))
     queue = SubFactory(QueueFactory)
     assignment = json.dumps({'module': 'dummy', 'targets': ['1', '2']})
+    hashvals = LazyAttribute(lambda x: SchedulerService.hashvals(json.loads(x.assignment)['targets']))
     retval = None
     time_start = datetime.now()
     time_end = None
@@ -75,8 +76,8 @@ class JobFactory(BaseModelFactory):  # pylint: disable=too-few-public-methods
             return
 
         SchedulerService.get_lock()
-        for target in json.loads(self.assignment)['targets']:
-            SchedulerService.heatmap_put(SchedulerService.hashval(target))
+        SchedulerService.heatmap_put(self.hashvals)
+        db.session.commit()
         SchedulerService.release_lock()
 
 
@@ -0,0 +1,108 @@
+# This file is part of sner4 project governed by MIT license, see the LICENSE.txt file.
+"""
+scheduler cache tests
+"""
+
+from threading import Timer
+from time import sleep
+from unittest.mock import patch
+
+import pytest
+from flask import current_app
+
+from sner.server.extensions import db
+from sner.server.scheduler.cache import get_cache
+from sner.server.scheduler.core import QueueManager, SchedulerService
+from sner.server.scheduler.models import Job, Queue
+
+
+def wait_for_invalidation(scheduler_cache, timeout=3):
+    """wait until listener thread invalidates cached state"""
+
+    for _ in range(timeout*10):
+        if scheduler_cache.listening and scheduler_cache.queues is None:
+            return
+        sleep(0.1)
+
+
+@pytest.fixture
+def cache(app):  # pylint: disable=unused-argument
+    """enabled scheduler cache, listener thread is stopped on teardown"""
+
+    current_app.config['SNER_SCHEDULER_CACHE'] = True
+    tmp_cache = get_cache()
+    wait_for_invalidation(tmp_cache)
+    yield tmp_cache
+    tmp_cache.stop()
+
+
+def test_get_cache(app):  # pylint: disable=unused-argument
+    """test cache is optional"""
+
+    assert not get_cache()
+
+
+def test_scheduler_cache(cache, queue):  # pylint: disable=redefined-outer-name
+    """test nowork answered from cache and invalidation by notifications"""
+
+    assert get_cache() is cache
+
+    assert cache.has_work(None, []) is False
+    with patch.object(SchedulerService, 'get_lock', side_effect=AssertionError('database touched')):
+        assert not SchedulerService.job_assign(None, [])
+
+    QueueManager.enqueue(queue, ['127.0.0.1'])
+    wait_for_invalidation(cache)
+    assert cache.has_work(queue.name, []) is True
+    assert cache.has_work('notexist', []) is False
+
+    queue.reqs = ['cap1']
+    db.session.commit()
+    wait_for_invalidation(cache)
+    assert cache.has_work(None, []) is False
+    assert cache.has_work(None, ['cap1', 'cap2']) is True
+
+    assignment = SchedulerService.job_assign(None, ['cap1'])
+    assert assignment
+    wait_for_invalidation(cache)
+    assert cache.has_work(None, ['cap1']) is False
+
+    SchedulerService.job_output(Job.query.get(assignment['id']), 0, b'')
+    assert cache.has_work(None, ['cap1']) is False
+
+    cache.stop()
+    assert cache.has_work(None, []) is None
+
+
+def test_scheduler_cache_wait_for_work(app, cache, queue):  # pylint: disable=redefined-outer-name
+    """test long-polling waiter woken up by notifications"""
+
+    queue_id, queue_name = queue.id, queue.name
+
+    assert cache.wait_for_work(None, [], 0.1) is False
+
+    def enqueue():
+        with app.app_context():
+            QueueManager.enqueue(Queue.query.get(queue_id), ['127.0.0.1'])
+
+    Timer(0.5, enqueue).start()
+    assert cache.wait_for_work(queue_name, [], 10) is True
+    assert SchedulerService.job_assign(queue_name, [], 1)
+
+
+def test_scheduler_cache_reload_race(cache, queue):  # pylint: disable=redefined-outer-name
+    """test snapshot invalidated during reload is used but not cached"""
+
+    QueueManager.enqueue(queue, ['127.0.0.1'])
+    wait_for_invalidation(cache)
+
+    original_execute = db.session.execute
+
+    def execute_and_invalidate(*args, **kwargs):
+        result = original_execute(*args, **kwargs)
+        cache.invalidate()
+        return result
+
+    with patch.object(db.session, 'execute', execute_and_invalidate):
+        assert cache.has_work(queue.name, []) is True
+    assert cache.queues is None
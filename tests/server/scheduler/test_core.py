@@ -3,30 +3,42 @@
 scheduler core tests
 """
 
+import json
 from ipaddress import ip_address, ip_network
 from pathlib import Path
+from unittest.mock import patch
+from zipfile import ZipFile
 
 import pytest
 import yaml
 from flask import current_app
+from sqlalchemy import create_engine, func, select
 
+import sner.lib
 from sner.server.extensions import db
-from sner.server.scheduler.core import enumerate_network, ExclMatcher, QueueManager, SchedulerService, sixenum_target_boundaries
-from sner.server.scheduler.models import Heatmap, Job, Readynet
+from sner.server.parser import dump_preparsed, ParsedItemsDb, PREPARSED_FILENAME
+from sner.server.scheduler.core import (
+    ENQUEUE_STAGING,
+    enumerate_network,
+    ExclMatcher,
+    JobManager,
+    QueueManager,
+    SCHEDULER_LOCK_NUMBER,
+    SchedulerService,
+    SchedulerServiceBusyException,
+    sixenum_target_boundaries
+)
+from sner.server.scheduler.models import Heatmap, Job, Readynet, Target
 
 
 def test_enumerate_network():
     """check enumerate_network"""
 
-    assert len(enumerate_network('127.0.1.123')) == 1
-    assert len(enumerate_network('127.0.1.123/32')) == 1
-
-    output = enumerate_network('127.0.2.0/31')
-    assert len(output) == 2
-    assert '127.0.2.0' in output
-    assert '127.0.2.0' in output
-
-    assert 'fe80::1:3' in enumerate_network('fe80::1:0/126')
+    assert list(enumerate_network('127.0.1.123')) == ['127.0.1.123']
+    assert list(enumerate_network('127.0.1.123/32')) == ['127.0.1.123']
+    assert list(enumerate_network('127.0.2.0/31')) == ['127.0.2.0', '127.0.2.1']
+    assert list(enumerate_network('127.0.2.0/30')) == ['127.0.2.0', '127.0.2.1', '127.0.2.2', '127.0.2.3']
+    assert list(enumerate_network('fe80::1:0/126')) == ['fe80::1:0', 'fe80::1:1', 'fe80::1:2', 'fe80::1:3']
 
 
 def test_sixenum_target_boundaries():
@@ -77,6 +89,53 @@ def test_excl_matcher(app):  # pylint: disable=unused-argument
         repr(item)
 
 
+def test_excl_matcher_index(app):  # pylint: disable=unused-argument
+    """test matcher index with overlapping and adjacent exclusions"""
+
+    matcher = ExclMatcher(
+        [['network', f'10.0.{idx}.0/24'] for idx in range(0, 200, 2)]
+        + [['network', '10.0.1.0/24'], ['network', '10.0.0.0/23'], ['network', '10.1.0.0/16'], ['network', '::1/128']]
+        + [['regex', 'notarget1'], ['regex', '^other']]
+    )
+
+    assert matcher.match('10.0.1.255')
+    assert matcher.match('10.0.198.1')
+    assert not matcher.match('10.0.3.1')
+    assert not matcher.match('10.0.201.1')
+    assert not matcher.match('9.255.255.255')
+    assert matcher.match('10.1.255.255')
+    assert not matcher.match('10.2.0.0')
+    assert not matcher.match('::ffff:10.0.0.1')
+    assert matcher.match('udp://[::1]:53')
+    assert matcher.match('sixenum://::0-ffff')
+    assert not matcher.match('sixenum://::1:0-ffff')
+    assert not matcher.match('sixenum://invalid')
+    assert matcher.match('other')
+    assert not matcher.match('another')
+
+
+def test_excl_matcher_regex(app):  # pylint: disable=unused-argument
+    """test regex matcher with expressions not combinable into single alternation"""
+
+    matcher = ExclMatcher([
+        ['regex', 'notarget1'],
+        ['regex', '(?i)^tcp://.*:22$'],
+        ['regex', '^(?P<proto>tcp)://a'],
+        ['regex', '^(?P<proto>udp)://b'],
+        ['regex', r'^(x)\1$'],
+        ['regex', r'^(y)\1$'],
+    ])
+
+    assert matcher.match('notarget1')
+    assert matcher.match('TCP://127.0.0.1:22')
+    assert matcher.match('tcp://a')
+    assert matcher.match('udp://b')
+    assert not matcher.match('udp://a')
+    assert matcher.match('xx')
+    assert matcher.match('yy')
+    assert not matcher.match('xy')
+
+
 def test_queuemanager_errorhandling(app, queue):  # pylint: disable=unused-argument
     """test QueuemaManger error handling"""
 
@@ -88,6 +147,109 @@ def test_queuemanager_errorhandling(app, queue):  # pylint: disable=unused-argum
     assert 'failed to remove queue directory' in str(pytest_wrapped_e)
 
 
+def test_queuemanager_enqueue(app, queue):  # pylint: disable=unused-argument
+    """test QueueManager enqueue"""
+
+    current_app.config['SNER_HEATMAP_HOT_LEVEL'] = 1
+    SchedulerService.heatmap_put(['127.0.1.0/24'])
+    db.session.commit()
+
+    with patch.object(QueueManager, 'ENQUEUE_CHUNK_SIZE', 2):
+        assert QueueManager.enqueue(queue, (x for x in ['127.0.0.1\n', ' ', 'a,"b"', '127.0.1.1', '127.0.0.1'])) == 4
+    assert Target.query.filter(Target.target == 'a,"b"').one().hashval == 'a,"b"'
+    assert {x.hashval for x in Readynet.query.all()} == {'127.0.0.0/24', 'a,"b"'}
+
+    assert QueueManager.enqueue(queue, ['127.0.0.1', '127.0.0.2', '127.0.0.2'], skip_queued=True) == 1
+    assert Target.query.count() == 5
+    assert QueueManager.enqueue(queue, []) == 0
+
+
+def test_queuemanager_enqueue_staging_exists(app, queue):  # pylint: disable=unused-argument
+    """test QueueManager enqueue with staging table left in current transaction"""
+
+    db.session.execute(f'CREATE TEMPORARY TABLE {ENQUEUE_STAGING.name} (target text NOT NULL, hashval text NOT NULL) ON COMMIT DROP')
+    db.session.execute(f"INSERT INTO {ENQUEUE_STAGING.name} VALUES ('stale', 'stale')")
+
+    assert QueueManager.enqueue(queue, ['127.0.0.1']) == 1
+    assert [x.target for x in Target.query.all()] == ['127.0.0.1']
+
+
+def test_jobmanager_receive_output_error(app, job):  # pylint: disable=unused-argument
+    """test JobManager receive output cleanup on broken stream"""
+
+    class BrokenStream:  # pylint: disable=too-few-public-methods
+        """stream failing in the middle of transfer"""
+
+        def __init__(self):
+            self.chunks = [b'data']
+
+        def read(self, size):  # pylint: disable=unused-argument
+            """read chunk"""
+            if self.chunks:
+                return self.chunks.pop()
+            raise OSError('connection reset')
+
+    with pytest.raises(OSError):
+        JobManager.receive_output(job, BrokenStream(), 'dummy')
+
+    assert not list(Path(job.output_abspath).parent.iterdir())
+
+
+def test_jobmanager_parse_output(app, tmpworkdir):  # pylint: disable=unused-argument
+    """test JobManager parse output opens job output archive once"""
+
+    with ZipFile('output.zip', 'w') as output_zip:
+        output_zip.writestr('assignment.json', json.dumps({'targets': ['192.0.2.1']}))
+
+    with patch.object(sner.lib, 'ZipFile', wraps=ZipFile) as zipfile_mock:
+        pidb = JobManager.parse_output('dummy', 'output.zip')
+
+    assert [x.address for x in pidb.hosts] == ['192.0.2.1']
+    assert zipfile_mock.call_count == 1
+
+    preparsed = ParsedItemsDb()
+    preparsed.upsert_host('192.0.2.2')
+    with ZipFile('output.zip', 'a') as output_zip:
+        output_zip.writestr(PREPARSED_FILENAME, dump_preparsed('dummy', preparsed))
+
+    assert [x.address for x in JobManager.parse_output('dummy', 'output.zip').hosts] == ['192.0.2.2']
+
+
+def test_schedulerservice_lock_critical_sections(app, queue, job_factory, target):  # pylint: disable=unused-argument
+    """test scheduling lock is held until single commit ending each locked operation"""
+
+    engine = create_engine(current_app.config['SQLALCHEMY_DATABASE_URI'])
+    commit = db.session.commit
+    held = []
+
+    def checked_commit():
+        """record if scheduling lock is held by current transaction upon commit"""
+
+        with engine.connect() as conn:
+            held.append(not conn.execute(select(func.pg_try_advisory_xact_lock(SCHEDULER_LOCK_NUMBER))).scalar())
+        commit()
+
+    job_reconcile, job_release = job_factory.create(queue=queue), job_factory.create(queue=queue)
+    operations = [
+        lambda: QueueManager.enqueue(queue, ['127.0.0.1']),
+        lambda: JobManager.reconcile(job_reconcile),
+        lambda: SchedulerService.job_release(job_release),
+        SchedulerService.readynet_recount,
+        SchedulerService.heatmap_check,
+        lambda: QueueManager.flush(queue),
+        lambda: QueueManager.delete(queue),
+    ]
+
+    with patch.object(db.session, 'commit', checked_commit):
+        for operation in operations:
+            held.clear()
+            operation()
+            # single commit under lock ends the critical section, optionally followed by no-op release_lock commit
+            assert (held.count(True) == 1) and (True in held[-2:])
+
+    engine.dispose()
+
+
 def test_schedulerservice_hashval():
     """test heatmap hashval computation"""
 
@@ -98,6 +260,7 @@ def test_schedulerservice_hashval():
     assert SchedulerService.hashval('tcp://[::1]:11') == '::/48'
     assert SchedulerService.hashval('sixenum://2001:db8:aa::1:2:3:11') == '2001:db8:aa::/48'
     assert SchedulerService.hashval('sixenum://2001:db8:bb::1:2:3:0-ffff') == '2001:db8:bb::/48'
+    assert SchedulerService.hashvals(['127.0.0.1', 'udp://[2001:db8:aa::1]:53', 'tcp://url:80']) == ['127.0.0.0/24', '2001:db8:aa::/48', 'url']
 
 
 def test_schedulerservice_readynetupdates(app, queue, target_factory):  # pylint: disable=unused-argument
@@ -148,6 +311,101 @@ def test_schedulerservice_morereadynetupdates(app, queue, target_factory):  # py
     assert Readynet.query.count() == 1
 
 
+def test_schedulerservice_assignbatch(app, queue, target_factory):  # pylint: disable=unused-argument
+    """test scheduler service batch assignment respects heatmap and exclusions"""
+
+    current_app.config['SNER_HEATMAP_HOT_LEVEL'] = 3
+    current_app.config['SNER_EXCLUSIONS'] = [['network', '127.0.0.0/30']]
+    queue.group_size = 10
+
+    for addr in range(8):
+        tmp = str(ip_address(f'127.0.0.{addr}'))
+        target_factory.create(queue=queue, target=tmp, hashval=SchedulerService.hashval(tmp))
+    target_factory.create(queue=queue, target='127.0.1.1', hashval=SchedulerService.hashval('127.0.1.1'))
+    db.session.commit()
+
+    assignment = SchedulerService.job_assign(None, [])
+
+    assert len(assignment['targets']) == 4
+    assert '127.0.1.1' in assignment['targets']
+    assert not {'127.0.0.0', '127.0.0.1', '127.0.0.2', '127.0.0.3'} & set(assignment['targets'])
+    assert Heatmap.query.get('127.0.0.0/24').count == 3
+    assert Heatmap.query.get('127.0.1.0/24').count == 1
+    assert Readynet.query.count() == 0
+    assert SchedulerService.heatmap_check()
+
+
+def test_schedulerservice_assign_stalereadynet(app, queue, target_factory):  # pylint: disable=unused-argument
+    """test scheduler service assignment with stale readynet over lowered hot level"""
+
+    current_app.config['SNER_HEATMAP_HOT_LEVEL'] = 2
+    target_factory.create(queue=queue, target='127.0.0.1', hashval='127.0.0.0/24')
+    SchedulerService.heatmap_put(['127.0.0.0/24'] * 3)
+    db.session.add(Readynet(queue_id=queue.id, hashval='127.0.0.0/24'))
+    db.session.commit()
+
+    assert not SchedulerService.job_assign(None, [])
+    assert Target.query.count() == 1
+
+
+def test_schedulerservice_heatmappop(app, queue, target_factory):  # pylint: disable=unused-argument
+    """test scheduler service batch heatmap decrement"""
+
+    current_app.config['SNER_HEATMAP_HOT_LEVEL'] = 3
+    target_factory.create(queue=queue, target='127.0.0.1', hashval='127.0.0.0/24')
+    SchedulerService.heatmap_put(['127.0.0.0/24'] * 3 + ['127.0.1.0/24'])
+    db.session.commit()
+    assert Readynet.query.count() == 0
+
+    assert SchedulerService.heatmap_pop(['127.0.0.0/24', '127.0.0.0/24', '127.0.1.0/24', '127.0.2.0/24']) == {'127.0.0.0/24': 1, '127.0.1.0/24': 0}
+    assert Readynet.query.one().hashval == '127.0.0.0/24'
+    assert not SchedulerService.heatmap_pop([])
+
+
+def test_schedulerservice_concurrent(app, queue, target_factory):  # pylint: disable=unused-argument
+    """test scheduler service concurrent mode locking"""
+
+    current_app.config['SNER_SCHEDULER_CONCURRENT'] = True
+    current_app.config['SNER_HEATMAP_HOT_LEVEL'] = 3
+    queue.group_size = 10
+
+    for addr in ['127.0.0.1', '127.0.0.2', '127.0.0.3', '127.0.0.4', '127.0.1.1']:
+        target_factory.create(queue=queue, target=addr, hashval=SchedulerService.hashval(addr))
+    db.session.commit()
+
+    with create_engine(current_app.config['SQLALCHEMY_DATABASE_URI']).connect() as conn:
+        # hashval claimed by other assignment is skipped
+        conn.execute(select(func.pg_advisory_lock(SCHEDULER_LOCK_NUMBER, func.hashtext('127.0.0.0/24'))))
+        assignment1 = SchedulerService.job_assign(None, [])
+        assert assignment1['targets'] == ['127.0.1.1']
+
+        conn.execute(select(func.pg_advisory_unlock(SCHEDULER_LOCK_NUMBER, func.hashtext('127.0.0.0/24'))))
+
+        assignment2 = SchedulerService.job_assign(None, [])
+        assert len(assignment2['targets']) == 3
+        assert SchedulerService.heatmap_check()
+
+        # job output waits for claimed hashval
+        conn.execute(select(func.pg_advisory_lock(SCHEDULER_LOCK_NUMBER, func.hashtext('127.0.0.0/24'))))
+        with patch.object(SchedulerService, 'TIMEOUT_JOB_OUTPUT', 1):
+            with pytest.raises(SchedulerServiceBusyException):
+                SchedulerService.job_output(Job.query.get(assignment2['id']), 0, b'')
+        conn.execute(select(func.pg_advisory_unlock(SCHEDULER_LOCK_NUMBER, func.hashtext('127.0.0.0/24'))))
+
+        # maintenance operations exclude concurrent ones
+        conn.execute(select(func.pg_advisory_lock(SCHEDULER_LOCK_NUMBER)))
+        with pytest.raises(SchedulerServiceBusyException):
+            SchedulerService.job_assign(None, [])
+        conn.execute(select(func.pg_advisory_unlock(SCHEDULER_LOCK_NUMBER)))
+
+    with patch.object(SchedulerService, 'HEATMAP_GC_PROBABILITY', 1):
+        SchedulerService.job_output(Job.query.get(assignment1['id']), 0, b'')
+        SchedulerService.job_output(Job.query.get(assignment2['id']), 0, b'')
+    assert Heatmap.query.count() == 0
+    assert Readynet.query.count() == 1
+    assert SchedulerService.heatmap_check()
+
+
 def test_schedulerservice_hashvalprocessing(app, queue, target_factory):  # pylint: disable=unused-argument
     """test scheduler service hashvalsreadynet manipulation"""
 
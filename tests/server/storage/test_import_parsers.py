@@ -56,6 +56,18 @@ def test_import_command_nessus(runner):
     assert len(json.loads(note.data)) == 3
 
 
+def test_import_command_nessus_batches(runner):
+    """test nessus parser batched import"""
+
+    result = runner.invoke(command, ['import', '--batch-size', '1', 'nessus', 'tests/server/data/parser-nessus-simple.xml'])
+    assert result.exit_code == 0
+
+    host = Host.query.one()
+    assert len(host.vulns) == 2
+    assert sorted([x.port for x in host.services]) == [443]
+    assert len(json.loads(Note.query.filter(Note.host == host, Note.xtype == 'hostnames').one().data)) == 3
+
+
 def test_import_command_manymap_job(runner):
     """test manymap parser; zipfile import"""
 
@@ -3,7 +3,26 @@
 test parser api
 """
 
-from sner.server.parser import ParsedItemsDb
+import json
+from datetime import datetime
+from zipfile import ZipFile
+
+import pytest
+
+from sner.lib import ZipArchive
+from sner.server.parser import dump_preparsed, load_preparsed, ParsedItemsDb, ParserBase, PREPARSED_FILENAME
+
+
+class StubParser(ParserBase):  # pylint: disable=too-few-public-methods
+    """parser implementing only mandatory interface"""
+
+    @staticmethod
+    def parse_path(path):
+        """parse path as host address"""
+
+        pidb = ParsedItemsDb()
+        pidb.upsert_host(path)
+        return pidb
 
 
 def test_upsert_host():
@@ -55,3 +74,73 @@ def test_upsert_note():
     assert len(pidb.hosts) == 2
     assert len(pidb.services) == 1
     assert len(pidb.notes) == 2
+
+
+def test_dump_load(tmpworkdir):  # pylint: disable=unused-argument
+    """test pidb serialization and pre-parsed archive member"""
+
+    pidb = ParsedItemsDb()
+    pidb.upsert_host('192.0.2.1', hostnames=['a', 'b'])
+    pidb.upsert_service('192.0.2.1', 'tcp', 22, import_time=datetime(2020, 1, 1, 12, 0))
+    pidb.upsert_vuln('192.0.2.1', 'vuln1', 'testxtype', service_proto='tcp', service_port=22, refs=['ref1'])
+    pidb.upsert_note('192.0.2.2', 'testxtype', data='data1')
+
+    loaded = ParsedItemsDb.load(json.loads(json.dumps(pidb.dump())))
+    for name in ParsedItemsDb.ITEM_TYPES:
+        assert list(getattr(loaded, name)) == list(getattr(pidb, name))
+    assert next(iter(loaded.services)).import_time == datetime(2020, 1, 1, 12, 0)
+
+    with pytest.raises(ValueError):
+        ParsedItemsDb.load({**pidb.dump(), 'version': 0})
+
+    with ZipFile('output.zip', 'w') as output_zip:
+        output_zip.writestr('output', 'data')
+    with ZipArchive('output.zip') as archive:
+        assert load_preparsed(archive, 'dummy') is None
+
+    with ZipFile('output.zip', 'a') as output_zip:
+        output_zip.writestr(PREPARSED_FILENAME, dump_preparsed('dummy', pidb))
+    with ZipArchive('output.zip') as archive:
+        assert len(load_preparsed(archive, 'dummy').hosts) == 2
+        assert load_preparsed(archive, 'nmap') is None
+
+
+def test_items_table():
+    """test parsed items table indexes"""
+
+    pidb = ParsedItemsDb()
+    host1 = pidb.upsert_host('192.0.2.1')
+    host2 = pidb.upsert_host('192.0.2.2')
+    service = pidb.upsert_service('192.0.2.2', 'tcp', 22)
+
+    assert pidb.hosts.by.iid[host2.iid] is host2
+    assert pidb.services.get((host2.iid, 'tcp', 22)) is service
+    assert pidb.hosts.where(address='192.0.2.1') == [host1]
+    assert pidb.hosts.where(address='192.0.2.9') == []
+    assert pidb.hosts.where(iid=host2.iid, address='192.0.2.1') == []
+    assert pidb.services.where(host_iid=host2.iid, proto='tcp', port=22, state=None) == [service]
+    assert pidb.services.where(port=22) == [service]
+    assert pidb.hosts[1] is host2
+
+    pidb.hosts.remove(host1)
+    host3 = pidb.upsert_host('192.0.2.3')
+    assert host3.iid not in (host1.iid, host2.iid)
+    assert [x.address for x in pidb.hosts] == ['192.0.2.2', '192.0.2.3']
+    assert pidb.hosts[-1] is host3
+    assert pidb.upsert_host('192.0.2.1').iid != host1.iid
+
+
+def test_parser_base_batches():
+    """test default batched parsing yields single batch"""
+
+    assert [[x.address for x in pidb.hosts] for pidb in StubParser.parse_path_batches('192.0.2.1', 1)] == [['192.0.2.1']]
+
+
+def test_parser_base_archive(tmpworkdir):  # pylint: disable=unused-argument
+    """test default archive parsing parses archive path"""
+
+    with ZipFile('output.zip', 'w') as output_zip:
+        output_zip.writestr('output', 'data')
+
+    with ZipArchive('output.zip') as archive:
+        assert [x.address for x in StubParser.parse_archive(archive).hosts] == ['output.zip']